@@ -8,53 +8,88 @@
 # Title: Generic LoRa Decoder
 # GNU Radio version: 3.10.12.0
 
-from PyQt5 import Qt, QtCore, QtWidgets
-from gnuradio import qtgui
+# Headless runtime: this module must never import PyQt5. The Qt variant lives
+# in Generic_Decoder_GUI.py and is only loaded when --gui is requested.
 from gnuradio import blocks, gr
-from gnuradio import gr
-from gnuradio.filter import firdes
-from gnuradio.fft import window
 import sys
 import signal
-from argparse import ArgumentParser
+from argparse import ArgumentParser, ArgumentTypeError
 from gnuradio.eng_arg import eng_float, intx
 from gnuradio import eng_notation
-import gnuradio.lora_sdr as lora_sdr
 import threading
+import time
 import os
 from gnuradio import soapy
 
+from frame_tagger import frame_tagger
+from lora_rx_chain import lora_rx_chain
+from lora_channelizer import lora_channelizer
+from activity_gate import GATE_MODES, activity_gate
+from iq_recorder import RECORD_MODES, RECORD_TRIGGERS, iq_recorder
+from stream_format import STREAM_FORMAT_CHOICES, STREAM_FORMATS, make_converter, native_stream_format
+from iq_file_source import FORMATS, iq_file_source, recording_sample_rate
+from packet_sink import OUTPUT_FORMATS, packet_sink
+from frame_publisher import DROP_POLICIES, frame_publisher
+from frame_store import frame_store
+from telemetry import PERF_COUNTERS_ENV, FlowgraphTelemetry
+from latency_trace import LatencyTracker, SampleClock
+from tuning import PROFILES, apply_profile, load_profile, tune_branch, tune_front_end
+from control_server import ControlServer
+from load_shedder import SHED_LIMITS, LoadShedder
+from source_watchdog import SourceWatchdog
 
-class Generic_Decoder(gr.top_block, Qt.QWidget):
-    def __init__(self, sdr_dev_string="", samp_rate=1024000.000000, center_freq=412e6, gain=20):
-        gr.top_block.__init__(self, "Not titled yet", catch_exceptions=True)
-        Qt.QWidget.__init__(self)
-        self.setWindowTitle("Not titled yet")
-        qtgui.util.check_set_qss()
-        try:
-            self.setWindowIcon(Qt.QIcon.fromTheme('gnuradio-grc'))
-        except BaseException as exc:
-            print(f"Qt GUI: Could not set Icon: {str(exc)}", file=sys.stderr)
-        self.top_scroll_layout = Qt.QVBoxLayout()
-        self.setLayout(self.top_scroll_layout)
-        self.top_scroll = Qt.QScrollArea()
-        self.top_scroll.setFrameStyle(Qt.QFrame.NoFrame)
-        self.top_scroll_layout.addWidget(self.top_scroll)
-        self.top_scroll.setWidgetResizable(True)
-        self.top_widget = Qt.QWidget()
-        self.top_scroll.setWidget(self.top_widget)
-        self.top_layout = Qt.QVBoxLayout(self.top_widget)
-        self.top_grid_layout = Qt.QGridLayout()
-        self.top_layout.addLayout(self.top_grid_layout)
-
-        self.settings = Qt.QSettings("gnuradio/flowgraphs", "Generic_Decoder")
 
-        try:
-            geometry = self.settings.value("geometry")
-            if geometry:
-                self.restoreGeometry(geometry)
-        except BaseException as exc:
-            print(f"Qt GUI: Could not restore geometry: {str(exc)}", file=sys.stderr)
+def make_lora_rx(samp_rate, sf, bw=125000, cr=1, sync_word=0x12, soft_decoding=True, print_rx=False):
+    """Builds one lora_rx demodulation chain (reporting CRC results) with the parameters Generic_Decoder uses."""
+    return lora_rx_chain(
+        bw=bw,
+        cr=cr,
+        has_crc=True,
+        impl_head=False,
+        pay_len=255,
+        samp_rate=int(samp_rate),
+        sf=sf,
+        sync_word=[sync_word],
+        soft_decoding=soft_decoding,
+        ldro_mode=2,
+        print_rx=[print_rx, print_rx]
+    )
+
+
+class RxBranch:
+    """One lora_rx chain fed from the shared sample stream, plus the tagger that labels its frames."""
+    def __init__(self, index, rx, tagger, upstream, samp_rate, rx_params, channel=0, freq=None, gate=None):
+        self.index = index
+        self.rx = rx
+        self.tagger = tagger
+        self.upstream = upstream  # (block, port) feeding this branch
+        self.gate = gate  # activity_gate in front of the branch, if any
+        self.samp_rate = samp_rate
+        self.rx_params = rx_params  # make_lora_rx keyword arguments the rx was built with
+        self.channel = channel
+        self.freq = freq
+        self.enabled = True  # False while load shedding has the rx disconnected
+
+    @property
+    def sf(self):
+        return self.rx_params["sf"]
+
+
+class Generic_Decoder(gr.top_block):
+    def __init__(self, sdr_dev_string="", samp_rate=1024000.000000, center_freq=412e6, gain=20,
+                 spreading_factors=(7,), channel_offsets=None, channel_spacing=200e3, channel_os_factor=2,
+                 input_file=None, input_format=None, throttle=False, input_start=0, input_count=None,
+                 print_rx=False, output="-", output_format="jsonl", rotate_bytes=None, rotate_seconds=None,
+                 publish=None, publish_queue=1024, publish_policy="drop-oldest", telemetry_port=None,
+                 control_address=None, activity_gate_mode=None, stream_format="auto",
+                 record_dir=None, record_mode="continuous", record_rotate_seconds=300.0, record_max_bytes=None,
+                 record_trigger="all", record_pre_seconds=1.0, record_post_seconds=0.5,
+                 store=None, store_device=None, store_dedupe_window=2.0, tuning_profile=None,
+                 latency_trace=False, load_shed=None, source_watchdog=False):
+        if telemetry_port or load_shed:
+            # Must be set before the scheduler starts for the counters to be kept
+            os.environ[PERF_COUNTERS_ENV] = "True"
+        gr.top_block.__init__(self, "Generic LoRa Decoder", catch_exceptions=True)
         self.flowgraph_started = threading.Event()
 
         ##################################################
@@ -64,111 +99,730 @@ class Generic_Decoder(gr.top_block, Qt.QWidget):
         self.center_freq = center_freq
         self.gain = gain
         self.sdr_dev_string = sdr_dev_string
+        # SDR wire format (see stream_format.py); 'auto' uses the device's native one
+        self.stream_format = stream_format
+        self.stream_full_scale = None
 
-        # LoRa specific parameters (fixed for this decoder)
+        # Replay mode: read IQ from a recording instead of the SDR
+        self.input_file = input_file
+        self.input_format = input_format
+        self.throttle = throttle
+
+        # LoRa specific parameters (fixed for this decoder, except the SF set)
         self.lora_bw = 125000
-        self.lora_sf = 7
+        self.lora_sfs = sorted(set(int(sf) for sf in spreading_factors))
+        self.lora_sf = self.lora_sfs[0]
         self.lora_cr = 1
         self.lora_sync_word = 0x12
+        # lora_rx console printing runs in the scheduler threads, so it is
+        # opt-in; decoded frames go to packet_sink instead.
+        self.print_rx = print_rx
+        self.output = output
+
+        # Wideband mode: split the capture into one LoRa channel per offset (Hz
+        # relative to center_freq). Without offsets the stream is one channel.
+        self.channel_offsets = list(channel_offsets or [])
+        self.channel_spacing = channel_spacing
+        self.channel_os_factor = channel_os_factor
+
+        # Optional pre-detection per channel: lora_rx only sees stretches with
+        # likely LoRa activity (mode: one of activity_gate.GATE_MODES)
+        self.activity_gate_mode = activity_gate_mode
 
         ##################################################
         # Blocks
         ##################################################
 
+        self.stream_converter_0 = None
+        self.iq_recorder_0 = None
+        self.soapy_custom_source_0 = None
+        self.standby_source_0 = None  # zeros at the sample rate while the SDR is reopened
+        self.standby_null_0 = None
+        self.source_samples_base = 0  # samples delivered by the sources swapped out so far
+        if self.input_file and record_dir:
+            raise ValueError("IQ recording taps the SDR source; there is nothing to record when replaying a file")
+        if self.input_file and source_watchdog:
+            raise ValueError("The source watchdog reopens the SDR; it has nothing to do when replaying a file")
+        if self.input_file:
+            print(f"Replaying IQ recording: '{self.input_file}'")
+            self.iq_file_source_0 = iq_file_source(self.input_file, self.input_format,
+                                                   start=input_start, count=input_count)
+            self.source = self.iq_file_source_0
+            if self.throttle:
+                self.blocks_throttle_0 = blocks.throttle(gr.sizeof_gr_complex, self.samp_rate, True)
+                self.source = self.blocks_throttle_0
+        else:
+            self.soapy_custom_source_0 = self._open_sdr_source()
+            self.source = self.soapy_custom_source_0
+            # Compact samples are widened to gr_complex once, before the fan-out;
+            # the source buffer itself stays in the wire format.
+            self.stream_converter_0 = make_converter(self.stream_format, self.stream_full_scale)
+            if self.stream_converter_0 is not None:
+                self.source = self.stream_converter_0
+            # Raw capture next to decoding, in the wire format (so cs8 stays 2 bytes/sample on disk)
+            if record_dir:
+                self.iq_recorder_0 = iq_recorder(
+                    record_dir, self.stream_format, self.samp_rate, self.center_freq, mode=record_mode,
+                    rotate_seconds=record_rotate_seconds, max_bytes=record_max_bytes, trigger=record_trigger,
+                    pre_seconds=record_pre_seconds, post_seconds=record_post_seconds)
+
+        # Channel front-end: (upstream endpoint, sample rate, channel ID, frequency)
+        # for every LoRa channel the RX branches listen on.
+        if self.channel_offsets:
+            self.lora_channelizer_0 = lora_channelizer(
+                self.samp_rate, self.channel_offsets,
+                channel_spacing=self.channel_spacing,
+                lora_bw=self.lora_bw,
+                os_factor=self.channel_os_factor
+            )
+            rx_inputs = [((self.lora_channelizer_0, channel), self.lora_channelizer_0.channel_rate,
+                          channel, self.center_freq + offset)
+                         for channel, offset in enumerate(self.channel_offsets)]
+        else:
+            rx_inputs = [((self.source, 0), self.samp_rate, 0, self.center_freq)]
+
+        # Activity gates: one per channel, shared by that channel's branches
+        self.activity_gates = {}
+        if self.activity_gate_mode:
+            gated_inputs = []
+            for upstream, rx_rate, channel, freq in rx_inputs:
+                gate = activity_gate(rx_rate, self.lora_sfs, self.lora_bw, self.activity_gate_mode)
+                setattr(self, f"activity_gate_{channel}", gate)
+                self.activity_gates[channel] = (upstream, gate)
+                gated_inputs.append(((gate, 0), rx_rate, channel, freq))
+            rx_inputs = gated_inputs
+
+        # LoRa RX blocks: one lora_rx per channel and spreading factor. The first
+        # branch keeps the historical lora_rx_0 name.
+        self.lora_rx_branches = []
+        for upstream, rx_rate, channel, freq in rx_inputs:
+            gate = self.activity_gates[channel][1] if self.activity_gates else None
+            for sf in self.lora_sfs:
+                index = len(self.lora_rx_branches)
+                rx_params = dict(sf=sf, bw=self.lora_bw, cr=self.lora_cr,
+                                 sync_word=self.lora_sync_word, print_rx=self.print_rx)
+                rx = make_lora_rx(rx_rate, **rx_params)
+                tagger = frame_tagger(sf=sf, bw=self.lora_bw, cr=self.lora_cr, channel=channel, freq=freq,
+                                      samp_rate=rx_rate)
+                setattr(self, f"lora_rx_{index}", rx)
+                setattr(self, f"frame_tagger_{index}", tagger)
+                branch = RxBranch(index, rx, tagger, upstream, rx_rate, rx_params, channel, freq, gate)
+                tagger.clock = self._sample_clock(branch, base=0)
+                self.lora_rx_branches.append(branch)
+
+        # Structured frame output, written off the scheduler threads. With
+        # output=None nothing is written (callers attach their own sinks).
+        self.packet_sink_0 = None
+        if self.output is not None:
+            self.packet_sink_0 = packet_sink(self.output, output_format,
+                                             max_bytes=rotate_bytes, max_seconds=rotate_seconds)
+
+        # Persistent, indexed frame store (SQLite), also written off the scheduler threads
+        self.frame_store_0 = None
+        if store:
+            device = store_device or self.sdr_dev_string or os.path.basename(self.input_file or "")
+            self.frame_store_0 = frame_store(store, device=device or None, dedupe_window=store_dedupe_window)
+
+        # Local publishing to network consumers, one bounded queue per destination
+        self.frame_publisher_0 = None
+        if publish:
+            self.frame_publisher_0 = frame_publisher(publish, queue_size=publish_queue, policy=publish_policy)
+
+
+        ##################################################
+        # Connections
+        ##################################################
+        if self.input_file and self.throttle:
+            self.connect((self.iq_file_source_0, 0), (self.blocks_throttle_0, 0))
+        if self.stream_converter_0 is not None:
+            self.connect((self.soapy_custom_source_0, 0), (self.stream_converter_0, 0))
+        if self.iq_recorder_0 is not None:
+            self.connect((self.soapy_custom_source_0, 0), (self.iq_recorder_0, 0))
+        if self.channel_offsets:
+            self.connect((self.source, 0), (self.lora_channelizer_0, 0))
+        for upstream, gate in self.activity_gates.values():
+            self.connect(upstream, (gate, 0))
+        # Branches on the same channel read the same output buffer: GNU Radio
+        # gives each downstream block its own read pointer, so the fan-out
+        # copies nothing.
+        for branch in self.lora_rx_branches:
+            self.connect(branch.upstream, (branch.rx, 0))
+            self.msg_connect((branch.rx, 'out'), (branch.tagger, 'in'))
+            if self.packet_sink_0 is not None:
+                self.msg_connect((branch.tagger, 'out'), (self.packet_sink_0, 'in'))
+            if self.frame_publisher_0 is not None:
+                self.msg_connect((branch.tagger, 'out'), (self.frame_publisher_0, 'in'))
+            if self.iq_recorder_0 is not None:
+                self.msg_connect((branch.tagger, 'out'), (self.iq_recorder_0, 'frames'))
+            if self.frame_store_0 is not None:
+                self.msg_connect((branch.tagger, 'out'), (self.frame_store_0, 'in'))
+
+        # The block that paces the stream: its item count is the sample clock
+        if not self.input_file:
+            self.paced_source = self.soapy_custom_source_0
+        else:
+            self.paced_source = self.blocks_throttle_0 if self.throttle else self.iq_file_source_0
+        # Branches are rebuilt or dropped by the control server and the load
+        # shedder, one change at a time
+        self.reconfigure_lock = threading.RLock()
+        self.idle_sinks = {}  # upstream -> null sink, while no enabled branch reads it
+
+        # Per-frame latency tracing (see latency_trace.py): the clock follows the
+        # paced source, so sample indices map to delivery times
+        self.sample_clock = None
+        self.latency_tracker = None
+        if latency_trace:
+            self.sample_clock = SampleClock(self.paced_source, self.samp_rate)
+            self.latency_tracker = LatencyTracker(self.sample_clock)
+            for branch in self.lora_rx_branches:
+                branch.tagger.tracker = self.latency_tracker
+            for sink in (self.packet_sink_0, self.frame_store_0):
+                if sink is not None:
+                    sink.tracker = self.latency_tracker
+            if self.frame_publisher_0 is not None:
+                self.frame_publisher_0.set_tracker(self.latency_tracker)
+
+        # Scheduler/buffer tuning (see tuning.py): a profile name, 'auto', a file or a settings dict
+        self.tuning = dict(tuning_profile) if isinstance(tuning_profile, dict) else load_profile(tuning_profile)
+        if self.tuning:
+            apply_profile(self, self.tuning)
+
+        self.telemetry = FlowgraphTelemetry(self, port=telemetry_port) if telemetry_port else None
+        self.control = ControlServer(self, control_address) if control_address else None
+        # Steps down (print_rx off, hard decoding, fewer branches) when falling behind real time
+        self.load_shedder = None
+        if load_shed:
+            if self.input_file and not self.throttle:
+                raise ValueError("Load shedding needs a real-time stream: the SDR or a replay with --throttle")
+            self.load_shedder = LoadShedder(self, limit=load_shed)
+        # Reopens the SDR in place when it stalls or drops off the bus
+        self.source_watchdog = SourceWatchdog(self) if source_watchdog else None
+
+    def start(self, *args):
+        if not args and self.tuning.get("max_noutput_items"):
+            args = (self.tuning["max_noutput_items"],)
+        gr.top_block.start(self, *args)
+        if self.sample_clock is not None:
+            self.sample_clock.start()
+        if self.telemetry is not None:
+            self.telemetry.start()
+        if self.control is not None:
+            self.control.start()
+        if self.load_shedder is not None:
+            self.load_shedder.start()
+        if self.source_watchdog is not None:
+            self.source_watchdog.start()
+
+    def run(self, *args):
+        # gr.top_block.run() starts the flowgraph through gr.top_block.start()
+        # with its own max_noutput_items default, which would skip the profile's
+        self.start(*args)
+        self.wait()
+
+    def stop(self):
+        if self.source_watchdog is not None:
+            self.source_watchdog.stop()
+        if self.load_shedder is not None:
+            self.load_shedder.stop()
+        if self.control is not None:
+            self.control.stop()
+        if self.telemetry is not None:
+            self.telemetry.stop()
+        if self.sample_clock is not None:
+            self.sample_clock.stop()
+        gr.top_block.stop(self)
+
+    def set_center_freq(self, center_freq):
+        """Retunes the SDR in place; channel frequencies follow the new center."""
+        if self.input_file:
+            raise ValueError("Cannot retune a replayed recording")
+        self.center_freq = center_freq
+        # While the SDR is being reopened the new frequency applies when it is back
+        if self.soapy_custom_source_0 is not None:
+            self.soapy_custom_source_0.set_frequency(0, self.center_freq)
+        for branch in self.lora_rx_branches:
+            offset = self.channel_offsets[branch.channel] if self.channel_offsets else 0
+            branch.freq = self.center_freq + offset
+            branch.tagger.metadata["freq"] = float(branch.freq)
+
+    def set_gain(self, gain):
+        if self.input_file:
+            raise ValueError("Cannot change the gain of a replayed recording")
+        self.gain = gain
+        if self.soapy_custom_source_0 is not None:
+            self.soapy_custom_source_0.set_gain(0, self.gain)
+
+    def reconfigure_branches(self, branches=None, **changes):
+        """
+        Rebuilds the lora_rx of the given branch indices (all by default) with
+        changed make_lora_rx parameters (sf, bw, cr, sync_word, soft_decoding,
+        print_rx). Only those branches are swapped, inside one lock/unlock, so
+        the source, the other branches and the sinks keep running. If a
+        rebuild fails, every branch goes back to its previous parameters.
+        """
+        if branches is not None and any(not 0 <= i < len(self.lora_rx_branches) for i in branches):
+            raise ValueError(f"Branch indices must be between 0 and {len(self.lora_rx_branches) - 1}")
+        targets = self.lora_rx_branches if branches is None else [self.lora_rx_branches[i] for i in branches]
+        if "sf" in changes and not 5 <= changes["sf"] <= 12:
+            raise ValueError(f"Spreading factor must be between 5 and 12, not {changes['sf']}")
+        if "cr" in changes and not 1 <= changes["cr"] <= 4:
+            raise ValueError(f"Coding rate must be between 1 (4/5) and 4 (4/8), not {changes['cr']}")
+        if "sync_word" in changes and not 0 <= changes["sync_word"] <= 0xFF:
+            raise ValueError(f"Sync word must be a single byte (0x00-0xFF), not {changes['sync_word']}")
+        if "bw" in changes:
+            if self.channel_offsets:
+                raise ValueError("The bandwidth is fixed in wideband mode (the channel filters are built for it)")
+            for branch in targets:
+                if branch.samp_rate % changes["bw"]:
+                    raise ValueError(f"Sample rate {branch.samp_rate} is not a multiple of bandwidth {changes['bw']}")
+
+        with self.reconfigure_lock:
+            self.lock()
+            previous = []  # (branch, rx_params, tagger metadata) before the change
+            detached = None  # branch whose old rx is disconnected and new one not yet connected
+            try:
+                try:
+                    for branch in targets:
+                        previous.append((branch, branch.rx_params, dict(branch.tagger.metadata)))
+                        branch.rx_params = dict(branch.rx_params, **changes)
+                        branch.tagger.metadata.update(sf=int(branch.sf), bw=int(branch.rx_params["bw"]),
+                                                      cr=int(branch.rx_params["cr"]))
+                        # A disabled branch gets the new parameters when it is enabled again
+                        if branch.enabled:
+                            self._detach_branch(branch)
+                            detached = branch
+                            self._attach_branch(branch)
+                            detached = None
+                    self._update_gates(changes.get("bw"))
+                except Exception:
+                    self._restore_branches(previous, detached, "bw" in changes)
+                    raise
+            finally:
+                self.unlock()
+            self.lora_sfs = sorted(set(branch.sf for branch in self.lora_rx_branches))
+
+    def _restore_branches(self, previous, detached, bw_changed):
+        """Rebuilds branches with the rx_params they had before a failed reconfigure (flowgraph locked)."""
+        for branch, rx_params, metadata in reversed(previous):
+            branch.rx_params = rx_params
+            branch.tagger.metadata = metadata
+            if branch.enabled:
+                if branch is not detached:
+                    self._detach_branch(branch)
+                self._attach_branch(branch)
+        if previous:
+            self._update_gates(previous[0][1]["bw"] if bw_changed else None)
+
+    def set_branches_enabled(self, branches, enabled):
+        """
+        Disconnects the lora_rx of the given branch indices from the stream, or
+        rebuilds and reconnects it (with fresh state) when enabled again. The
+        tagger and the sinks stay in place.
+        """
+        with self.reconfigure_lock:
+            targets = [self.lora_rx_branches[i] for i in branches if self.lora_rx_branches[i].enabled != enabled]
+            if not targets:
+                return
+            self.lock()
+            try:
+                for branch in targets:
+                    if enabled:
+                        self._attach_branch(branch)
+                    else:
+                        self._detach_branch(branch)
+                    branch.enabled = enabled
+                self._update_idle_sinks()
+                self._update_gates()
+            finally:
+                self.unlock()
+
+    def _attach_branch(self, branch):
+        """Builds a new lora_rx from branch.rx_params and connects it (flowgraph locked)."""
+        rx = make_lora_rx(branch.samp_rate, **branch.rx_params)
+        self.connect(branch.upstream, (rx, 0))
+        self.msg_connect((rx, 'out'), (branch.tagger, 'in'))
+        branch.rx = rx
+        tune_branch(self, branch, self.tuning)
+        setattr(self, f"lora_rx_{branch.index}", rx)
+        branch.tagger.clock = self._sample_clock(branch)
+
+    def _detach_branch(self, branch):
+        self.disconnect(branch.upstream, (branch.rx, 0))
+        self.msg_disconnect((branch.rx, 'out'), (branch.tagger, 'in'))
+
+    def _update_idle_sinks(self):
+        """Keeps an upstream output that no enabled branch reads connected to a null sink (flowgraph locked)."""
+        upstreams = {}
+        for branch in self.lora_rx_branches:
+            key = (id(branch.upstream[0]), branch.upstream[1])
+            used = upstreams.get(key, (branch.upstream, False))[1]
+            upstreams[key] = (branch.upstream, used or branch.enabled)
+        for key, (upstream, used) in upstreams.items():
+            if not used and key not in self.idle_sinks:
+                self.idle_sinks[key] = blocks.null_sink(gr.sizeof_gr_complex)
+                self.connect(upstream, (self.idle_sinks[key], 0))
+            elif used and key in self.idle_sinks:
+                self.disconnect(upstream, (self.idle_sinks.pop(key), 0))
+
+    def _update_gates(self, bw=None):
+        """A gate's chunk size and dechirp references follow its channel's enabled SFs."""
+        for channel, (_, gate) in self.activity_gates.items():
+            sfs = [branch.sf for branch in self.lora_rx_branches if branch.channel == channel and branch.enabled]
+            if sfs:
+                gate.set_spreading_factors(sfs, bw)
+
+    def reopen_sdr_source(self, sdr_dev_string=None):
+        """Opens a new Soapy source (sdr_dev_string, else the current one) with the current settings."""
+        if sdr_dev_string:
+            self.sdr_dev_string = sdr_dev_string
+        source = self._open_sdr_source()
+        tune_front_end(self, source, self.samp_rate, self.tuning)
+        return source
+
+    def swap_sdr_source(self, source):
+        """
+        Puts source in place of the block now feeding the front end (the SDR
+        source, or the standby stream), inside one lock/unlock. With source
+        None a standby stream of zeros at the sample rate takes over, so the
+        old device is released while lora_rx, the taggers and the sinks keep
+        running.
+        """
+        with self.reconfigure_lock:
+            feeding = self.soapy_custom_source_0 if self.soapy_custom_source_0 is not None else self.standby_source_0
+            standby_null = None
+            if source is None:
+                itemsize = STREAM_FORMATS[self.stream_format][1]
+                standby_null = blocks.null_source(itemsize)
+                replacement = blocks.throttle(itemsize, self.samp_rate, True)
+            else:
+                replacement = source
+            self.lock()
+            try:
+                try:
+                    delivered = feeding.nitems_written(0)
+                except (AttributeError, RuntimeError):
+                    delivered = 0
+                if self.telemetry is not None and feeding is self.soapy_custom_source_0:
+                    self.telemetry.source_swapped(feeding, delivered)
+                for consumer in self._source_consumers(feeding):
+                    self.disconnect((feeding, 0), consumer)
+                    self.connect((replacement, 0), consumer)
+                if feeding is self.standby_source_0:
+                    self.disconnect((self.standby_null_0, 0), (feeding, 0))
+                if standby_null is not None:
+                    self.connect((standby_null, 0), (replacement, 0))
+                self._replace_source_refs(feeding, replacement, delivered)
+                self.standby_null_0 = standby_null
+                self.standby_source_0 = replacement if source is None else None
+                self.soapy_custom_source_0 = source
+                # Branches reading the source directly got new input buffers, counted from 0
+                for branch in self.lora_rx_branches:
+                    if branch.upstream[0] is replacement:
+                        branch.tagger.clock = self._sample_clock(branch, base=self.source_samples_base)
+                if self.iq_recorder_0 is not None:
+                    # The standby zeros are not IQ worth keeping
+                    self.iq_recorder_0.set_paused(source is None)
+            finally:
+                self.unlock()
+
+    def _source_consumers(self, feeding):
+        """Input endpoints connected to the output of feeding, the block at the head of the stream."""
+        consumers = [(block, 0) for block in (self.stream_converter_0, self.iq_recorder_0) if block is not None]
+        if self.stream_converter_0 is not None:
+            return consumers
+        # cf32: the source feeds the channelizer, the gates or the branches directly
+        if self.channel_offsets:
+            return consumers + [(self.lora_channelizer_0, 0)]
+        if self.activity_gates:
+            return consumers + [(gate, 0) for _, gate in self.activity_gates.values()]
+        consumers += [(branch.rx, 0) for branch in self.lora_rx_branches if branch.enabled]
+        idle = self.idle_sinks.get((id(feeding), 0))
+        return consumers + ([(idle, 0)] if idle is not None else [])
+
+    def _replace_source_refs(self, old, new, delivered):
+        if self.source is old:
+            self.source = new
+        for branch in self.lora_rx_branches:
+            if branch.upstream[0] is old:
+                branch.upstream = (new, branch.upstream[1])
+        for channel, (upstream, gate) in list(self.activity_gates.items()):
+            if upstream[0] is old:
+                self.activity_gates[channel] = ((new, upstream[1]), gate)
+        if (id(old), 0) in self.idle_sinks:
+            self.idle_sinks[(id(new), 0)] = self.idle_sinks.pop((id(old), 0))
+        self.source_samples_base += delivered
+        self.paced_source = new
+        if self.sample_clock is not None:
+            self.sample_clock.follow(new, self.source_samples_base)
+
+    def _open_sdr_source(self):
+        """Opens and configures the Soapy source for sdr_dev_string."""
         # Soapy Custom Source block - uses the dynamically passed sdr_dev_string
         stream_args = '' # Common stream arg, can be made dynamic too
         tune_args = ['']
         settings = ['']
-        print(f"Attempting to open SDR with device string: '{self.sdr_dev_string}'")
-        self.soapy_custom_source_0 = soapy.source(self.sdr_dev_string, "fc32", 1, '',
-                                  stream_args, tune_args, settings)
+        if self.stream_format == "auto":
+            self.stream_format, self.stream_full_scale = native_stream_format(self.sdr_dev_string)
+        print(f"Attempting to open SDR with device string: '{self.sdr_dev_string}' "
+              f"(stream format {self.stream_format})")
+        source = soapy.source(self.sdr_dev_string, STREAM_FORMATS[self.stream_format][0], 1, '',
+                              stream_args, tune_args, settings)
 
-        self.soapy_custom_source_0.set_sample_rate(0, self.samp_rate)
-        self.soapy_custom_source_0.set_frequency(0, self.center_freq)
-        self.soapy_custom_source_0.set_frequency_correction(0, 0) 
-        self.soapy_custom_source_0.set_iq_balance(0, 0)
+        source.set_sample_rate(0, self.samp_rate)
+        source.set_frequency(0, self.center_freq)
+        source.set_frequency_correction(0, 0)
+        source.set_iq_balance(0, 0)
 
         try:
-            self.soapy_custom_source_0.set_dc_offset_mode(0, False) 
+            source.set_dc_offset_mode(0, False)
         except ValueError as e:
             print(f"[WARN] SDR does not support automatic DC offset mode: {e}. Keeping it off.", file=sys.stderr)
         try:
-            self.soapy_custom_source_0.set_gain(0, self.gain)
+            source.set_gain(0, self.gain)
         except Exception as e:
             print(f"[WARN] Could not set gain to {self.gain} dB: {e}", file=sys.stderr)
+        return source
 
+    def _stream_position(self, upstream):
+        """Items the upstream endpoint has written since the start, counting on across SDR source swaps."""
+        block, port = upstream
+        count = block.nitems_written(port)
+        if block is self.soapy_custom_source_0 or block is self.standby_source_0:
+            count += self.source_samples_base
+        return count
 
-        # LoRa RX block
-        self.lora_rx_0 = lora_sdr.lora_sdr_lora_rx(
-            bw=self.lora_bw,
-            cr=self.lora_cr,
-            has_crc=True,
-            impl_head=False,
-            pay_len=255,
-            samp_rate=int(self.samp_rate),
-            sf=self.lora_sf,
-            sync_word=[self.lora_sync_word],
-            soft_decoding=True,
-            ldro_mode=2,
-            print_rx=[True,True]
-        )
-        self.blocks_message_debug_0 = blocks.message_debug(True)
+    def _sample_clock(self, branch, base=None):
+        """
+        Callable mapping a sample index of the branch's frame_sync input to the
+        source sample index. Without an index it returns how many source
+        samples the demodulator has consumed, which locates a frame's end to
+        within the scheduler's buffering when read as the frame comes out.
 
+        Called whenever the branch's rx input is (re)connected: a new input
+        buffer counts from 0, so the upstream's position at that moment (base,
+        when the upstream has not run yet) is added to frame_sync's counter.
+        """
+        frame_sync = getattr(branch.rx, "lora_sdr_frame_sync_0", None)
+        if frame_sync is None:
+            return None
+        ratio = self.samp_rate / branch.samp_rate
+        if base is None:
+            base = self._stream_position(branch.upstream)
+        if branch.gate is not None:
+            # Gated branches see fewer samples than the channel carries
+            gate = branch.gate
+            position = lambda index: gate.source_index(base + index)
+        else:
+            position = lambda index: base + index
 
-        ##################################################
-        # Connections
-        ##################################################
-        self.msg_connect((self.lora_rx_0, 'out'), (self.blocks_message_debug_0, 'print'))
-        self.connect((self.soapy_custom_source_0, 0), (self.lora_rx_0, 0))
+        def clock(index=None):
+            return int(position(frame_sync.nitems_read(0) if index is None else index) * ratio)
+        return clock
 
+    def frames_decoded(self):
+        """Total frames published by all RX branches so far."""
+        return sum(branch.tagger.frame_count for branch in self.lora_rx_branches)
+
+    def replay_report(self, elapsed):
+        """Throughput summary for a replay that ran for elapsed wall-clock seconds."""
+        source = self.iq_file_source_0
+        frames = self.frames_decoded()
+        return {
+            "samples": source.samples_produced,
+            "frames": frames,
+            "elapsed_s": elapsed,
+            "samples_per_s": source.samples_produced / elapsed if elapsed else 0.0,
+            "packets_per_s": frames / elapsed if elapsed else 0.0,
+        }
+
+
+def sf_list(value):
+    """Parses a comma separated spreading factor set such as '7,8,9'."""
+    try:
+        sfs = [int(sf) for sf in value.split(",") if sf.strip()]
+    except ValueError:
+        raise ArgumentTypeError(f"invalid spreading factor list: '{value}'")
+    if not sfs or any(sf < 5 or sf > 12 for sf in sfs):
+        raise ArgumentTypeError(f"spreading factors must be between 5 and 12: '{value}'")
+    return sfs
 
-    def closeEvent(self, event):
-        self.settings = Qt.QSettings("gnuradio/flowgraphs", "Generic_Decoder")
-        self.settings.setValue("geometry", self.saveGeometry())
-        self.stop()
-        self.wait()
-        event.accept()
 
+def offset_list(value):
+    """Parses a comma separated list of frequency offsets such as '-300e3,-100e3,100e3,300e3'."""
+    try:
+        return [eng_notation.str_to_num(offset.strip()) for offset in value.split(",") if offset.strip()]
+    except ValueError:
+        raise ArgumentTypeError(f"invalid channel offset list: '{value}'")
 
-def main(top_block_cls=Generic_Decoder):
+
+def argument_parser():
     parser = ArgumentParser(description="Generic LoRa Demodulator using SoapySDR")
-    parser.add_argument("--sdr-dev-string", type=str, required=True,
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--sdr-dev-string", type=str,
                         help="SoapySDR device string (e.g., 'driver=rtlsdr', 'driver=uhd,serial=XXXX')")
-    parser.add_argument("--sample-rate", type=eng_float, default=125e3,
-                        help="SDR Sample Rate in Hz (default: 125e3)")
+    source.add_argument("--input-file", type=str,
+                        help="Replay a raw (cf32/cs16/cs8/cu8) or SigMF IQ recording instead of using an SDR")
+    parser.add_argument("--input-format", choices=sorted(FORMATS), default=None,
+                        help="Sample format of a raw --input-file (default: from the file extension, else cf32)")
+    parser.add_argument("--throttle", action="store_true",
+                        help="Replay --input-file at real time instead of as fast as possible")
+    parser.add_argument("--sample-rate", type=eng_float, default=None,
+                        help="SDR Sample Rate in Hz (default: 125e3, or the SigMF sample rate when replaying)")
     parser.add_argument("--center-freq", type=eng_float, default=412e6,
                         help="SDR Center Frequency in Hz (default: 412e6)")
     parser.add_argument("--gain", type=eng_float, default=20,
                         help="SDR Gain in dB (default: 20)")
-    args = parser.parse_args()
+    parser.add_argument("--spreading-factors", type=sf_list, default=[7],
+                        help="Comma separated SFs decoded in parallel from the same stream (default: 7)")
+    parser.add_argument("--channel-offsets", type=offset_list, default=None,
+                        help="Wideband mode: comma separated channel offsets in Hz from the center "
+                             "frequency, split out with a polyphase channelizer (default: off)")
+    parser.add_argument("--channel-spacing", type=eng_float, default=200e3,
+                        help="Channelizer bin spacing in Hz; the sample rate must be a multiple of it (default: 200e3)")
+    parser.add_argument("--channel-os-factor", type=int, default=2,
+                        help="Per-channel lora_rx rate as a multiple of the LoRa bandwidth (default: 2)")
+    parser.add_argument("--output", type=str, default="-",
+                        help="Decoded frame output file, '-' for JSONL on stdout (default: -)")
+    parser.add_argument("--output-format", choices=OUTPUT_FORMATS, default="jsonl",
+                        help="Frame output format: JSONL or length-prefixed binary (default: jsonl)")
+    parser.add_argument("--rotate-mb", type=float, default=None,
+                        help="Rotate the output file after this many megabytes (default: never)")
+    parser.add_argument("--rotate-seconds", type=float, default=None,
+                        help="Rotate the output file after this many seconds (default: never)")
+    parser.add_argument("--store", type=str, default=None, metavar="PATH",
+                        help="Also keep frames in this SQLite frame store; query it with frame_store.py (default: off)")
+    parser.add_argument("--store-device", type=str, default=None,
+                        help="Device name stored with each frame (default: the SDR device string)")
+    parser.add_argument("--store-dedupe-window", type=float, default=2.0,
+                        help="Store a payload heard again within this many seconds only once; 0 keeps all (default: 2)")
+    parser.add_argument("--publish", action="append", default=None, metavar="URI",
+                        help="Publish frames as JSON to udp://host:port (multicast allowed) or a ZeroMQ "
+                             "PUB endpoint such as tcp://127.0.0.1:5555; repeatable")
+    parser.add_argument("--publish-queue", type=int, default=1024,
+                        help="Frames buffered per publish destination before dropping (default: 1024)")
+    parser.add_argument("--publish-policy", choices=DROP_POLICIES, default="drop-oldest",
+                        help="Which frame to drop when a destination queue is full (default: drop-oldest)")
+    parser.add_argument("--telemetry-port", type=int, default=None,
+                        help="Serve Prometheus metrics on http://127.0.0.1:PORT/metrics (default: off)")
+    parser.add_argument("--control", type=str, default=None, metavar="ADDRESS",
+                        help="Accept JSON retune commands on HOST:PORT or a Unix socket path (default: off)")
+    parser.add_argument("--stream-format", choices=STREAM_FORMAT_CHOICES, default="auto",
+                        help="SDR sample format on the wire; 'auto' uses the device's native format from the "
+                             "device inventory, falling back to cf32 (default: auto)")
+    parser.add_argument("--record-dir", type=str, default=None,
+                        help="Also write the raw SDR samples to SigMF recordings in this directory (default: off)")
+    parser.add_argument("--record-mode", choices=RECORD_MODES, default="continuous",
+                        help="continuous: everything, rotated; trigger: only windows around frames (default: continuous)")
+    parser.add_argument("--record-rotate-seconds", type=float, default=300.0,
+                        help="Start a new recording every this many seconds in continuous mode (default: 300)")
+    parser.add_argument("--record-max-gb", type=float, default=None,
+                        help="Delete the oldest recordings to keep the directory below this size (default: no cap)")
+    parser.add_argument("--record-trigger", choices=RECORD_TRIGGERS, default="all",
+                        help="Frames that trigger a recording window in trigger mode (default: all)")
+    parser.add_argument("--record-pre", type=float, default=1.0,
+                        help="Seconds kept before a frame's start in trigger mode (default: 1)")
+    parser.add_argument("--record-post", type=float, default=0.5,
+                        help="Seconds kept after a frame's end in trigger mode (default: 0.5)")
+    parser.add_argument("--activity-gate", choices=GATE_MODES, default=None,
+                        help="Only feed lora_rx stretches with likely LoRa activity, found by this "
+                             "detector (default: off, every sample is demodulated)")
+    parser.add_argument("--tuning-profile", type=str, default=None,
+                        help=f"Scheduler/buffer profile: {', '.join(PROFILES)}, 'auto' (the result of "
+                             f"'tuning.py autotune') or a profile file (default: GNU Radio defaults)")
+    parser.add_argument("--latency-trace", action="store_true",
+                        help="Keep per-frame latency histograms from sample delivery to each sink; exported "
+                             "with the telemetry, via the control server and on SIGUSR1 to stderr (default: off)")
+    parser.add_argument("--load-shed", choices=SHED_LIMITS, default=None,
+                        help="When falling behind real time, step down in this order up to the given step: "
+                             f"{', '.join(SHED_LIMITS)}; steps back up once caught up (default: off)")
+    parser.add_argument("--source-watchdog", action="store_true",
+                        help="Reopen the SDR (found again by serial) when its samples stall, keeping the "
+                             "decoder and its outputs running (default: off)")
+    parser.add_argument("--print-rx", action="store_true",
+                        help="Also let lora_rx print every frame to the console (slow; default: off)")
+    parser.add_argument("--gui", action="store_true",
+                        help="Run the Qt GUI variant instead of the headless runtime (requires PyQt5)")
+    return parser
 
-    qapp = QtWidgets.QApplication(sys.argv)
 
-    tb = top_block_cls(
-        sdr_dev_string=args.sdr_dev_string,
-        samp_rate=args.sample_rate,
-        center_freq=args.center_freq,
-        gain=args.gain
+def decoder_kwargs(options):
+    """Maps parsed command line options onto Generic_Decoder constructor arguments."""
+    samp_rate = options.sample_rate
+    if samp_rate is None and options.input_file:
+        samp_rate = recording_sample_rate(options.input_file)
+    return dict(
+        sdr_dev_string=options.sdr_dev_string or "",
+        samp_rate=samp_rate or 125e3,
+        center_freq=options.center_freq,
+        gain=options.gain,
+        spreading_factors=options.spreading_factors,
+        channel_offsets=options.channel_offsets,
+        channel_spacing=options.channel_spacing,
+        channel_os_factor=options.channel_os_factor,
+        input_file=options.input_file,
+        input_format=options.input_format,
+        throttle=options.throttle,
+        print_rx=options.print_rx,
+        output=options.output,
+        output_format=options.output_format,
+        rotate_bytes=int(options.rotate_mb * 1024 * 1024) if options.rotate_mb else None,
+        rotate_seconds=options.rotate_seconds,
+        publish=options.publish,
+        publish_queue=options.publish_queue,
+        publish_policy=options.publish_policy,
+        telemetry_port=options.telemetry_port,
+        control_address=options.control,
+        activity_gate_mode=options.activity_gate,
+        stream_format=options.stream_format,
+        record_dir=options.record_dir,
+        record_mode=options.record_mode,
+        record_rotate_seconds=options.record_rotate_seconds,
+        record_max_bytes=int(options.record_max_gb * 1024 ** 3) if options.record_max_gb else None,
+        record_trigger=options.record_trigger,
+        record_pre_seconds=options.record_pre,
+        record_post_seconds=options.record_post,
+        store=options.store,
+        store_device=options.store_device,
+        store_dedupe_window=options.store_dedupe_window,
+        tuning_profile=options.tuning_profile,
+        latency_trace=options.latency_trace,
+        load_shed=options.load_shed,
+        source_watchdog=options.source_watchdog
     )
 
-    tb.start()
-    tb.flowgraph_started.set()
 
-    tb.show()
+def main(top_block_cls=Generic_Decoder, options=None):
+    if options is None:
+        options = argument_parser().parse_args()
+
+    if options.gui:
+        # Imported lazily so the headless path never pulls in PyQt5.
+        from Generic_Decoder_GUI import main as gui_main
+        return gui_main(options=options)
+
+    tb = top_block_cls(**decoder_kwargs(options))
 
     def sig_handler(sig=None, frame=None):
         tb.stop()
         tb.wait()
-        QtWidgets.QApplication.quit()
+        sys.exit(0)
 
     signal.signal(signal.SIGINT, sig_handler)
     signal.signal(signal.SIGTERM, sig_handler)
+    if tb.latency_tracker is not None:
+        signal.signal(signal.SIGUSR1, lambda sig, frame: tb.latency_tracker.dump())
+
+    started = time.monotonic()
+    tb.start()
+    tb.flowgraph_started.set()
 
-    timer = QtCore.QTimer()
-    timer.start(500)
-    timer.timeout.connect(lambda: None)
+    tb.wait()
 
-    qapp.exec_()
+    if tb.input_file:
+        report = tb.replay_report(time.monotonic() - started)
+        print(f"[INFO] Replay finished: {report['samples']} samples, {report['frames']} frames in "
+              f"{report['elapsed_s']:.2f} s ({report['samples_per_s']:.0f} samples/s, "
+              f"{report['packets_per_s']:.2f} packets/s)", file=sys.stderr)
 
 if __name__ == '__main__':
     main()
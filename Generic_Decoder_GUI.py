@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#
+# SPDX-License-Identifier: GPL-3.0
+#
+# GNU Radio Python Flow Graph
+# Title: Generic LoRa Decoder (Qt GUI)
+# GNU Radio version: 3.10.12.0
+
+# Opt-in Qt variant of Generic_Decoder. Run it with `Generic_Decoder.py --gui`
+# or directly; the headless runtime in Generic_Decoder.py never imports PyQt5.
+from PyQt5 import Qt, QtCore, QtWidgets
+from gnuradio import qtgui
+import sys
+import signal
+
+from Generic_Decoder import Generic_Decoder, argument_parser, decoder_kwargs
+
+
+class Generic_Decoder_GUI(Generic_Decoder, Qt.QWidget):
+    def __init__(self, **kwargs):
+        Generic_Decoder.__init__(self, **kwargs)
+        Qt.QWidget.__init__(self)
+        self.setWindowTitle("Generic LoRa Decoder")
+        qtgui.util.check_set_qss()
+        try:
+            self.setWindowIcon(Qt.QIcon.fromTheme('gnuradio-grc'))
+        except BaseException as exc:
+            print(f"Qt GUI: Could not set Icon: {str(exc)}", file=sys.stderr)
+        self.top_scroll_layout = Qt.QVBoxLayout()
+        self.setLayout(self.top_scroll_layout)
+        self.top_scroll = Qt.QScrollArea()
+        self.top_scroll.setFrameStyle(Qt.QFrame.NoFrame)
+        self.top_scroll_layout.addWidget(self.top_scroll)
+        self.top_scroll.setWidgetResizable(True)
+        self.top_widget = Qt.QWidget()
+        self.top_scroll.setWidget(self.top_widget)
+        self.top_layout = Qt.QVBoxLayout(self.top_widget)
+        self.top_grid_layout = Qt.QGridLayout()
+        self.top_layout.addLayout(self.top_grid_layout)
+
+        self.settings = Qt.QSettings("gnuradio/flowgraphs", "Generic_Decoder")
+
+        try:
+            geometry = self.settings.value("geometry")
+            if geometry:
+                self.restoreGeometry(geometry)
+        except BaseException as exc:
+            print(f"Qt GUI: Could not restore geometry: {str(exc)}", file=sys.stderr)
+
+    def closeEvent(self, event):
+        self.settings = Qt.QSettings("gnuradio/flowgraphs", "Generic_Decoder")
+        self.settings.setValue("geometry", self.saveGeometry())
+        self.stop()
+        self.wait()
+        event.accept()
+
+
+def main(top_block_cls=Generic_Decoder_GUI, options=None):
+    if options is None:
+        options = argument_parser().parse_args()
+
+    qapp = QtWidgets.QApplication(sys.argv)
+
+    tb = top_block_cls(**decoder_kwargs(options))
+
+    tb.start()
+    tb.flowgraph_started.set()
+
+    tb.show()
+
+    def sig_handler(sig=None, frame=None):
+        tb.stop()
+        tb.wait()
+        QtWidgets.QApplication.quit()
+
+    signal.signal(signal.SIGINT, sig_handler)
+    signal.signal(signal.SIGTERM, sig_handler)
+
+    timer = QtCore.QTimer()
+    timer.start(500)
+    timer.timeout.connect(lambda: None)
+
+    qapp.exec_()
+
+if __name__ == '__main__':
+    main()
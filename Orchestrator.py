@@ -1,31 +1,112 @@
 import subprocess
+import asyncio
+import hashlib
+import glob
+import time
 import os
 import sys
 import platform
+from argparse import ArgumentParser
 
-def main():
+from device_inventory import SELECTION_POLICIES
+from process_streams import StreamingProcess, echo, run_all
+from startup_timing import StartupTimer, parse_phase
+
+DOCKER_IMAGE_NAME = "lora-sdr-demodulator"
+# Detection and decoding run via docker exec in this one long-lived container
+RUNTIME_CONTAINER_NAME = "lora-sdr-runtime"
+# Image label holding the hash of the Dockerfile and the files it copies
+IMAGE_HASH_LABEL = "lora.content-hash"
+
+def build_context_hash(script_dir):
+    """sha256 over the Dockerfile and every file its COPY lines pull in."""
+    dockerfile_path = os.path.join(script_dir, "Dockerfile")
+    sources = ["Dockerfile"]
+    with open(dockerfile_path) as dockerfile:
+        for line in dockerfile:
+            parts = line.split()
+            if parts and parts[0].upper() == "COPY":
+                args = [part for part in parts[1:] if not part.startswith("--")]
+                for pattern in args[:-1]:
+                    sources += sorted(os.path.relpath(path, script_dir)
+                                      for path in glob.glob(os.path.join(script_dir, pattern)))
+    digest = hashlib.sha256()
+    for source in sources:
+        digest.update(source.encode("utf-8") + b"\0")
+        with open(os.path.join(script_dir, source), "rb") as source_file:
+            digest.update(source_file.read())
+    return digest.hexdigest()
+
+def image_content_hash(docker_image_name):
+    """The content hash label of an existing image, or None."""
+    result = subprocess.run(["docker", "image", "inspect", "-f", f'{{{{ index .Config.Labels "{IMAGE_HASH_LABEL}" }}}}',
+                             docker_image_name], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    label = result.stdout.strip()
+    return label if result.returncode == 0 and label and label != "<no value>" else None
+
+def ensure_runtime_container(docker_image_name, content_hash, device_mounts, fresh=False):
+    """
+    Starts the long-lived runtime container, or reuses a running one built
+    from the same image content. Returns its name.
+    """
+    result = subprocess.run(["docker", "inspect", "-f", f'{{{{.State.Running}}}} {{{{ index .Config.Labels "{IMAGE_HASH_LABEL}" }}}}',
+                             RUNTIME_CONTAINER_NAME], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    if result.returncode == 0 and not fresh:
+        running, _, label = result.stdout.strip().partition(" ")
+        if running == "true" and label == content_hash:
+            print(f"Reusing running container '{RUNTIME_CONTAINER_NAME}'.")
+            return RUNTIME_CONTAINER_NAME
+    if result.returncode == 0:
+        subprocess.run(["docker", "rm", "-f", RUNTIME_CONTAINER_NAME], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    run_container_command = [
+        'docker', 'run', '-d', '--init',
+        '--name', RUNTIME_CONTAINER_NAME,
+        '--network=host',           # Allows container to reach host.docker.internal
+        '--privileged',             # Still needed for some low-level access within container, though --device handles main USB
+        '--device=/dev/bus/usb',    # Pass through the USB device
+        '-e', 'GR_DISABLE_VM_ALLOCATOR=1', # NEW: For vmcircbuf error
+        *device_mounts,
+        docker_image_name,
+        "sleep", "infinity"
+    ]
+    print(f"Executing: {' '.join(run_container_command)}")
+    subprocess.run(run_container_command, check=True, stdout=subprocess.DEVNULL)
+    return RUNTIME_CONTAINER_NAME
+
+def main(gui=False, fleet=False, fleet_plan=None, rebuild=False, fresh_container=False,
+         stop_container=False, detection_args=(), fleet_args=()):
+    timer = StartupTimer()
     print("--- Starting LoRa SDR Setup and Run Process (Dockerized) ---")
 
     # Determine the Docker image name
-    docker_image_name = "lora-sdr-demodulator"
+    docker_image_name = DOCKER_IMAGE_NAME
 
-    # 1. Build the Docker image
+    # 1. Build the Docker image, unless an image of the same content exists
     print(f"\nStep 1: Building Docker image '{docker_image_name}'...")
     try:
         # Get the directory of the current script
         script_dir = os.path.dirname(os.path.abspath(__file__))
-        
+
         # Ensure Dockerfile exists
         dockerfile_path = os.path.join(script_dir, "Dockerfile")
         if not os.path.exists(dockerfile_path):
             print(f"Error: Dockerfile not found at {dockerfile_path}. Please create it.", file=sys.stderr)
             sys.exit(1)
 
-        # Build the Docker image. The context is the script's directory.
-        build_command = ["docker", "build", "-t", docker_image_name, script_dir]
-        print(f"Executing: {' '.join(build_command)}")
-        subprocess.run(build_command, check=True)
-        print(f"Step 1: Docker image '{docker_image_name}' built successfully.")
+        with timer.phase("content_hash"):
+            content_hash = build_context_hash(script_dir)
+            existing_hash = image_content_hash(docker_image_name)
+        if existing_hash == content_hash and not rebuild:
+            print(f"Step 1: Docker image '{docker_image_name}' is up to date ({content_hash[:12]}), skipping build.")
+        else:
+            # Build the Docker image. The context is the script's directory.
+            build_command = ["docker", "build", "--label", f"{IMAGE_HASH_LABEL}={content_hash}",
+                             "-t", docker_image_name, script_dir]
+            print(f"Executing: {' '.join(build_command)}")
+            with timer.phase("docker_build"):
+                subprocess.run(build_command, check=True)
+            print(f"Step 1: Docker image '{docker_image_name}' built successfully.")
     except subprocess.CalledProcessError as e:
         print(f"Critical error: Failed to build Docker image. Error: {e}", file=sys.stderr)
         print("Please ensure Docker is installed and running on your system.", file=sys.stderr)
@@ -37,9 +118,6 @@ def main():
         print(f"An unexpected error occurred during Docker build: {e}", file=sys.stderr)
         sys.exit(1)
 
-    # 2. Run the SDR detection within the Docker container
-    print("\nStep 2: Detecting SDR devices within the Docker container...")
-    
     # Common device mounts for SDRs. Adjust based on your specific SDR.
     device_mounts = []
     if platform.system() == "Linux":
@@ -54,108 +132,193 @@ def main():
         print("[WARN] If SDR detection fails, you might need to manually configure USB passthrough or use a Linux VM.")
         pass # No generic device mount for Windows in this context
 
-    # Command to run sdr_manager.py's detection method inside the container
-    run_detection_command = [
-        "docker", "run", "--rm", "-it", "--network=host", "--privileged",
-        *device_mounts,
-        docker_image_name,
-        "python3", "sdr_manager.py", "detect_sdr_only"
-    ]
-    
-    selected_sdr_dev_string = None
-    print(f"Executing SDR detection in Docker: {' '.join(run_detection_command)}")
     try:
-        # Run in interactive mode, capturing output to a pipe to read it
-        # We need to explicitly pass stdin, stdout, stderr for interactivity
-        process = subprocess.Popen(run_detection_command, stdin=sys.stdin, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        stdout_lines = []
-        stderr_lines = []
-
-        # Read stdout and stderr line by line to process output
-        while True:
-            stdout_line = process.stdout.readline()
-            stderr_line = process.stderr.readline()
-
-            if stdout_line == '' and stderr_line == '' and process.poll() is not None:
-                break
-            if stdout_line:
-                sys.stdout.write(stdout_line) # Print to host console
-                stdout_lines.append(stdout_line.strip())
-                if "SELECTED_SDR_DEVICE:" in stdout_line:
-                    selected_sdr_dev_string = stdout_line.replace("SELECTED_SDR_DEVICE:", "").strip()
-                elif "NO_SDR_DEVICES_FOUND" in stdout_line:
-                    # If this is found, we know no devices were detected
-                    # We can break early or let the loop finish and then check
-                    pass # Let the loop finish to ensure all messages are printed
-
-            if stderr_line:
-                sys.stderr.write(stderr_line) # Print to host console
-                stderr_lines.append(stderr_line.strip())
-        
-        # Wait for the process to terminate and get its return code
-        process.wait()
-
-        if process.returncode != 0:
-            # If sdr_manager.py exited with an error (e.g., no devices found and it signaled an error)
-            # or if there was a Docker error.
-            # We already printed the output, just need to check for the specific message.
-            if "NO_SDR_DEVICES_FOUND" in "\n".join(stdout_lines):
-                 print("\n--- SDR Detection Failed: No devices found in Docker container ---", file=sys.stderr)
-                 print("This usually indicates a problem with USB device passthrough from your host macOS to the Docker VM.", file=sys.stderr)
-                 print("\nTroubleshooting Steps for macOS Docker USB Passthrough:", file=sys.stderr)
-                 print("1. Verify your SDR is connected and recognized by macOS: Open 'System Information' (search in Spotlight), then go to 'USB' under 'Hardware'. Look for your SDR device.", file=sys.stderr)
-                 print("2. Check Docker Desktop settings: Go to Docker Desktop -> Settings (or Preferences) -> Resources -> USB. Ensure your device is listed and enabled for sharing with containers. You might need to restart Docker Desktop after changes.", file=sys.stderr)
-                 print("3. Try a different USB port or cable.", file=sys.stderr)
-                 print("4. Some complex SDRs (e.g., USRPs) require specific drivers or firmware on the host before Docker can access them.", file=sys.stderr)
-                 print("5. Consider running a dedicated Linux Virtual Machine (e.g., with VirtualBox, UTM, or Parallels) and installing GNU Radio and drivers directly in that VM, then running your scripts there. USB passthrough is often more reliable in full VMs.", file=sys.stderr)
-                 print("6. For advanced users: Explore `usbip` if you have a Linux VM where you can forward USB devices to the Docker container.", file=sys.stderr)
-                 sys.exit(1) # Exit with an error code
-            else:
-                print(f"Critical error: SDR detection failed in Docker with exit code {process.returncode}.", file=sys.stderr)
-                print("Please review the output above for specific errors.", file=sys.stderr)
-                sys.exit(1)
-
-        if not selected_sdr_dev_string:
-            # This case should ideally be caught by NO_SDR_DEVICES_FOUND or a direct selection.
-            # If we reach here, it means no device was selected and no specific error was signaled.
-            print("Error: SDR detection completed, but no device was selected or identified.", file=sys.stderr)
-            sys.exit(1)
+        with timer.phase("runtime_container"):
+            container = ensure_runtime_container(docker_image_name, content_hash, device_mounts, fresh_container)
+    except subprocess.CalledProcessError as e:
+        print(f"Critical error: Failed to start container '{RUNTIME_CONTAINER_NAME}'. Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    try:
+        if fleet:
+            asyncio.run(run_fleet(container, timer, fleet_plan, fleet_args))
+        else:
+            asyncio.run(detect_and_run(container, timer, gui, detection_args))
+    finally:
+        if stop_container:
+            subprocess.run(["docker", "rm", "-f", container], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    print("\n--- LoRa SDR Process Finished ---")
+
+
+def print_no_devices_help():
+    print("\n--- SDR Detection Failed: No devices found in Docker container ---", file=sys.stderr)
+    print("This usually indicates a problem with USB device passthrough from your host macOS to the Docker VM.", file=sys.stderr)
+    print("\nTroubleshooting Steps for macOS Docker USB Passthrough:", file=sys.stderr)
+    print("1. Verify your SDR is connected and recognized by macOS: Open 'System Information' (search in Spotlight), then go to 'USB' under 'Hardware'. Look for your SDR device.", file=sys.stderr)
+    print("2. Check Docker Desktop settings: Go to Docker Desktop -> Settings (or Preferences) -> Resources -> USB. Ensure your device is listed and enabled for sharing with containers. You might need to restart Docker Desktop after changes.", file=sys.stderr)
+    print("3. Try a different USB port or cable.", file=sys.stderr)
+    print("4. Some complex SDRs (e.g., USRPs) require specific drivers or firmware on the host before Docker can access them.", file=sys.stderr)
+    print("5. Consider running a dedicated Linux Virtual Machine (e.g., with VirtualBox, UTM, or Parallels) and installing GNU Radio and drivers directly in that VM, then running your scripts there. USB passthrough is often more reliable in full VMs.", file=sys.stderr)
+    print("6. For advanced users: Explore `usbip` if you have a Linux VM where you can forward USB devices to the Docker container.", file=sys.stderr)
+
+
+class ContainerExec(StreamingProcess):
+    """
+    A command run with docker exec in the runtime container. docker exec does
+    not forward signals, so the command records its PID in a pidfile inside
+    the container (a shell that execs it) and terminate() signals that PID.
+    """
+    def __init__(self, name, container, command, on_stdout=None, on_stderr=None, env=None):
+        self.container = container
+        self.pidfile = f"/tmp/orchestrator-{os.getpid()}-{name}.pid"
+        env_args = [arg for key, value in (env or {}).items() for arg in ("-e", f"{key}={value}")]
+        wrapped = ["sh", "-c", 'echo $$ > "$0" && exec "$@"', self.pidfile, *command]
+        StreamingProcess.__init__(self, name, ["docker", "exec", *env_args, container, *wrapped], on_stdout, on_stderr)
+
+    def terminate(self):
+        if self.process is not None and self.process.returncode is None:
+            subprocess.run(["docker", "exec", self.container, "sh", "-c",
+                            'kill -TERM "$(cat "$0")" && rm -f "$0"', self.pidfile],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        StreamingProcess.terminate(self)
+
 
-        print(f"Step 2: Selected SDR: '{selected_sdr_dev_string}'.")
+class FirstOutput:
+    """Wraps line callbacks; the first line any decoder prints completes the startup breakdown."""
+    def __init__(self, timer):
+        self.timer = timer
+        self.started = time.monotonic()
+        self.seen = False
 
+    def wrap(self, on_line):
+        def handle_line(line):
+            if not self.seen:
+                self.seen = True
+                self.timer.record("decoder_first_output", time.monotonic() - self.started)
+                self.timer.report()
+            on_line(line)
+        return handle_line
+
+
+class DetectionEvents:
+    """
+    Parses the marker lines sdr_manager.py prints as they arrive. finished is
+    set by the first conclusive marker, so the Orchestrator can move on without
+    waiting for the detection process to exit. Phase times measured inside the
+    container are added to timer.
+    """
+    def __init__(self, timer):
+        self.timer = timer
+        self.devices = []
+        self.no_devices = False
+        self.finished = asyncio.Event()
+
+    def on_stdout(self, line):
+        phase = parse_phase(line)
+        if phase is not None:
+            self.timer.record(f"container/{phase[0]}", phase[1])
+            return
+        print(line, flush=True) # Print to host console
+        if line.startswith("SELECTED_SDR_DEVICE:"):
+            self.devices.append(line.replace("SELECTED_SDR_DEVICE:", "").strip())
+            self.finished.set()
+        elif "NO_SDR_DEVICES_FOUND" in line:
+            self.no_devices = True
+            self.finished.set()
+
+
+async def detect_and_run(container, timer, gui=False, detection_args=()):
+    # 2. Run the SDR detection within the Docker container
+    print("\nStep 2: Detecting SDR devices within the Docker container...")
+
+    # Command to run sdr_manager.py's detection method inside the container.
+    # No TTY: its stdout and stderr are read separately as they arrive.
+    detection_command = ["python3", "sdr_manager.py", "detect_sdr_only", *detection_args]
+
+    print(f"Executing SDR detection in Docker: {' '.join(detection_command)}")
+    events = DetectionEvents(timer)
+    detection = ContainerExec("detection", container, detection_command, events.on_stdout, echo(sys.stderr))
+    detection_started = time.monotonic()
+    detection_task = asyncio.create_task(detection.run())
+    finished_task = asyncio.create_task(events.finished.wait())
+    try:
+        await asyncio.wait([detection_task, finished_task], return_when=asyncio.FIRST_COMPLETED)
     except Exception as e:
         print(f"An unexpected error occurred during SDR detection: {e}", file=sys.stderr)
         sys.exit(1)
+    finished_task.cancel()
+    timer.record("detection", time.monotonic() - detection_started)
 
-    # 3. Run the LoRa demodulator flowgraph within the Docker container
-    print("\nStep 3: Launching the LoRa demodulator within the Docker container...")
-    
-    run_demodulator_command = [
-        'docker', 'run', '--rm', '-it',
-        '--network=host',           # Allows container to reach host.docker.internal
-        '--privileged',             # Still needed for some low-level access within container, though --device handles main USB
-        '--device=/dev/bus/usb',    # Pass through the USB device
-        '-e', 'GR_DISABLE_VM_ALLOCATOR=1', # NEW: For vmcircbuf error
-        '-e', 'QT_QPA_PLATFORM=offscreen',  # Tell Qt/X applications where to display
-        *device_mounts,
-        docker_image_name,
+    if events.no_devices:
+        await detection_task
+        print_no_devices_help()
+        sys.exit(1) # Exit with an error code
+    if not events.finished.is_set():
+        # The detection process exited without a conclusive marker
+        if detection_task.exception() is not None:
+            print(f"An unexpected error occurred during SDR detection: {detection_task.exception()}", file=sys.stderr)
+        elif detection.returncode != 0:
+            print(f"Critical error: SDR detection failed in Docker with exit code {detection.returncode}.", file=sys.stderr)
+            print("Please review the output above for specific errors.", file=sys.stderr)
+        else:
+            print("Error: SDR detection completed, but no device was selected or identified.", file=sys.stderr)
+        sys.exit(1)
+
+    device = events.devices[0]
+    print(f"Step 2: Selected SDR: '{device}'.")
+
+    # 3. Run the LoRa demodulator flowgraph in the same container, while the
+    # detection process finishes exiting in the background.
+    print(f"\nStep 3: Launching the LoRa demodulator in '{container}'...")
+    # The decoder runs headless by default; the Qt variant is opt-in via --gui.
+    gui_env = {"QT_QPA_PLATFORM": "offscreen"} if gui else {}  # Tell Qt/X applications where to display
+    first_output = FirstOutput(timer)
+    command = decoder_command(device, gui)
+    print(f"Executing LoRa demodulator in Docker: {' '.join(command)}")
+    decoder = ContainerExec("decoder", container, command, first_output.wrap(echo(sys.stdout)),
+                            first_output.wrap(echo(sys.stderr)), env=gui_env)
+
+    try:
+        (returncode,), _ = await asyncio.gather(run_all([decoder]), detection_task)
+    except Exception as e:
+        print(f"An unexpected error occurred while launching demodulator in Docker: {e}", file=sys.stderr)
+        return
+    if returncode:
+        print(f"LoRa demodulator exited with code {returncode}.", file=sys.stderr)
+
+
+def decoder_command(selected_sdr_dev_string, gui=False):
+    gui_args = ["--gui"] if gui else []
+    return [
         "python3", "Generic_Decoder.py",
         "--sdr-dev-string", selected_sdr_dev_string,
         "--sample-rate", "250e3",
         "--center-freq", "433e6",
-        "--gain", "20"
+        "--gain", "20",
+        *gui_args
     ]
-    
-    print(f"Executing LoRa demodulator in Docker: {' '.join(run_demodulator_command)}")
+
+
+async def run_fleet(container, timer, fleet_plan=None, fleet_args=()):
+    """Runs fleet.py (with fleet_args) in the runtime container: a supervised decoder per connected SDR."""
+    print("\nStep 2: Launching one LoRa decoder per connected SDR (fleet mode)...")
+    plan_args = []
+    if fleet_plan:
+        subprocess.run(["docker", "cp", os.path.abspath(fleet_plan), f"{container}:/app/fleet_plan.json"], check=True)
+        plan_args = ["--plan", "/app/fleet_plan.json"]
+
+    fleet_command = ["python3", "fleet.py", *plan_args, *fleet_args]
+    print(f"Executing LoRa fleet in Docker: {' '.join(fleet_command)}")
+    first_output = FirstOutput(timer)
+    fleet = ContainerExec("fleet", container, fleet_command, first_output.wrap(echo(sys.stdout)),
+                          first_output.wrap(echo(sys.stderr)))
     try:
-        # For the demodulator, we want full interactivity
-        subprocess.run(run_demodulator_command, check=True, stdin=sys.stdin, stdout=sys.stdout, stderr=sys.stderr)
-    except subprocess.CalledProcessError as e:
-        print(f"LoRa demodulator script failed in Docker with error: {e}", file=sys.stderr)
+        returncode, = await run_all([fleet])
+        if returncode:
+            print(f"LoRa fleet exited in Docker with code {returncode}", file=sys.stderr)
     except Exception as e:
-        print(f"An unexpected error occurred while launching demodulator in Docker: {e}", file=sys.stderr)
-    
-    print("\n--- LoRa SDR Process Finished ---")
+        print(f"An unexpected error occurred while launching the fleet in Docker: {e}", file=sys.stderr)
 
 if __name__ == "__main__":
     # This allows sdr_manager.py to be called directly from Orchestrator for specific tasks
@@ -167,4 +330,45 @@ if __name__ == "__main__":
         # sdr_manager.py already prints SELECTED_SDR_DEVICE or NO_SDR_DEVICES_FOUND
         sys.exit(0)
     else:
-        main()
+        parser = ArgumentParser(description="Build, detect and launch the Dockerized LoRa decoder")
+        parser.add_argument("--gui", action="store_true",
+                            help="Launch the Qt GUI variant of the decoder instead of the headless runtime")
+        parser.add_argument("--fleet", "--all-devices", action="store_true",
+                            help="Run one supervised decoder per connected SDR instead of selecting a single one")
+        parser.add_argument("--fleet-plan", type=str, default=None,
+                            help="JSON frequency/gain plan per device for --fleet (see fleet.py)")
+        parser.add_argument("--rebuild", action="store_true",
+                            help="Build the Docker image even if its content hash matches the existing image")
+        parser.add_argument("--fresh-container", action="store_true",
+                            help=f"Recreate the '{RUNTIME_CONTAINER_NAME}' container instead of reusing a running one")
+        parser.add_argument("--stop-container", action="store_true",
+                            help=f"Remove the '{RUNTIME_CONTAINER_NAME}' container on exit (default: keep it for fast restarts)")
+        parser.add_argument("--serial", type=str, default=None, help="Decode with the SDR that has this serial number")
+        parser.add_argument("--driver", action="append", default=None,
+                            help="Only look for SDRs of this SoapySDR driver (e.g. rtlsdr); repeatable")
+        parser.add_argument("--select-policy", choices=SELECTION_POLICIES, default=None,
+                            help="How to pick one SDR without --serial (default: preferred-driver)")
+        parser.add_argument("--refresh-devices", action="store_true",
+                            help="Re-discover SDRs instead of using the stored device inventory")
+        args = parser.parse_args()
+        fleet = args.fleet or bool(args.fleet_plan)
+        if fleet and (args.serial or args.select_policy):
+            # The fleet runs every connected SDR (narrowed by --driver), so there is nothing to select
+            parser.error("--serial and --select-policy pick a single SDR and cannot be used with --fleet/--fleet-plan")
+        fleet_args = []
+        for driver in args.driver or []:
+            fleet_args += ["--driver", driver]
+        if args.refresh_devices:
+            fleet_args.append("--refresh-devices")
+        detection_args = []
+        if args.serial:
+            detection_args += ["--serial", args.serial]
+        for driver in args.driver or []:
+            detection_args += ["--driver", driver]
+        if args.select_policy:
+            detection_args += ["--policy", args.select_policy]
+        if args.refresh_devices:
+            detection_args.append("--refresh")
+        main(gui=args.gui, fleet=fleet, fleet_plan=args.fleet_plan,
+             rebuild=args.rebuild, fresh_container=args.fresh_container,
+             stop_container=args.stop_container, detection_args=detection_args, fleet_args=fleet_args)
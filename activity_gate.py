@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#
+# SPDX-License-Identifier: GPL-3.0
+#
+# Pre-detection in front of lora_rx. The stream is examined in chunks of one
+# symbol of the largest spreading factor; only chunks with likely LoRa
+# activity (plus padding before and after) are passed on, so an idle channel
+# costs the demodulation chain nothing.
+#
+# Detectors (vectorized NumPy over every chunk of a work call at once):
+#   energy - chunk power against a tracked noise floor; cheap, but LoRa below
+#            the noise floor (negative SNR) does not register
+#   chirp  - every symbol-sized window is dechirped and FFT'd per SF; any
+#            LoRa symbol collapses into one bin, which works below the noise
+#   any    - either of the two
+# Both use hysteresis: a higher threshold opens the gate than keeps it open.
+# Only that decision (and the noise floor it moves) runs chunk by chunk, on
+# the precomputed per-chunk metrics.
+
+import bisect
+import math
+
+import numpy as np
+from gnuradio import gr
+
+GATE_MODES = ("energy", "chirp", "any")
+
+# Expected max/mean ratio over N exponentially distributed (noise) FFT bins
+# is about ln(N) + Euler's constant; chirp metrics are normalized by it.
+EULER_GAMMA = 0.5772
+
+
+def downchirp(samp_rate, sf, bw=125000):
+    """Conjugate base upchirp of one symbol (2^sf / bw seconds) at samp_rate."""
+    n = int(round((2 ** sf) / bw * samp_rate))
+    t = np.arange(n) / samp_rate
+    symbol_time = (2 ** sf) / bw
+    phase = 2 * np.pi * (-bw / 2 * t + bw / (2 * symbol_time) * t ** 2)
+    return np.exp(-1j * phase).astype(np.complex64)
+
+
+class ActivityDetector:
+    """Decides per chunk whether LoRa activity is likely; see the module comment for the modes."""
+    def __init__(self, samp_rate, spreading_factors=(7,), bw=125000, mode="chirp",
+                 energy_threshold_db=3.0, chirp_threshold=2.5, hysteresis=0.6, floor_alpha=0.02):
+        if mode not in GATE_MODES:
+            raise ValueError(f"Unknown activity gate mode '{mode}'. Choose one of: {', '.join(GATE_MODES)}")
+        self.samp_rate = samp_rate
+        self.bw = bw
+        self.mode = mode
+        self.energy_threshold = 10 ** (energy_threshold_db / 10)
+        self.chirp_threshold = chirp_threshold
+        self.hysteresis = hysteresis  # fraction of the open thresholds that keeps the gate open
+        self.floor_alpha = floor_alpha
+        self.noise_floor = None
+        self.set_spreading_factors(spreading_factors)
+
+    def set_spreading_factors(self, spreading_factors, bw=None):
+        if bw:
+            self.bw = bw
+        references = {sf: downchirp(self.samp_rate, sf, self.bw) for sf in sorted(set(spreading_factors))}
+        self.block_size = max(len(ref) for ref in references.values())
+        # Noise-only maximum over every bin of every window in a chunk
+        self.noise_peak = {sf: math.log(len(ref) * (self.block_size // len(ref))) + EULER_GAMMA
+                           for sf, ref in references.items()}
+        self.references = references
+
+    def chunk_powers(self, chunks):
+        """Mean power of every row of chunks (n x block_size)."""
+        parts = chunks.view(chunks.real.dtype)  # I and Q interleaved
+        # One dot product per row, batched (as fast as np.vdot for a single chunk)
+        return (parts[:, None, :] @ parts[:, :, None])[:, 0, 0] / chunks.shape[1]
+
+    def chirp_metrics(self, chunks):
+        """Per row of chunks: best dechirped peak-to-mean ratio over all windows and SFs, normalized to noise."""
+        best = np.zeros(len(chunks))
+        for sf, reference in self.references.items():
+            n = len(reference)
+            windows = chunks[:, :chunks.shape[1] // n * n].reshape(len(chunks), -1, n) * reference
+            spectrum = np.fft.fft(windows, axis=2)
+            spectrum = spectrum.real ** 2 + spectrum.imag ** 2
+            mean = spectrum.mean(axis=2)
+            ratio = np.divide(spectrum.max(axis=2), mean, out=np.zeros_like(mean), where=mean > 0)
+            best = np.maximum(best, ratio.max(axis=1) / self.noise_peak[sf])
+        return best
+
+    def measure(self, chunks):
+        """(powers, chirp metrics) for the rows of chunks; None for what the mode does not use."""
+        powers = self.chunk_powers(chunks) if self.mode in ("energy", "any") else None
+        chirps = self.chirp_metrics(chunks) if self.mode in ("chirp", "any") else None
+        return powers, chirps
+
+    def decide(self, power, chirp, gate_open=False):
+        """Whether one chunk with this power and chirp metric (None: unused) is active; tracks the noise floor."""
+        scale = self.hysteresis if gate_open else 1.0
+        active = False
+        if power is not None:
+            if self.noise_floor is None:
+                self.noise_floor = power
+            ratio = power / self.noise_floor if self.noise_floor > 0 else 0.0
+            active = ratio > 1 + (self.energy_threshold - 1) * scale
+        if not active and chirp is not None:
+            active = chirp > 1 + (self.chirp_threshold - 1) * scale
+        if not active and power is not None:
+            # Only idle chunks move the floor: down at once, up slowly
+            if power < self.noise_floor:
+                self.noise_floor = power
+            else:
+                self.noise_floor += self.floor_alpha * (power - self.noise_floor)
+        return active
+
+    def is_active(self, chunk, gate_open=False):
+        powers, chirps = self.measure(chunk.reshape(1, -1))
+        return self.decide(None if powers is None else float(powers[0]),
+                           None if chirps is None else float(chirps[0]), gate_open)
+
+
+class activity_gate(gr.basic_block):
+    """
+    Passes only active stretches of a complex stream, with pre_pad samples of
+    history before and at least post_pad samples after activity. source_index()
+    maps an output sample back to its input position, so frame timing
+    downstream still refers to the ungated stream.
+    """
+    def __init__(self, samp_rate, spreading_factors=(7,), bw=125000, mode="chirp",
+                 pre_pad_symbols=10, post_pad_symbols=8, **detector_options):
+        gr.basic_block.__init__(self, name="activity_gate", in_sig=[np.complex64], out_sig=[np.complex64])
+        self.detector = ActivityDetector(samp_rate, spreading_factors, bw, mode, **detector_options)
+        # Padding in symbols of the largest SF: the pre-pad keeps the whole
+        # preamble although detection fires a symbol or two into it; the
+        # post-pad pushes the last symbols through lora_rx's buffers.
+        self.pre_pad_symbols = pre_pad_symbols
+        self.post_pad_symbols = post_pad_symbols
+        self.gate_open = False
+        self.hang = 0
+        self.history = np.zeros(0, dtype=np.complex64)
+        self.pending = np.zeros(0, dtype=np.complex64)
+        self.samples_in = 0
+        self.samples_passed = 0
+        self.openings = 0
+        # (output index, input index) at every discontinuity
+        self.segment_out = [0]
+        self.segment_in = [0]
+
+    @property
+    def pre_pad(self):
+        return self.pre_pad_symbols * self.detector.block_size
+
+    @property
+    def post_pad(self):
+        return self.post_pad_symbols * self.detector.block_size
+
+    def set_spreading_factors(self, spreading_factors, bw=None):
+        self.detector.set_spreading_factors(spreading_factors, bw)
+
+    def source_index(self, out_index):
+        """Input sample index of output sample out_index."""
+        segment = bisect.bisect_right(self.segment_out, out_index) - 1
+        return self.segment_in[segment] + out_index - self.segment_out[segment]
+
+    def idle_fraction(self):
+        return 1 - self.samples_passed / self.samples_in if self.samples_in else 0.0
+
+    def forecast(self, noutput_items, ninputs):
+        # Pending output needs no input; otherwise a whole chunk is needed
+        return [0 if len(self.pending) else self.detector.block_size] * ninputs
+
+    def _tail(self, samples):
+        """The last pre_pad samples."""
+        return samples[max(0, len(samples) - self.pre_pad):]
+
+    def _history_with(self, idle):
+        """The last pre_pad samples of history followed by the idle stretch (copying only those)."""
+        return self._tail(np.concatenate((self.history, self._tail(idle))))
+
+    def gate(self, samples):
+        """
+        Runs whole chunks of samples through the gate and returns what passes
+        (history included on openings). Passed and idle stretches are sliced
+        out once per run of chunks, not per chunk.
+        """
+        block = self.detector.block_size
+        n_chunks = len(samples) // block
+        powers, chirps = self.detector.measure(samples[:n_chunks * block].reshape(n_chunks, block))
+        pieces = []
+        passed = 0
+        run_start = 0 if self.gate_open else None  # first chunk of the passed run
+        idle_start = None if self.gate_open else 0  # first chunk of the idle run
+        for i in range(n_chunks):
+            active = self.detector.decide(None if powers is None else float(powers[i]),
+                                          None if chirps is None else float(chirps[i]), self.gate_open)
+            if active:
+                self.hang = self.post_pad
+                if not self.gate_open:
+                    self.gate_open = True
+                    self.openings += 1
+                    history = self._history_with(samples[idle_start * block:i * block])
+                    self.segment_out.append(self.samples_passed + passed)
+                    self.segment_in.append(self.samples_in + i * block - len(history))
+                    self.history = self.history[:0]
+                    pieces.append(history)
+                    passed += len(history)
+                    run_start = i
+            elif self.gate_open:
+                self.hang -= block
+                if self.hang <= 0:
+                    # This chunk still passes; the next one is idle
+                    self.gate_open = False
+                    pieces.append(samples[run_start * block:(i + 1) * block])
+                    passed += (i + 1 - run_start) * block
+                    idle_start = i + 1
+        if self.gate_open:
+            pieces.append(samples[run_start * block:n_chunks * block])
+            passed += (n_chunks - run_start) * block
+        else:
+            self.history = self._history_with(samples[idle_start * block:n_chunks * block])
+        self.samples_in += n_chunks * block
+        self.samples_passed += passed
+        return np.concatenate(pieces) if pieces else samples[:0].copy()
+
+    def general_work(self, input_items, output_items):
+        out = output_items[0]
+        if not len(self.pending):
+            block = self.detector.block_size
+            n_chunks = min(len(input_items[0]) // block, max(1, len(out) // block))
+            if n_chunks == 0:
+                return 0
+            self.pending = self.gate(input_items[0][:n_chunks * block])
+            self.consume(0, n_chunks * block)
+            if not len(self.pending):
+                return 0
+        n = min(len(out), len(self.pending))
+        out[:n] = self.pending[:n]
+        self.pending = self.pending[n:]
+        return n
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#
+# SPDX-License-Identifier: GPL-3.0
+#
+# Batch decoder for IQ archives: decodes recordings on all CPU cores with one
+# isolated Generic_Decoder flowgraph per worker process, splitting large files
+# into overlapping chunks, and writes a merged, time-ordered JSONL frame stream.
+#
+# Usage: python3 batch_decode.py /data/captures/ 'archive/*.sigmf-meta' --output frames.jsonl
+
+import os
+import sys
+import glob
+import json
+import time
+import multiprocessing
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from gnuradio.eng_arg import eng_float
+
+from iq_file_source import FORMATS, open_recording
+from lora_timing import time_on_air
+from packet_sink import jsonable
+
+RECORDING_EXTENSIONS = tuple(f".{fmt}" for fmt in FORMATS) + (".sigmf-meta", ".iq", ".bin", ".raw")
+# Two jobs' copies of one frame lie at most this far apart (sample clock jitter)
+DUPLICATE_TOLERANCE_S = 0.5
+
+
+def find_recordings(inputs):
+    """Expands directories and glob patterns into a sorted list of recording paths."""
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, _, files in os.walk(item):
+                paths.extend(os.path.join(root, name) for name in files
+                             if name.endswith(RECORDING_EXTENSIONS))
+        else:
+            paths.extend(glob.glob(item) or [item])
+    # A SigMF recording is listed through its .sigmf-meta only
+    return sorted(set(path for path in paths if not path.endswith(".sigmf-data")))
+
+
+def plan_chunks(path, fmt, samp_rate, chunk_seconds, overlap_seconds):
+    """
+    Splits one recording into jobs. Each job owns chunk_seconds of samples and
+    reads overlap_seconds past its end, so a frame that starts before the
+    boundary is still complete in the job that owns its start.
+    """
+    recording = open_recording(path, fmt)
+    samp_rate = samp_rate or recording.sample_rate
+    if not samp_rate:
+        raise ValueError(f"No sample rate known for '{path}'; pass --sample-rate")
+    chunk_len = max(1, int(chunk_seconds * samp_rate))
+    overlap = int(overlap_seconds * samp_rate)
+    jobs = []
+    for start in range(0, recording.num_samples, chunk_len):
+        jobs.append({
+            "path": path,
+            "fmt": fmt,
+            "samp_rate": samp_rate,
+            "start": start,
+            "end": start + chunk_len,  # the next job's start; this one reads overlap past it
+            "count": chunk_len + overlap,
+            "start_time": recording.start_time,
+        })
+    return jobs
+
+
+def _silence_stdout():
+    # Keep decoder log lines out of the merged stream when it goes to stdout.
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+
+
+def decode_chunk(job, decoder_options):
+    """Runs one chunk through its own Generic_Decoder flowgraph and returns its frames."""
+    # Imported in the worker so every process builds an isolated GNU Radio runtime.
+    from Generic_Decoder import Generic_Decoder
+    from frame_tagger import frame_collector
+
+    tb = Generic_Decoder(
+        samp_rate=job["samp_rate"],
+        input_file=job["path"],
+        input_format=job["fmt"],
+        input_start=job["start"],
+        input_count=job["count"],
+        throttle=False,
+        print_rx=False,
+        output=None,
+        **decoder_options
+    )
+    collector = frame_collector()
+    for branch in tb.lora_rx_branches:
+        tb.msg_connect((branch.tagger, 'out'), (collector, 'in'))
+    tb.run()
+
+    frames = []
+    for record in collector.records:
+        record["file"] = job["path"]
+        record["sample_index"] = job["start"] + record.get("sample_index", 0)
+        offset = record["sample_index"] / job["samp_rate"]
+        record["time"] = job["start_time"] + offset if job["start_time"] else offset
+        record.pop("rx_time", None)
+        frames.append(record)
+    return frames, tb.iq_file_source_0.samples_produced
+
+
+def _frame_key(frame):
+    return frame.get("sf"), frame.get("channel"), frame["payload"]
+
+
+def merge_frames(job_frames):
+    """
+    Merges (job, frames) pairs into one time-ordered list, dropping the
+    frames decoded twice: a frame a job decoded in the overlap it reads past
+    its end is dropped when the next job of the same file decoded the same
+    SF, channel and payload there within DUPLICATE_TOLERANCE_S. Each frame of
+    the next job stands for one copy only, so a payload legitimately repeated
+    (even inside the overlap) keeps all its frames.
+    """
+    by_start = {(job["path"], job["start"]): frames for job, frames in job_frames}
+    merged = []
+    for job, frames in job_frames:
+        following = by_start.get((job["path"], job["end"]), [])
+        overlap_end = job["start"] + job["count"]
+        tolerance = int(DUPLICATE_TOLERANCE_S * job["samp_rate"])
+        unmatched = [frame for frame in following if frame["sample_index"] < overlap_end]
+        for frame in frames:
+            if frame["sample_index"] >= job["end"]:
+                distance = lambda other: abs(other["sample_index"] - frame["sample_index"])
+                copies = [other for other in unmatched
+                          if _frame_key(other) == _frame_key(frame) and distance(other) <= tolerance]
+                if copies:
+                    # The next job owns the frame's start and has it complete
+                    unmatched.remove(min(copies, key=distance))
+                    continue
+            merged.append(frame)
+    merged.sort(key=lambda f: (f["time"], f["file"], f["sample_index"]))
+    return merged
+
+
+def main():
+    # Imported here so the CLI parsers stay in one place without building a flowgraph.
+    from Generic_Decoder import sf_list, offset_list
+
+    parser = ArgumentParser(description="Decode IQ recordings in parallel across CPU cores")
+    parser.add_argument("inputs", nargs="+", help="Recording files, directories or glob patterns")
+    parser.add_argument("--input-format", choices=sorted(FORMATS), default=None,
+                        help="Sample format of raw recordings (default: from the file extension, else cf32)")
+    parser.add_argument("--sample-rate", type=eng_float, default=None,
+                        help="Sample rate in Hz for raw recordings (default: from SigMF metadata)")
+    parser.add_argument("--spreading-factors", type=sf_list, default=[7],
+                        help="Comma separated SFs to decode (default: 7)")
+    parser.add_argument("--channel-offsets", type=offset_list, default=None,
+                        help="Wideband recordings: channel offsets in Hz from the center frequency")
+    parser.add_argument("--channel-spacing", type=eng_float, default=200e3,
+                        help="Channelizer bin spacing in Hz (default: 200e3)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="Worker processes (default: one per CPU core)")
+    parser.add_argument("--chunk-seconds", type=float, default=60.0,
+                        help="Seconds of signal per job before overlap (default: 60)")
+    parser.add_argument("--output", type=str, default="-",
+                        help="Merged JSONL output file, '-' for stdout (default: -)")
+    args = parser.parse_args()
+
+    recordings = find_recordings(args.inputs)
+    if not recordings:
+        print("No recordings found.", file=sys.stderr)
+        sys.exit(1)
+
+    # Overlap chunks by the longest possible frame so no boundary loses one.
+    overlap_seconds = max(time_on_air(sf) for sf in args.spreading_factors) + 0.5
+    jobs = []
+    for path in recordings:
+        path_jobs = plan_chunks(path, args.input_format, args.sample_rate, args.chunk_seconds, overlap_seconds)
+        if not path_jobs:
+            print(f"[WARN] '{path}' holds no samples; skipping it", file=sys.stderr)
+        jobs.extend(path_jobs)
+    if not jobs:
+        print("[ERROR] None of the recordings holds any samples; nothing to decode.", file=sys.stderr)
+        sys.exit(1)
+    decoder_options = dict(
+        spreading_factors=args.spreading_factors,
+        channel_offsets=args.channel_offsets,
+        channel_spacing=args.channel_spacing,
+    )
+    print(f"[INFO] Decoding {len(recordings)} recording(s) as {len(jobs)} job(s) on {args.workers} worker(s)",
+          file=sys.stderr)
+
+    started = time.monotonic()
+    job_frames = []
+    samples = 0
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=context,
+                             initializer=_silence_stdout) as pool:
+        futures = {pool.submit(decode_chunk, job, decoder_options): job for job in jobs}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                frames, job_samples = future.result()
+            except Exception as e:
+                print(f"[ERROR] Job {job['path']}@{job['start']} failed: {e}", file=sys.stderr)
+                continue
+            job_frames.append((job, frames))
+            samples += job_samples
+
+    merged = merge_frames(job_frames)
+    decoded = sum(len(frames) for _, frames in job_frames)
+    out = sys.stdout if args.output == "-" else open(args.output, "w")
+    try:
+        for frame in merged:
+            out.write(json.dumps(jsonable(frame)) + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    elapsed = time.monotonic() - started
+    print(f"[INFO] {len(merged)} frames ({decoded - len(merged)} overlap duplicates dropped) from "
+          f"{samples} samples in {elapsed:.2f} s ({samples / elapsed:.0f} samples/s)", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
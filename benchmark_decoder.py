@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#
+# SPDX-License-Identifier: GPL-3.0
+#
+# End-to-end LoRa decode benchmark. Synthetic frames are generated with the
+# gr-lora_sdr TX chain, impaired with AWGN and a carrier offset, written to a
+# cf32 capture and replayed through the same RX graph Generic_Decoder builds.
+# Every scenario prints one JSON result line (packets/s, samples/s, CPU per
+# frame, frame error rate and decode latency).
+#
+# Usage:
+#   python3 benchmark_decoder.py --sf 7,9 --snr 10,0,-5 --sample-rate 125e3,250e3,1e6 --output run.jsonl
+#   python3 benchmark_decoder.py --sf 7 --compare run.jsonl
+#   python3 benchmark_decoder.py --activity-gate off,chirp --snr 10,0,-5,-10 --gap 2
+
+import os
+import sys
+import json
+import time
+import bisect
+import socket
+import tempfile
+import itertools
+from argparse import ArgumentParser, ArgumentTypeError
+
+import numpy as np
+import pmt
+from gnuradio import blocks, gr
+import gnuradio.lora_sdr as lora_sdr
+
+from activity_gate import GATE_MODES
+from frame_tagger import frame_collector
+from lora_timing import time_on_air
+
+# Scenario fields that identify a result when comparing runs
+SCENARIO_KEYS = ("sf", "cr", "payload_len", "snr_db", "cfo_hz", "samp_rate", "throttle", "activity_gate", "gap_s")
+# Values of keys added later, for results files written before they existed
+SCENARIO_DEFAULTS = {"activity_gate": None, "gap_s": 0.05}
+# LoRa bandwidth of the synthetic traffic
+BANDWIDTH = 125000
+
+
+def _float_list(value):
+    return [float(item) for item in value.split(",") if item.strip()]
+
+
+def _sample_rate_list(value):
+    rates = _float_list(value)
+    for rate in rates:
+        # lora_rx oversamples by int(samp_rate / bw); anything else would be decoded at a truncated rate
+        if rate <= 0 or rate % BANDWIDTH:
+            raise ArgumentTypeError(f"Sample rate {rate:g} is not a multiple of the {BANDWIDTH} Hz bandwidth")
+    return rates
+
+
+def _int_list(value):
+    return [int(item) for item in value.split(",") if item.strip()]
+
+
+def _gate_list(value):
+    modes = [item.strip() for item in value.split(",") if item.strip()]
+    for mode in modes:
+        if mode != "off" and mode not in GATE_MODES:
+            raise ArgumentTypeError(f"Unknown activity gate '{mode}'. Choose from: off, {', '.join(GATE_MODES)}")
+    return [None if mode == "off" else mode for mode in modes]
+
+
+class lora_tx_capture(gr.top_block):
+    """gr-lora_sdr TX chain writing frames separated by gap_samples zeros to a file."""
+    def __init__(self, path, samp_rate, sf, cr, bw=BANDWIDTH, gap_samples=0):
+        gr.top_block.__init__(self, "LoRa TX capture", catch_exceptions=True)
+        self.lora_tx_0 = lora_sdr.lora_sdr_lora_tx(
+            bw=bw,
+            cr=cr,
+            has_crc=True,
+            impl_head=False,
+            samp_rate=int(samp_rate),
+            sf=sf,
+            ldro_mode=2,
+            frame_zero_padd=int(gap_samples),
+            sync_word=[0x12]
+        )
+        self.blocks_file_sink_0 = blocks.file_sink(gr.sizeof_gr_complex, path, False)
+        self.connect((self.lora_tx_0, 0), (self.blocks_file_sink_0, 0))
+
+    def send(self, payload):
+        self.lora_tx_0.lora_sdr_whitening_0.to_basic_block()._post(pmt.intern("msg"), pmt.intern(payload))
+
+
+def make_payloads(n_frames, payload_len):
+    """Distinct printable payloads; the first digits carry the sequence number."""
+    filler = "abcdefghijklmnopqrstuvwxyz"
+    payloads = []
+    for seq in range(n_frames):
+        text = f"{seq:06d}" + filler * (payload_len // len(filler) + 1)
+        payloads.append(text[:payload_len])
+    return payloads
+
+
+def synthesize_capture(path, sf, cr, payload_len, n_frames, snr_db, cfo_hz, samp_rate,
+                       bw=BANDWIDTH, gap_s=0.05, seed=0):
+    """
+    Writes a capture of n_frames frames (noise in between) to path and returns
+    the sent payloads with the sample index at which each frame ends.
+    """
+    payloads = make_payloads(n_frames, payload_len)
+    gap_samples = int(gap_s * samp_rate)
+    raw_path = path + ".tx"
+    tx = lora_tx_capture(raw_path, samp_rate, sf, cr, bw, gap_samples)
+    tx.start()
+    for payload in payloads:
+        tx.send(payload)
+    # The TX chain idles (rather than finishing) once every frame is out, so
+    # wait until the file sink has seen the expected amount and stopped growing.
+    expected = int(n_frames * (time_on_air(sf, bw, payload_len, cr) * samp_rate + gap_samples) * 0.95)
+    last, stable_since = -1, time.monotonic()
+    while True:
+        time.sleep(0.2)
+        written = tx.blocks_file_sink_0.nitems_read(0)
+        if written != last:
+            last, stable_since = written, time.monotonic()
+        elif written >= expected and time.monotonic() - stable_since > 1.0:
+            break
+        elif time.monotonic() - stable_since > 30.0:
+            break
+    tx.stop()
+    tx.wait()
+
+    signal = np.fromfile(raw_path, dtype=np.complex64)
+    os.remove(raw_path)
+    active = np.abs(signal) > 0
+    signal_power = float(np.mean(np.abs(signal[active]) ** 2)) if active.any() else 1.0
+
+    # Frame ends: last non-zero sample before each run of gap zeros
+    edges = np.flatnonzero(np.diff(active.astype(np.int8)) == -1)
+    frame_ends = [int(edge) + 1 for edge in edges]
+    if active.any() and active[-1]:
+        frame_ends.append(len(signal))
+
+    rng = np.random.default_rng(seed)
+    lead = gap_samples
+    capture = np.zeros(lead + len(signal) + gap_samples, dtype=np.complex64)
+    capture[lead:lead + len(signal)] = signal
+    if cfo_hz:
+        t = np.arange(len(capture)) / samp_rate
+        capture *= np.exp(2j * np.pi * cfo_hz * t).astype(np.complex64)
+    # SNR is defined in the LoRa bandwidth, so spread the noise over samp_rate
+    noise_power = signal_power * (samp_rate / bw) / (10 ** (snr_db / 10))
+    noise = rng.standard_normal((len(capture), 2)).astype(np.float32) * np.sqrt(noise_power / 2)
+    capture += noise.view(np.complex64)[:, 0]
+
+    capture.tofile(path)
+
+    return {
+        "payloads": payloads[:len(frame_ends)],
+        "frame_ends": [end + lead for end in frame_ends],
+        "samples": len(capture),
+    }
+
+
+def _percentile(values, q):
+    return float(np.percentile(values, q)) if values else None
+
+
+def decode_capture(path, samp_rate, spreading_factors, sent, throttle=False, **decoder_options):
+    """Replays a synthesized capture through Generic_Decoder and scores the result."""
+    from Generic_Decoder import Generic_Decoder
+
+    tb = Generic_Decoder(samp_rate=samp_rate, input_file=path, throttle=throttle,
+                         spreading_factors=spreading_factors, output=None, print_rx=False,
+                         **decoder_options)
+    collector = frame_collector()
+    for branch in tb.lora_rx_branches:
+        tb.msg_connect((branch.tagger, 'out'), (collector, 'in'))
+    source = tb.iq_file_source_0
+    source.emit_times = []
+
+    cpu_start = time.process_time()
+    wall_start = time.monotonic()
+    tb.run()
+    wall = time.monotonic() - wall_start
+    cpu = time.process_time() - cpu_start
+
+    expected = {payload.encode("latin-1"): index for index, payload in enumerate(sent["payloads"])}
+    emitted_positions = [position for position, _ in source.emit_times]
+    decoded, latencies = set(), []
+    for record in collector.records:
+        index = expected.get(record["payload"])
+        if index is None or index in decoded:
+            continue
+        decoded.add(index)
+        # Latency: from the moment the frame's last sample left the source
+        # until its record came out of the RX chain.
+        slot = bisect.bisect_left(emitted_positions, sent["frame_ends"][index])
+        if slot < len(source.emit_times):
+            latencies.append(record["rx_time"] - source.emit_times[slot][1])
+
+    n_sent = len(sent["payloads"])
+    gates = [gate for _, gate in tb.activity_gates.values()]
+    gated_in = sum(gate.samples_in for gate in gates)
+    return {
+        "frames_sent": n_sent,
+        "frames_decoded": len(decoded),
+        "frame_error_rate": round(1 - len(decoded) / n_sent, 4) if n_sent else None,
+        "wall_s": round(wall, 4),
+        "cpu_s": round(cpu, 4),
+        "samples_per_s": round(source.samples_produced / wall, 1) if wall else None,
+        "packets_per_s": round(len(decoded) / wall, 2) if wall else None,
+        "cpu_per_frame_ms": round(cpu / len(decoded) * 1e3, 3) if decoded else None,
+        "latency_ms_p50": _round_ms(_percentile(latencies, 50)),
+        "latency_ms_p99": _round_ms(_percentile(latencies, 99)),
+        "latency_ms_max": _round_ms(max(latencies) if latencies else None),
+        # Share of the channel samples lora_rx actually demodulated
+        "gate_pass_fraction": round(sum(gate.samples_passed for gate in gates) / gated_in, 4) if gated_in else None,
+        "gate_openings": sum(gate.openings for gate in gates) if gates else None,
+    }
+
+
+def _round_ms(seconds):
+    return None if seconds is None else round(seconds * 1e3, 3)
+
+
+def run_scenario(scenario, workdir, n_frames, seed=0):
+    capture = os.path.join(workdir, "capture.cf32")
+    sent = synthesize_capture(capture, scenario["sf"], scenario["cr"], scenario["payload_len"], n_frames,
+                              scenario["snr_db"], scenario["cfo_hz"], scenario["samp_rate"],
+                              gap_s=scenario["gap_s"], seed=seed)
+    try:
+        metrics = decode_capture(capture, scenario["samp_rate"], [scenario["sf"]], sent,
+                                 throttle=scenario["throttle"], activity_gate_mode=scenario["activity_gate"])
+    finally:
+        os.remove(capture)
+    return dict(scenario, **metrics)
+
+
+def run_info():
+    return {
+        "host": socket.gethostname(),
+        "cpu_count": os.cpu_count(),
+        "gnuradio": gr.version(),
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def compare(results, baseline_path):
+    """Prints throughput and FER changes against a previous results file."""
+    with open(baseline_path) as baseline_file:
+        baseline = {}
+        for line in baseline_file:
+            if line.strip():
+                previous = json.loads(line)
+                baseline[tuple(previous.get(key, SCENARIO_DEFAULTS.get(key)) for key in SCENARIO_KEYS)] = previous
+    for result in results:
+        previous = baseline.get(tuple(result.get(key) for key in SCENARIO_KEYS))
+        label = ", ".join(f"{key}={result[key]}" for key in SCENARIO_KEYS)
+        if previous is None:
+            print(f"{label}: no baseline", file=sys.stderr)
+            continue
+        before, after = previous.get("packets_per_s"), result.get("packets_per_s")
+        change = f"{(after - before) / before * 100:+.1f}%" if before and after is not None else "n/a"
+        print(f"{label}: packets/s {before} -> {after} ({change}), "
+              f"CPU {previous.get('cpu_s')} -> {result.get('cpu_s')} s, "
+              f"FER {previous.get('frame_error_rate')} -> {result.get('frame_error_rate')}", file=sys.stderr)
+
+
+def main():
+    parser = ArgumentParser(description="End-to-end LoRa decode benchmark with synthetic traffic")
+    parser.add_argument("--sf", type=_int_list, default=[7], help="Spreading factors (default: 7)")
+    parser.add_argument("--cr", type=_int_list, default=[1], help="Coding rates 1-4 (default: 1)")
+    parser.add_argument("--payload-len", type=_int_list, default=[16], help="Payload sizes in bytes (default: 16)")
+    parser.add_argument("--snr", type=_float_list, default=[10.0], help="In-band SNRs in dB (default: 10)")
+    parser.add_argument("--cfo", type=_float_list, default=[0.0], help="Carrier offsets in Hz (default: 0)")
+    parser.add_argument("--sample-rate", type=_sample_rate_list, default=[125e3, 250e3],
+                        help="Sample rates in Hz, multiples of the 125 kHz bandwidth (default: 125e3,250e3)")
+    parser.add_argument("--gap", type=_float_list, default=[0.05],
+                        help="Idle seconds between frames (default: 0.05; long gaps show what an activity gate saves)")
+    parser.add_argument("--activity-gate", type=_gate_list, default=[None],
+                        help=f"Activity gate modes to compare: off, {', '.join(GATE_MODES)} (default: off)")
+    parser.add_argument("--frames", type=int, default=50, help="Frames per scenario (default: 50)")
+    parser.add_argument("--throttle", action="store_true",
+                        help="Replay at real time, so latency reflects live operation (default: as fast as possible)")
+    parser.add_argument("--seed", type=int, default=0, help="Noise seed (default: 0)")
+    parser.add_argument("--output", type=str, default="-", help="JSONL results file, '-' for stdout (default: -)")
+    parser.add_argument("--compare", type=str, default=None, help="Previous results file to compare against")
+    args = parser.parse_args()
+
+    info = run_info()
+    out = sys.stdout if args.output == "-" else open(args.output, "w")
+    results = []
+    try:
+        with tempfile.TemporaryDirectory(prefix="lora-bench-") as workdir:
+            for sf, cr, payload_len, snr_db, cfo_hz, samp_rate, gate, gap_s in itertools.product(
+                    args.sf, args.cr, args.payload_len, args.snr, args.cfo, args.sample_rate,
+                    args.activity_gate, args.gap):
+                scenario = {"sf": sf, "cr": cr, "payload_len": payload_len, "snr_db": snr_db,
+                            "cfo_hz": cfo_hz, "samp_rate": samp_rate, "throttle": args.throttle,
+                            "activity_gate": gate, "gap_s": gap_s}
+                print(f"[INFO] Running {scenario}", file=sys.stderr)
+                result = dict(run_scenario(scenario, workdir, args.frames, args.seed), run=info)
+                results.append(result)
+                out.write(json.dumps(result) + "\n")
+                out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#
+# SPDX-License-Identifier: GPL-3.0
+#
+# Measures the CPU cost of decoding several spreading factors in parallel from
+# one sample stream, as Generic_Decoder does with --spreading-factors.
+#
+# Usage: python3 benchmark_multi_sf.py --spreading-factors 7,8,9,10,11,12 --seconds 20
+
+import os
+import sys
+import json
+import time
+import resource
+from argparse import ArgumentParser
+
+# Performance counters must be switched on before any block is created.
+os.environ.setdefault("GR_CONF_PERFCOUNTERS_ON", "True")
+
+from gnuradio import analog, blocks, gr
+from gnuradio.eng_arg import eng_float
+
+from Generic_Decoder import make_lora_rx, sf_list
+
+
+def branch_work_seconds(rx):
+    """Sums the scheduler work time of every block inside a lora_rx hier block."""
+    total_ticks = 0.0
+    for child in vars(rx).values():
+        if hasattr(child, "pc_work_time_total"):
+            total_ticks += child.pc_work_time_total()
+    return total_ticks / gr.high_res_timer_tps()
+
+
+class multi_sf_bench(gr.top_block):
+    def __init__(self, spreading_factors, samp_rate, nsamples):
+        gr.top_block.__init__(self, "Multi-SF benchmark", catch_exceptions=True)
+        self.source = analog.noise_source_c(analog.GR_GAUSSIAN, 0.1, 0)
+        self.head = blocks.head(gr.sizeof_gr_complex, nsamples)
+        self.connect(self.source, self.head)
+        self.branches = {}
+        for sf in spreading_factors:
+            rx = make_lora_rx(samp_rate, sf, print_rx=False)
+            self.connect((self.head, 0), (rx, 0))
+            self.branches[sf] = rx
+
+
+def run_once(spreading_factors, samp_rate, seconds):
+    nsamples = int(samp_rate * seconds)
+    tb = multi_sf_bench(spreading_factors, samp_rate, nsamples)
+    cpu_start = time.process_time()
+    wall_start = time.monotonic()
+    tb.run()
+    wall = time.monotonic() - wall_start
+    cpu = time.process_time() - cpu_start
+    return {
+        "spreading_factors": list(spreading_factors),
+        "samp_rate": samp_rate,
+        "samples": nsamples,
+        "wall_s": round(wall, 4),
+        "process_cpu_s": round(cpu, 4),
+        "realtime_factor": round(seconds / wall, 2) if wall else None,
+        "branch_cpu_s": {str(sf): round(branch_work_seconds(rx), 4) for sf, rx in tb.branches.items()},
+    }
+
+
+def main():
+    parser = ArgumentParser(description="CPU per lora_rx branch when decoding several SFs from one stream")
+    parser.add_argument("--spreading-factors", type=sf_list, default=[7, 8, 9, 10, 11, 12],
+                        help="Full SF set; the benchmark runs every prefix of it (default: 7..12)")
+    parser.add_argument("--sample-rate", type=eng_float, default=250e3,
+                        help="Sample rate in Hz (default: 250e3)")
+    parser.add_argument("--seconds", type=float, default=10.0,
+                        help="Seconds of signal pushed through each configuration (default: 10)")
+    parser.add_argument("--json", action="store_true", help="Print one JSON object per configuration")
+    args = parser.parse_args()
+
+    for count in range(1, len(args.spreading_factors) + 1):
+        result = run_once(args.spreading_factors[:count], args.sample_rate, args.seconds)
+        if args.json:
+            print(json.dumps(result))
+            continue
+        per_branch = ", ".join(f"SF{sf}={cpu:.2f}s" for sf, cpu in result["branch_cpu_s"].items())
+        print(f"{count} branch(es): process CPU {result['process_cpu_s']:.2f}s, "
+              f"wall {result['wall_s']:.2f}s ({result['realtime_factor']}x real time); {per_branch}")
+
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"Peak resident memory: {rss_mb:.1f} MB", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#
+# SPDX-License-Identifier: GPL-3.0
+#
+# Measures what the SDR wire format costs between the source and lora_rx:
+# conversion throughput, CPU, bytes moved through the source buffer and peak
+# memory for cf32, cs16 and cs8 at each sample rate. Every configuration runs
+# in its own process so the peak resident memory belongs to it alone.
+#
+# Usage: python3 benchmark_stream_format.py --sample-rate 250e3,1.024e6,2.4e6 --seconds 20
+#        python3 benchmark_stream_format.py --spreading-factors 7,9 --sample-rate 250e3,1e6 --json
+#
+# With lora_rx branches every sample rate must be a multiple of the 125 kHz
+# LoRa bandwidth (lora_rx oversamples by an integer factor).
+
+import sys
+import json
+import time
+import resource
+import subprocess
+from argparse import SUPPRESS, ArgumentParser, ArgumentTypeError
+
+import numpy as np
+from gnuradio import blocks, gr
+
+from Generic_Decoder import make_lora_rx, sf_list
+from stream_format import STREAM_FORMATS, make_converter
+
+
+def _float_list(value):
+    return [float(item) for item in value.split(",") if item.strip()]
+
+
+def _format_list(value):
+    formats = [item.strip() for item in value.split(",") if item.strip()]
+    unknown = [fmt for fmt in formats if fmt not in STREAM_FORMATS]
+    if unknown:
+        raise ArgumentTypeError(f"Unknown stream format(s) {', '.join(unknown)}")
+    return formats
+
+
+class stream_format_bench(gr.top_block):
+    """Repeating wire-format noise -> head -> converter -> null sink (and optional lora_rx branches)."""
+    def __init__(self, fmt, nsamples, samp_rate, spreading_factors=()):
+        gr.top_block.__init__(self, "Stream format benchmark", catch_exceptions=True)
+        rng = np.random.default_rng(0)
+        # A short noise block, repeated, stands in for the Soapy source output
+        n = 65536
+        if fmt == "cf32":
+            noise = (rng.standard_normal(n) + 1j * rng.standard_normal(n)) * 0.1
+            self.source = blocks.vector_source_c(noise.astype(np.complex64).tolist(), True)
+        elif fmt == "cs16":
+            self.source = blocks.vector_source_s(rng.integers(-3000, 3000, 2 * n).tolist(), True, 2)
+        else:
+            self.source = blocks.vector_source_b(rng.integers(0, 256, 2 * n).tolist(), True, 2)
+        self.head = blocks.head(STREAM_FORMATS[fmt][1], nsamples)
+        self.converter = make_converter(fmt)
+        self.sink = blocks.null_sink(gr.sizeof_gr_complex)
+        self.connect(self.source, self.head)
+        complex_out = self.head
+        if self.converter is not None:
+            self.connect(self.head, self.converter)
+            complex_out = self.converter
+        self.connect(complex_out, self.sink)
+        self.branches = [make_lora_rx(samp_rate, sf, print_rx=False) for sf in spreading_factors]
+        for rx in self.branches:
+            self.connect(complex_out, rx)
+
+
+def run_once(fmt, samp_rate, seconds, spreading_factors=()):
+    nsamples = int(samp_rate * seconds)
+    tb = stream_format_bench(fmt, nsamples, samp_rate, spreading_factors)
+    cpu_start = time.process_time()
+    wall_start = time.monotonic()
+    tb.run()
+    wall = time.monotonic() - wall_start
+    cpu = time.process_time() - cpu_start
+    bytes_per_sample = STREAM_FORMATS[fmt][1]
+    return {
+        "format": fmt,
+        "samp_rate": samp_rate,
+        "spreading_factors": list(spreading_factors),
+        "samples": nsamples,
+        "wall_s": round(wall, 4),
+        "process_cpu_s": round(cpu, 4),
+        "samples_per_s": round(nsamples / wall, 1) if wall else None,
+        "realtime_factor": round(seconds / wall, 2) if wall else None,
+        "bytes_per_sample": bytes_per_sample,
+        # Traffic through the source buffer when running live at samp_rate
+        "source_mb_per_s": round(samp_rate * bytes_per_sample / 1e6, 3),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def run_isolated(fmt, samp_rate, seconds, spreading_factors):
+    """run_once in a fresh interpreter, so peak_rss_mb is not inherited from earlier runs."""
+    command = [sys.executable, __file__, "--run-one", "--formats", fmt, "--sample-rate", str(samp_rate),
+               "--seconds", str(seconds)]
+    if spreading_factors:
+        command += ["--spreading-factors", ",".join(str(sf) for sf in spreading_factors)]
+    output = subprocess.run(command, check=True, stdout=subprocess.PIPE, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = ArgumentParser(description="Throughput and memory of the cf32/cs16/cs8 SDR wire formats")
+    parser.add_argument("--formats", type=_format_list, default=list(STREAM_FORMATS),
+                        help=f"Formats to compare (default: {','.join(STREAM_FORMATS)})")
+    parser.add_argument("--sample-rate", type=_float_list, default=[250e3, 1.024e6, 2.4e6],
+                        help="Sample rates in Hz (default: 250e3,1.024e6,2.4e6)")
+    parser.add_argument("--seconds", type=float, default=10.0,
+                        help="Seconds of signal pushed through each configuration (default: 10)")
+    parser.add_argument("--spreading-factors", type=sf_list, default=[],
+                        help="Also feed lora_rx branches for these SFs; needs sample rates that are multiples "
+                             "of 125 kHz (default: conversion only)")
+    parser.add_argument("--json", action="store_true", help="Print one JSON object per configuration")
+    parser.add_argument("--run-one", action="store_true", help=SUPPRESS)
+    args = parser.parse_args()
+    if args.spreading_factors:
+        truncated = [rate for rate in args.sample_rate if rate % 125000]
+        if truncated:
+            parser.error(f"lora_rx branches need sample rates that are multiples of 125 kHz, not "
+                         f"{', '.join(f'{rate:g}' for rate in truncated)}")
+
+    if args.run_one:
+        print(json.dumps(run_once(args.formats[0], args.sample_rate[0], args.seconds, args.spreading_factors)))
+        return
+
+    for samp_rate in args.sample_rate:
+        for fmt in args.formats:
+            result = run_isolated(fmt, samp_rate, args.seconds, args.spreading_factors)
+            if args.json:
+                print(json.dumps(result))
+                continue
+            print(f"{fmt:>5} @ {samp_rate / 1e6:g} MS/s: {result['samples_per_s'] / 1e6:.1f} MS/s "
+                  f"({result['realtime_factor']}x real time), CPU {result['process_cpu_s']:.2f}s, "
+                  f"source buffer traffic {result['source_mb_per_s']:.2f} MB/s, "
+                  f"peak RSS {result['peak_rss_mb']:.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#
+# SPDX-License-Identifier: GPL-3.0
+#
+# Runtime control for a running Generic_Decoder. Clients send one JSON object
+# per line over a local TCP or Unix socket and get one JSON reply per line:
+#
+#   {"cmd": "set_frequency", "value": 433.175e6}
+#   {"cmd": "set_gain", "value": 30}
+#   {"cmd": "reconfigure", "sf": 9, "sync_word": 52, "branches": [0]}
+#   {"cmd": "status"}
+#   {"cmd": "latency", "reset": true}
+#
+# Frequency and gain go straight to the Soapy source; LoRa parameter changes
+# rebuild only the affected lora_rx branches. Replies carry the time the
+# change took in "latency_ms". "latency" returns the per-frame latency
+# histograms (decoder started with --latency-trace), optionally clearing them.
+#
+# Client: python3 control_server.py 127.0.0.1:5557 '{"cmd": "set_frequency", "value": 433.3e6}'
+
+import os
+import sys
+import json
+import time
+import socket
+import threading
+import socketserver
+from argparse import ArgumentParser
+
+# Keys a "reconfigure" command may change (see Generic_Decoder.reconfigure_branches)
+RECONFIGURABLE = ("sf", "bw", "cr", "sync_word", "soft_decoding", "print_rx")
+
+
+def parse_address(address):
+    """'HOST:PORT' or ':PORT' -> (host, port); anything else is a Unix socket path."""
+    host, _, port = address.rpartition(":")
+    if port.isdigit() and "/" not in address:
+        return (host or "127.0.0.1", int(port))
+    return address
+
+
+def _value(command, key="value"):
+    if key not in command:
+        raise ValueError(f"'{command.get('cmd')}' needs a '{key}' field")
+    return float(command[key])
+
+
+def _sync_word(value):
+    return int(value, 0) if isinstance(value, str) else int(value)
+
+
+def execute(tb, command):
+    """Applies one command to the decoder and returns the reply dict."""
+    cmd = command.get("cmd")
+    if cmd == "set_frequency":
+        tb.set_center_freq(_value(command))
+    elif cmd == "set_gain":
+        tb.set_gain(_value(command))
+    elif cmd == "reconfigure":
+        changes = {key: command[key] for key in RECONFIGURABLE if key in command}
+        if not changes:
+            raise ValueError(f"'reconfigure' needs at least one of: {', '.join(RECONFIGURABLE)}")
+        if "sync_word" in changes:
+            changes["sync_word"] = _sync_word(changes["sync_word"])
+        for key in ("sf", "bw", "cr"):
+            if key in changes:
+                changes[key] = int(changes[key])
+        tb.reconfigure_branches(command.get("branches"), **changes)
+    elif cmd == "latency":
+        tracker = getattr(tb, "latency_tracker", None)
+        if tracker is None:
+            raise ValueError("Latency tracing is off (start the decoder with --latency-trace)")
+        snapshot = tracker.snapshot()
+        if command.get("reset"):
+            tracker.reset()
+        return {"ok": True, "latency": snapshot}
+    elif cmd != "status":
+        raise ValueError(f"Unknown command '{cmd}'")
+    return {"ok": True, "status": status(tb)}
+
+
+def status(tb):
+    return {
+        "center_freq": tb.center_freq,
+        "gain": tb.gain,
+        "branches": [
+            {"index": branch.index, "channel": branch.channel, "freq": branch.freq,
+             "sf": branch.sf, "bw": branch.rx_params["bw"], "sync_word": branch.rx_params["sync_word"],
+             "frames": branch.tagger.frame_count, "enabled": branch.enabled}
+            for branch in tb.lora_rx_branches
+        ],
+        "load_shed": tb.load_shedder.status() if getattr(tb, "load_shedder", None) else None,
+        "source_watchdog": tb.source_watchdog.status() if getattr(tb, "source_watchdog", None) else None,
+    }
+
+
+class _TcpServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _UnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+class ControlServer:
+    """Serves control commands for tb on a background thread."""
+    def __init__(self, tb, address):
+        self.tb = tb
+        self.address = parse_address(address)
+        self._lock = threading.Lock()  # one retune at a time
+        self._server = None
+        self._thread = None
+
+    def handle(self, line):
+        started = time.perf_counter()
+        try:
+            command = json.loads(line)
+            with self._lock:
+                reply = execute(self.tb, command)
+        except Exception as e:
+            reply = {"ok": False, "error": str(e)}
+        reply["latency_ms"] = round((time.perf_counter() - started) * 1e3, 3)
+        return reply
+
+    def start(self):
+        control = self
+
+        class CommandHandler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    if not line.strip():
+                        continue
+                    reply = control.handle(line)
+                    self.wfile.write((json.dumps(reply) + "\n").encode("utf-8"))
+
+        try:
+            if isinstance(self.address, tuple):
+                self._server = _TcpServer(self.address, CommandHandler)
+            else:
+                if os.path.exists(self.address):
+                    os.remove(self.address)
+                self._server = _UnixServer(self.address, CommandHandler)
+        except OSError as e:
+            print(f"[WARN] Control interface could not listen on {self.address}: {e}", file=sys.stderr)
+            return
+        self._thread = threading.Thread(target=self._server.serve_forever, name="control-server", daemon=True)
+        self._thread.start()
+        print(f"[INFO] Control interface listening on {self.address}", file=sys.stderr)
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+            if not isinstance(self.address, tuple) and os.path.exists(self.address):
+                os.remove(self.address)
+
+
+def send_command(address, command, timeout=10.0):
+    """Sends one command to a running decoder and returns its reply."""
+    address = parse_address(address)
+    family = socket.AF_INET if isinstance(address, tuple) else socket.AF_UNIX
+    with socket.socket(family, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(address)
+        sock.sendall((json.dumps(command) + "\n").encode("utf-8"))
+        reply = sock.makefile("r").readline()
+    return json.loads(reply)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Send a control command to a running Generic_Decoder")
+    parser.add_argument("address", help="Control address given to --control (HOST:PORT or socket path)")
+    parser.add_argument("command", help='JSON command, e.g. \'{"cmd": "set_gain", "value": 30}\'')
+    args = parser.parse_args()
+    print(json.dumps(send_command(args.address, json.loads(args.command)), indent=2))
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#
+# SPDX-License-Identifier: GPL-3.0
+#
+# Persisted SDR inventory. Discovery (SoapySDR.Device.enumerate, which can
+# wait seconds on network drivers and mDNS) runs only when the stored
+# inventory is older than its TTL or is missing a requested driver; warm
+# restarts select straight from the file. Each device is probed once for
+# its RX capabilities (sample rates, gain and frequency ranges, native
+# sample format).
+#
+# Inventory: python3 device_inventory.py [--driver rtlsdr] [--refresh]
+
+import os
+import sys
+import json
+import time
+import tempfile
+from argparse import ArgumentParser
+
+DEFAULT_PATH = os.environ.get("LORA_DEVICE_INVENTORY",
+                              os.path.join(os.path.expanduser("~"), ".cache", "lora_decode", "devices.json"))
+DEFAULT_TTL_S = 600.0
+
+# Selection policies for select_device
+SELECTION_POLICIES = ("preferred-driver", "first", "max-sample-rate")
+# Order used by 'preferred-driver' (rtlsdr and uhd were always favoured)
+PREFERRED_DRIVERS = ("rtlsdr", "uhd", "hackrf", "lime", "plutosdr")
+
+
+def _kwargs_get(info, key, default=""):
+    # SoapySDRKwargs supports 'in' and [] but not .get()
+    return info[key] if key in info else default
+
+
+def device_args(driver, serial="", addr=""):
+    args = f"driver={driver}"
+    if serial:
+        args += f",serial={serial}"
+    elif addr:
+        args += f",addr={addr}"
+    return args
+
+
+def enumerate_drivers(drivers=None):
+    """
+    Enumerates SoapySDR devices, one targeted enumerate() per driver when
+    drivers is given (so e.g. only rtlsdr is queried), else a full discovery.
+    """
+    import SoapySDR
+
+    found = []
+    for query in (drivers or [""]):
+        results = SoapySDR.Device.enumerate(f"driver={query}" if query else "")
+        for info in results:
+            driver = _kwargs_get(info, "driver", "N/A")
+            serial = _kwargs_get(info, "serial")
+            addr = _kwargs_get(info, "addr")
+            found.append({
+                "driver": driver,
+                "serial": serial,
+                "addr": addr,
+                "label": _kwargs_get(info, "label", f"Unknown SDR {len(found)}"),
+                "device_args": device_args(driver, serial, addr),
+            })
+    return found
+
+
+def _range(soapy_range):
+    return [soapy_range.minimum(), soapy_range.maximum()]
+
+
+def probe_capabilities(args):
+    """Opens the device once and reads its RX channel 0 capabilities."""
+    import SoapySDR
+    from SoapySDR import SOAPY_SDR_RX
+
+    device = SoapySDR.Device(args)
+    try:
+        native_format, full_scale = device.getNativeStreamFormat(SOAPY_SDR_RX, 0)
+        return {
+            "native_format": native_format.lower(),  # e.g. "cs8" for RTL-SDR
+            "full_scale": full_scale,
+            "sample_rates": list(device.listSampleRates(SOAPY_SDR_RX, 0)),
+            "sample_rate_ranges": [_range(r) for r in device.getSampleRateRange(SOAPY_SDR_RX, 0)],
+            "gain_range": _range(device.getGainRange(SOAPY_SDR_RX, 0)),
+            "frequency_ranges": [_range(r) for r in device.getFrequencyRange(SOAPY_SDR_RX, 0)],
+            "antennas": list(device.listAntennas(SOAPY_SDR_RX, 0)),
+        }
+    finally:
+        SoapySDR.Device.unmake(device)
+
+
+def max_sample_rate(device):
+    capabilities = device.get("capabilities") or {}
+    rates = list(capabilities.get("sample_rates", []))
+    rates += [high for _, high in capabilities.get("sample_rate_ranges", [])]
+    return max(rates, default=0.0)
+
+
+def select_device(devices, serial=None, policy="preferred-driver"):
+    """Picks one device by serial if given, else by policy. Returns None if nothing matches."""
+    if serial:
+        return next((device for device in devices if device["serial"] == serial), None)
+    if not devices:
+        return None
+    if policy == "first":
+        return devices[0]
+    if policy == "max-sample-rate":
+        return max(devices, key=max_sample_rate)
+    if policy == "preferred-driver":
+        rank = {driver: i for i, driver in enumerate(PREFERRED_DRIVERS)}
+        return min(devices, key=lambda device: rank.get(device["driver"], len(rank)))
+    raise ValueError(f"Unknown selection policy '{policy}'. Choose one of: {', '.join(SELECTION_POLICIES)}")
+
+
+class DeviceInventory:
+    """The stored device list with a TTL, refreshed per driver on demand."""
+    def __init__(self, path=DEFAULT_PATH, ttl=DEFAULT_TTL_S):
+        self.path = path
+        self.ttl = ttl
+        self.updated = {}  # driver ("*" for a full discovery) -> last enumeration time
+        self.entries = {}  # device_args -> device dict
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path) as inventory_file:
+                stored = json.load(inventory_file)
+        except (OSError, ValueError):
+            return
+        self.updated = stored.get("updated", {})
+        self.entries = {device["device_args"]: device for device in stored.get("devices", [])}
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # A temporary file of its own per save: fleet workers save the same inventory concurrently
+        with tempfile.NamedTemporaryFile("w", dir=directory or ".", prefix=os.path.basename(self.path) + ".",
+                                         suffix=".tmp", delete=False) as inventory_file:
+            try:
+                json.dump({"updated": self.updated, "devices": list(self.entries.values())}, inventory_file, indent=2)
+            except BaseException:
+                inventory_file.close()
+                os.remove(inventory_file.name)
+                raise
+        try:
+            os.replace(inventory_file.name, self.path)
+        except OSError:
+            os.remove(inventory_file.name)
+            raise
+
+    def is_fresh(self, drivers=None):
+        """True if every requested driver (or a full discovery) was enumerated within the TTL."""
+        now = time.time()
+        full = now - self.updated.get("*", 0) < self.ttl
+        if not drivers:
+            return full
+        return all(full or now - self.updated.get(driver, 0) < self.ttl for driver in drivers)
+
+    def devices(self, drivers=None):
+        """Stored devices, limited to drivers if given and to those seen in the last enumeration."""
+        devices = [device for device in self.entries.values() if device.get("present", True)]
+        if drivers:
+            devices = [device for device in devices if device["driver"] in drivers]
+        return devices
+
+    def refresh(self, drivers=None, probe=True):
+        """Re-enumerates (only drivers, if given), probes new devices and saves the inventory."""
+        now = time.time()
+        found = enumerate_drivers(drivers)
+        # Devices of the enumerated drivers that did not show up are kept but marked absent
+        for device in self.entries.values():
+            if not drivers or device["driver"] in drivers:
+                device["present"] = False
+        for device in found:
+            entry = self.entries.setdefault(device["device_args"], {})
+            entry.update(device, last_seen=now, present=True)
+            # Entries probed before the native format was recorded are probed again
+            if probe and "native_format" not in entry.get("capabilities", {}):
+                try:
+                    entry["capabilities"] = probe_capabilities(device["device_args"])
+                except Exception as e:
+                    # Busy (another decoder has it open) or not probeable; try again next refresh
+                    print(f"[WARN] Could not probe '{device['device_args']}': {e}", file=sys.stderr)
+        for driver in (drivers or ["*"]):
+            self.updated[driver] = now
+        self.save()
+        return self.devices(drivers)
+
+    def discover(self, drivers=None, refresh=False, probe=True):
+        """Stored devices when fresh, else a (targeted) refresh."""
+        if not refresh and self.is_fresh(drivers):
+            return self.devices(drivers)
+        return self.refresh(drivers, probe)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Show (and refresh) the stored SDR inventory")
+    parser.add_argument("--driver", action="append", default=None, help="Only this SoapySDR driver; repeatable")
+    parser.add_argument("--refresh", action="store_true", help="Re-enumerate even if the inventory is fresh")
+    parser.add_argument("--ttl", type=float, default=DEFAULT_TTL_S, help=f"Inventory TTL in s (default: {DEFAULT_TTL_S:.0f})")
+    parser.add_argument("--path", type=str, default=DEFAULT_PATH, help=f"Inventory file (default: {DEFAULT_PATH})")
+    args = parser.parse_args()
+    inventory = DeviceInventory(args.path, args.ttl)
+    print(json.dumps(inventory.discover(args.driver, args.refresh), indent=2))
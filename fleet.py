@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#
+# SPDX-License-Identifier: GPL-3.0
+#
+# Fleet mode: starts one Generic_Decoder worker process per SDR that SoapySDR
+# enumerates, pins each to its own CPU cores, restarts workers that die and
+# merges every worker's JSONL frames into one output stream (each record gets
+# a "device" field).
+#
+# The per-device frequency/gain plan is a JSON file. Device entries are keyed
+# by serial number, or by enumeration index for devices without one, and any
+# Generic_Decoder option can be set (underscores for dashes):
+#
+#   {"defaults": {"center_freq": 433.175e6, "gain": 20, "sample_rate": 250e3},
+#    "devices": {"00000001": {"center_freq": 868.1e6, "spreading_factors": [7, 9]},
+#                "1": {"gain": 35, "telemetry_port": 9465}}}
+#
+# Usage: python3 fleet.py --plan fleet.json --output frames.jsonl
+
+import os
+import sys
+import json
+import asyncio
+from argparse import ArgumentParser
+
+from process_streams import StreamingProcess, prefixed_printer, run_all
+
+DECODER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Generic_Decoder.py")
+
+# Set by the fleet itself for every worker
+RESERVED_OPTIONS = ("sdr_dev_string", "input_file", "output", "output_format", "gui")
+
+
+def load_plan(path):
+    if path is None:
+        return {"defaults": {}, "devices": {}}
+    with open(path) as plan_file:
+        plan = json.load(plan_file)
+    for entry in [plan.get("defaults", {}), *plan.get("devices", {}).values()]:
+        reserved = [key for key in entry if key in RESERVED_OPTIONS]
+        if reserved:
+            raise ValueError(f"Plan entries may not set {', '.join(reserved)}; the fleet sets them per worker")
+    return plan
+
+
+def device_options(plan, device):
+    """Plan defaults overlaid with the device's own entry (by serial, then index)."""
+    devices = plan.get("devices", {})
+    options = dict(plan.get("defaults", {}))
+    options.update(devices.get(device["serial"]) or devices.get(str(device["index"])) or {})
+    return options
+
+
+def decoder_arguments(options):
+    """Turns plan options into Generic_Decoder command line arguments."""
+    arguments = []
+    for key, value in options.items():
+        flag = "--" + key.replace("_", "-")
+        if value is True:
+            arguments.append(flag)
+        elif value is False or value is None:
+            continue
+        elif isinstance(value, (list, tuple)):
+            arguments += [flag, ",".join(str(item) for item in value)]
+        else:
+            arguments += [flag, str(value)]
+    return arguments
+
+
+def plan_cores(n_workers, cores=None):
+    """Splits the usable CPU cores into n_workers disjoint sets (shared round-robin if too few)."""
+    if cores is None:
+        cores = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else []
+    if not cores:
+        return [None] * n_workers
+    if n_workers > len(cores):
+        print(f"[WARN] {n_workers} workers but only {len(cores)} cores; workers will share cores.", file=sys.stderr)
+        return [{cores[i % len(cores)]} for i in range(n_workers)]
+    per_worker = len(cores) // n_workers
+    return [set(cores[i * per_worker:(i + 1) * per_worker]) for i in range(n_workers)]
+
+
+def frame_line_handler(name, emit):
+    """
+    stdout callback for a decoder: JSONL frames go to emit() tagged with the
+    device name, anything else is console output and goes to stderr.
+    """
+    log = prefixed_printer(name)
+
+    def handle_line(line):
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        if isinstance(record, dict):
+            emit(dict(record, device=name))
+        elif line:
+            log(line)
+    return handle_line
+
+
+class DecoderWorker(StreamingProcess):
+    """One Generic_Decoder process for one SDR, pinned to its cores."""
+    def __init__(self, device, options, emit, cores=None):
+        name = device["serial"] or f"sdr{device['index']}"
+        if options.get("store") and not options.get("store_device"):
+            # Workers sharing one frame store are told apart (and deduplicated) by device name
+            options = dict(options, store_device=name)
+        self.device = device
+        self.options = options
+        self.cores = cores
+        command = [sys.executable, "-u", DECODER_SCRIPT,
+                   "--sdr-dev-string", device["device_args"],
+                   "--output", "-", "--output-format", "jsonl",
+                   *decoder_arguments(options)]
+        StreamingProcess.__init__(self, name, command, frame_line_handler(name, emit), prefixed_printer(name),
+                                  preexec_fn=self._pin if cores else None)
+
+    def _pin(self):
+        # Runs in the child between fork and exec; every decoder thread inherits it
+        os.sched_setaffinity(0, self.cores)
+
+    async def run(self):
+        print(f"[INFO] Starting worker {self.name} ({self.device['device_args']}) on cores "
+              f"{sorted(self.cores) if self.cores else 'any'}", file=sys.stderr)
+        return await StreamingProcess.run(self)
+
+
+class FrameAggregator:
+    """Single writer for the merged frame stream ('-' for stdout)."""
+    def __init__(self, path="-"):
+        self.handle = sys.stdout if path == "-" else open(path, "a")
+        self.frames = 0
+
+    def emit(self, record):
+        # Called from the event loop only, so lines never interleave
+        self.handle.write(json.dumps(record) + "\n")
+        self.handle.flush()
+        self.frames += 1
+
+    def close(self):
+        if self.handle is not sys.stdout:
+            self.handle.close()
+
+
+def build_workers(devices, plan, emit, pin=True):
+    cores = plan_cores(len(devices)) if pin else [None] * len(devices)
+    return [DecoderWorker(device, device_options(plan, device), emit, worker_cores)
+            for device, worker_cores in zip(devices, cores)]
+
+
+def main():
+    parser = ArgumentParser(description="Run one supervised LoRa decoder per connected SDR")
+    parser.add_argument("--plan", type=str, default=None,
+                        help="JSON frequency/gain plan per device serial or index (default: decoder defaults)")
+    parser.add_argument("--output", type=str, default="-",
+                        help="Merged JSONL frame output, '-' for stdout (default: -)")
+    parser.add_argument("--no-pin", action="store_true", help="Do not pin workers to separate CPU cores")
+    parser.add_argument("--restart-delay", type=float, default=1.0,
+                        help="Initial delay before restarting a dead worker, doubled per crash (default: 1 s)")
+    parser.add_argument("--driver", action="append", default=None,
+                        help="Only run workers for this SoapySDR driver (e.g. rtlsdr); repeatable")
+    parser.add_argument("--refresh-devices", action="store_true",
+                        help="Re-discover SDRs instead of using the stored device inventory")
+    parser.add_argument("--dry-run", action="store_true", help="Print the worker commands and exit")
+    args = parser.parse_args()
+
+    from sdr_manager import SDRManager
+
+    plan = load_plan(args.plan)
+    devices = SDRManager().enumerate_devices(args.driver, args.refresh_devices)
+    if not devices:
+        print("NO_SDR_DEVICES_FOUND")
+        sys.exit(1)
+
+    aggregator = FrameAggregator("-" if args.dry_run else args.output)
+    workers = build_workers(devices, plan, aggregator.emit, pin=not args.no_pin)
+    for worker in workers:
+        print(f"FLEET_WORKER:{worker.name}:{' '.join(worker.command)}", file=sys.stderr)
+    if args.dry_run:
+        return
+
+    try:
+        asyncio.run(run_all(workers, restart=True, restart_delay=args.restart_delay))
+    finally:
+        aggregator.close()
+    print(f"[INFO] Fleet stopped: {aggregator.frames} frames, "
+          f"{sum(worker.restarts for worker in workers)} worker restarts", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#
+# SPDX-License-Identifier: GPL-3.0
+#
+# Publishes decoded LoRa frames to local consumers over ZeroMQ PUB or UDP
+# (unicast or multicast). Every destination has its own bounded queue and
+# sender thread, so a slow consumer only ever loses its own frames and never
+# blocks the flowgraph.
+#
+# Destinations are URIs: tcp://127.0.0.1:5555 or ipc:///tmp/lora.sock for a
+# ZeroMQ PUB socket (needs pyzmq), udp://239.255.76.1:5005 for UDP.
+#
+# Counters are kept per destination URI, not per subscriber: UDP has no
+# notion of subscribers, and a PUB socket does not say which one lost what.
+# 'dropped' counts frames the destination queue overflowed on, 'send_errors'
+# frames the transport refused. A ZeroMQ PUB socket discards frames for a
+# subscriber whose queue is at the high-water mark without telling the
+# sender, so those losses appear in neither counter; raise --publish-queue
+# (also the socket's SNDHWM) for slow subscribers.
+#
+# Loopback check: python3 frame_publisher.py listen udp://239.255.76.1:5005
+
+import sys
+import json
+import socket
+import struct
+import threading
+import collections
+from argparse import ArgumentParser
+from urllib.parse import urlparse
+
+import pmt
+from gnuradio import gr
+
+from packet_sink import jsonable, make_record
+
+DROP_POLICIES = ("drop-oldest", "drop-newest")
+
+
+def is_multicast(address):
+    return 224 <= socket.inet_aton(socket.gethostbyname(address))[0] <= 239
+
+
+class UdpTransport:
+    def __init__(self, host, port):
+        self.address = (socket.gethostbyname(host), port)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if is_multicast(self.address[0]):
+            # Multicast: stay on this host, and let local listeners hear it
+            self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+            self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+
+    def send(self, data):
+        self.sock.sendto(data, self.address)
+
+    def close(self):
+        self.sock.close()
+
+
+class ZmqTransport:
+    def __init__(self, endpoint, high_water_mark):
+        try:
+            import zmq
+        except ImportError:
+            raise RuntimeError("ZeroMQ destinations need pyzmq (pip install pyzmq)")
+        self._zmq = zmq
+        self.context = zmq.Context.instance()
+        self.sock = self.context.socket(zmq.PUB)
+        self.sock.setsockopt(zmq.SNDHWM, high_water_mark)
+        self.sock.setsockopt(zmq.LINGER, 0)
+        self.sock.bind(endpoint)
+
+    def send(self, data):
+        # PUB never blocks: at a subscriber's HWM the frame is discarded
+        # silently (uncounted, see module comment)
+        self.sock.send(data, self._zmq.NOBLOCK)
+
+    def close(self):
+        self.sock.close()
+
+
+def open_transport(uri, queue_size):
+    parsed = urlparse(uri)
+    if parsed.scheme == "udp":
+        return UdpTransport(parsed.hostname, parsed.port)
+    if parsed.scheme in ("tcp", "ipc", "inproc"):
+        return ZmqTransport(uri, queue_size)
+    raise ValueError(f"Unsupported publish destination '{uri}' (use udp://, tcp:// or ipc://)")
+
+
+class Destination:
+    """A bounded queue of encoded frames drained by one sender thread."""
+    def __init__(self, uri, queue_size=1024, policy="drop-oldest"):
+        if policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy '{policy}'. Choose one of: {', '.join(DROP_POLICIES)}")
+        self.uri = uri
+        self.queue_size = queue_size
+        self.policy = policy
+        self.transport = open_transport(uri, queue_size)
+        self.pending = collections.deque()
+        self.condition = threading.Condition()
+        self.sent = 0
+        self.dropped = 0  # queue overflow
+        self.send_errors = 0  # transport errors; disjoint from dropped
+        self.tracker = None  # latency_trace.LatencyTracker, set by frame_publisher
+        self._running = False
+        self._thread = None
+
+    def offer(self, data, record=None):
+        """Queues data (encoded from record) without ever blocking; applies the drop policy when full."""
+        with self.condition:
+            if len(self.pending) >= self.queue_size:
+                self.dropped += 1
+                if self.policy == "drop-newest":
+                    return
+                self.pending.popleft()
+            self.pending.append((data, record))
+            self.condition.notify()
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=f"publisher-{self.uri}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self.condition:
+            self._running = False
+            self.condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.transport.close()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while self._running and not self.pending:
+                    self.condition.wait()
+                if not self.pending:
+                    return
+                data, record = self.pending.popleft()
+            try:
+                self.transport.send(data)
+                self.sent += 1
+                if self.tracker is not None and record is not None:
+                    self.tracker.written([record], self.uri)
+            except Exception:
+                self.send_errors += 1
+
+    def stats(self):
+        return {"sent": self.sent, "dropped": self.dropped, "send_errors": self.send_errors,
+                "queued": len(self.pending)}
+
+
+class frame_publisher(gr.basic_block):
+    """
+    Message sink that encodes each frame PDU once as JSON and hands it to every
+    destination's queue.
+    """
+    def __init__(self, destinations, queue_size=1024, policy="drop-oldest"):
+        gr.basic_block.__init__(self, name="frame_publisher", in_sig=None, out_sig=None)
+        self.destinations = [Destination(uri, queue_size, policy) for uri in destinations]
+        self.frames_received = 0
+
+        self.message_port_register_in(pmt.intern("in"))
+        self.set_msg_handler(pmt.intern("in"), self.handle_frame)
+
+    def handle_frame(self, msg):
+        self.frames_received += 1
+        record = make_record(msg)
+        data = json.dumps(jsonable(record)).encode("utf-8")
+        for destination in self.destinations:
+            destination.offer(data, record)
+
+    def set_tracker(self, tracker):
+        """Reports every sent frame to tracker, with the destination URI as the sink name."""
+        for destination in self.destinations:
+            destination.tracker = tracker
+
+    def start(self):
+        for destination in self.destinations:
+            destination.start()
+        return True
+
+    def stop(self):
+        for destination in self.destinations:
+            destination.stop()
+        return True
+
+    def stats(self):
+        """Per-destination send/drop counters (per URI; see module comment)."""
+        return {destination.uri: destination.stats() for destination in self.destinations}
+
+
+def listen(uri):
+    """Prints frames received from a publisher destination (for loopback checks)."""
+    parsed = urlparse(uri)
+    if parsed.scheme == "udp":
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(("", parsed.port))
+        if is_multicast(parsed.hostname):
+            membership = struct.pack("4s4s", socket.inet_aton(parsed.hostname), socket.inet_aton("0.0.0.0"))
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+        receive = lambda: sock.recv(65535)
+    else:
+        import zmq
+        sock = zmq.Context.instance().socket(zmq.SUB)
+        sock.setsockopt(zmq.SUBSCRIBE, b"")
+        sock.connect(uri)
+        receive = sock.recv
+    print(f"Listening for frames on {uri} ...", file=sys.stderr)
+    while True:
+        print(receive().decode("utf-8"), flush=True)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Frame publisher utilities")
+    parser.add_argument("command", choices=["listen"], help="'listen' prints frames from a destination")
+    parser.add_argument("uri", help="Destination URI, e.g. udp://239.255.76.1:5005 or tcp://127.0.0.1:5555")
+    args = parser.parse_args()
+    try:
+        listen(args.uri)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#
+# SPDX-License-Identifier: GPL-3.0
+#
+# Persistent, indexed frame store. Decoded frames go into a SQLite database
+# in WAL mode: the frame_store block is a packet_sink whose background
+# thread inserts each batch in one transaction, so the flowgraph never waits
+# on the disk. Several decoders (fleet workers) can share one database file.
+#
+# Indexed by receive time, SDR device, frequency/SF and the LoRaWAN DevAddr
+# of data frames. A frame already stored within dedupe_window seconds (the
+# same payload heard on another channel or SDR) is not stored again; the
+# stored row's copies counter goes up instead.
+#
+# Query: python3 frame_store.py frames.db --last 3600 --device 00000001 --sf 7
+#        python3 frame_store.py frames.db --dev-addr 26011BDA --format table
+#        python3 frame_store.py frames.db --stats
+
+import os
+import sys
+import json
+import time
+import hashlib
+import sqlite3
+from datetime import datetime
+from argparse import ArgumentParser
+
+from packet_sink import packet_sink
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS frames (
+    id INTEGER PRIMARY KEY,
+    rx_time REAL NOT NULL,
+    device TEXT,
+    channel INTEGER,
+    freq REAL,
+    sf INTEGER,
+    bw INTEGER,
+    cr INTEGER,
+    crc_ok INTEGER,
+    snr REAL,
+    sample_index INTEGER,
+    dev_addr TEXT,
+    payload_hash BLOB NOT NULL,
+    payload BLOB NOT NULL,
+    copies INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS frames_rx_time ON frames (rx_time);
+CREATE INDEX IF NOT EXISTS frames_device ON frames (device, rx_time);
+CREATE INDEX IF NOT EXISTS frames_freq_sf ON frames (freq, sf, rx_time);
+CREATE INDEX IF NOT EXISTS frames_dev_addr ON frames (dev_addr, rx_time);
+CREATE INDEX IF NOT EXISTS frames_payload_hash ON frames (payload_hash, rx_time);
+"""
+
+COLUMNS = ("id", "rx_time", "device", "channel", "freq", "sf", "bw", "cr", "crc_ok", "snr",
+           "sample_index", "dev_addr", "payload", "copies")
+QUERY_FORMATS = ("jsonl", "table")
+
+# LoRaWAN MType values of data frames (unconfirmed/confirmed, up/down)
+LORAWAN_DATA_MTYPES = (2, 3, 4, 5)
+
+
+def lorawan_dev_addr(payload):
+    """DevAddr (8 hex digits, as usually written) of a LoRaWAN data frame, else None."""
+    # MHDR, FHDR (DevAddr, FCtrl, FCnt) and MIC at least
+    if len(payload) < 12:
+        return None
+    mhdr = payload[0]
+    if mhdr >> 5 not in LORAWAN_DATA_MTYPES or mhdr & 0x3:
+        return None
+    return payload[1:5][::-1].hex().upper()
+
+
+def payload_key(payload):
+    return hashlib.blake2b(payload, digest_size=8).digest()
+
+
+class FrameStore:
+    """packet_sink writer inserting record batches into the SQLite store at path."""
+    def __init__(self, path, device=None, dedupe_window=2.0, busy_timeout=10.0):
+        self.path = path
+        self.device = device  # for records that do not carry a "device" field
+        self.dedupe_window = dedupe_window
+        self.busy_timeout = busy_timeout
+        self.connection = None
+        self.frames_stored = 0
+        self.duplicates = 0
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Opened on the writer thread and closed from stop(), never used concurrently
+        self.connection = sqlite3.connect(self.path, timeout=self.busy_timeout, check_same_thread=False,
+                                          isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        # WAL commits stay atomic with NORMAL; only the last transactions can be lost on power failure
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+
+    def _insert(self, cursor, record):
+        payload = record["payload"]
+        key = payload_key(payload)
+        rx_time = record["rx_time"]
+        if self.dedupe_window:
+            duplicate = cursor.execute(
+                "SELECT id FROM frames WHERE payload_hash = ? AND rx_time BETWEEN ? AND ? LIMIT 1",
+                (key, rx_time - self.dedupe_window, rx_time + self.dedupe_window)).fetchone()
+            if duplicate:
+                cursor.execute("UPDATE frames SET copies = copies + 1 WHERE id = ?", duplicate)
+                self.duplicates += 1
+                return
+        crc_ok = record.get("crc_ok")
+        cursor.execute(
+            "INSERT INTO frames (rx_time, device, channel, freq, sf, bw, cr, crc_ok, snr, sample_index, "
+            "dev_addr, payload_hash, payload) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (rx_time, record.get("device", self.device), record.get("channel"), record.get("freq"),
+             record.get("sf"), record.get("bw"), record.get("cr"), None if crc_ok is None else int(crc_ok),
+             record.get("snr"), record.get("sample_index"), lorawan_dev_addr(payload), key, payload))
+        self.frames_stored += 1
+
+    def write_batch(self, records):
+        """Inserts records in one transaction. Database errors surface as OSError, like the file writer's."""
+        try:
+            if self.connection is None:
+                self._open()
+            cursor = self.connection.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                for record in records:
+                    self._insert(cursor, record)
+                cursor.execute("COMMIT")
+            except BaseException:
+                cursor.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            raise OSError(f"frame store '{self.path}': {e}") from e
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+class frame_store(packet_sink):
+    """Message sink storing frame PDUs in a FrameStore; batching and dropping as in packet_sink."""
+    def __init__(self, path, device=None, dedupe_window=2.0, batch_size=1024, flush_interval=0.2,
+                 queue_size=65536):
+        packet_sink.__init__(self, batch_size=batch_size, flush_interval=flush_interval, queue_size=queue_size,
+                             writer=FrameStore(path, device, dedupe_window))
+        self.sink_name = "frame_store"
+
+
+def parse_time(value):
+    """Unix seconds or an ISO 8601 date/time (local time unless it carries an offset)."""
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+def query(path, since=None, until=None, device=None, freq=None, sf=None, dev_addr=None, crc_ok=None,
+          limit=None):
+    """Stored frames matching every given filter, newest first, as dicts."""
+    clauses, params = [], []
+    for column, value in (("device", device), ("freq", freq), ("sf", sf), ("dev_addr", dev_addr)):
+        if value is not None:
+            clauses.append(f"{column} = ?")
+            params.append(value)
+    if since is not None:
+        clauses.append("rx_time >= ?")
+        params.append(since)
+    if until is not None:
+        clauses.append("rx_time < ?")
+        params.append(until)
+    if crc_ok is not None:
+        clauses.append("crc_ok = ?")
+        params.append(int(crc_ok))
+    sql = f"SELECT {', '.join(COLUMNS)} FROM frames"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY rx_time DESC"
+    if limit:
+        sql += f" LIMIT {int(limit)}"
+    connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        return [dict(zip(COLUMNS, row)) for row in connection.execute(sql, params)]
+    finally:
+        connection.close()
+
+
+def stats(path):
+    """Frame, duplicate and CRC failure counts per device and SF."""
+    connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        rows = connection.execute(
+            "SELECT device, sf, COUNT(*), SUM(copies) - COUNT(*), SUM(crc_ok = 0), MIN(rx_time), MAX(rx_time) "
+            "FROM frames GROUP BY device, sf ORDER BY device, sf").fetchall()
+    finally:
+        connection.close()
+    keys = ("device", "sf", "frames", "duplicates", "crc_failed", "first_rx_time", "last_rx_time")
+    return [dict(zip(keys, row)) for row in rows]
+
+
+def _print_table(rows, file=sys.stdout):
+    for row in rows:
+        stamp = datetime.fromtimestamp(row["rx_time"]).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+        crc = {None: "?", 0: "bad", 1: "ok"}[row["crc_ok"]]
+        print(f"{stamp}  {row['device'] or '-':<16} ch{row['channel']} SF{row['sf']} "
+              f"{(row['freq'] or 0) / 1e6:10.4f} MHz  CRC {crc:<3}  x{row['copies']}  "
+              f"{row['dev_addr'] or '-':<8}  {row['payload'].hex()}", file=file)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Query the decoded frame store")
+    parser.add_argument("path", help="Frame store database")
+    parser.add_argument("--since", type=parse_time, default=None, help="Unix time or ISO date/time")
+    parser.add_argument("--until", type=parse_time, default=None, help="Unix time or ISO date/time")
+    parser.add_argument("--last", type=float, default=None, help="Only the last this many seconds")
+    parser.add_argument("--device", type=str, default=None, help="SDR device (serial or device string)")
+    parser.add_argument("--freq", type=float, default=None, help="Channel frequency in Hz")
+    parser.add_argument("--sf", type=int, default=None, help="Spreading factor")
+    parser.add_argument("--dev-addr", type=str, default=None, help="LoRaWAN DevAddr, 8 hex digits")
+    crc = parser.add_mutually_exclusive_group()
+    crc.add_argument("--crc-ok", dest="crc_ok", action="store_const", const=True, default=None,
+                     help="Only frames with a good CRC")
+    crc.add_argument("--crc-failed", dest="crc_ok", action="store_const", const=False, help="Only CRC failures")
+    parser.add_argument("--limit", type=int, default=100, help="At most this many frames, newest first (default: 100)")
+    parser.add_argument("--format", choices=QUERY_FORMATS, default="jsonl", help="Output format (default: jsonl)")
+    parser.add_argument("--stats", action="store_true", help="Print counts per device and SF instead of frames")
+    args = parser.parse_args()
+
+    if args.stats:
+        for row in stats(args.path):
+            print(json.dumps(row))
+        sys.exit(0)
+    since = time.time() - args.last if args.last else args.since
+    rows = query(args.path, since, args.until, args.device, args.freq, args.sf,
+                 args.dev_addr.upper() if args.dev_addr else None, args.crc_ok, args.limit)
+    if args.format == "table":
+        _print_table(rows)
+    else:
+        for row in rows:
+            print(json.dumps(dict(row, payload=row["payload"].hex())))
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#
+# SPDX-License-Identifier: GPL-3.0
+#
+# Message block that annotates decoded LoRa frames with the parameters of the
+# lora_rx branch that produced them (spreading factor, bandwidth, coding rate,
+# channel) and republishes them as standard GNU Radio PDUs.
+
+import time
+import pmt
+from gnuradio import gr
+
+from lora_timing import symbol_time, time_on_air
+from latency_trace import PREAMBLE_SYMBOLS
+
+
+def is_pdu(msg):
+    """True for (metadata . u8vector) pairs. pmt.is_dict() is true for any pair, so it can't be used here."""
+    return pmt.is_pair(msg) and pmt.is_u8vector(pmt.cdr(msg))
+
+
+def payload_bytes(msg):
+    """Extracts the payload bytes from a lora_rx_chain 'out' PDU, or a stock lora_rx 'out' message."""
+    if is_pdu(msg):
+        msg = pmt.cdr(msg)
+    if pmt.is_u8vector(msg):
+        return bytes(pmt.u8vector_elements(msg))
+    if pmt.is_symbol(msg):
+        # The stock lora_rx's crc_verif publishes the payload as a string symbol
+        return pmt.symbol_to_string(msg).encode("latin-1")
+    return pmt.write_string(msg).encode("utf-8")
+
+
+def crc_status(msg):
+    """CRC result in a lora_rx_chain PDU's metadata; None for frames sent without a CRC (or stock lora_rx)."""
+    if is_pdu(msg) and pmt.is_dict(pmt.car(msg)):
+        for key in ("crc_valid", "crc_ok"):
+            value = pmt.dict_ref(pmt.car(msg), pmt.intern(key), pmt.PMT_NIL)
+            if pmt.is_bool(value):
+                return pmt.to_bool(value)
+    return None
+
+
+def header_position(msg):
+    """(header sample, detection time) in a lora_rx_chain PDU's metadata, or (None, None) without them."""
+    if is_pdu(msg) and pmt.is_dict(pmt.car(msg)):
+        header = pmt.dict_ref(pmt.car(msg), pmt.intern("header_sample"), pmt.PMT_NIL)
+        detect_time = pmt.dict_ref(pmt.car(msg), pmt.intern("detect_time"), pmt.PMT_NIL)
+        if not pmt.is_null(header) and not pmt.is_null(detect_time):
+            return pmt.to_uint64(header), pmt.to_double(detect_time)
+    return None, None
+
+
+def pdu_to_record(msg):
+    """Converts a frame PDU (as published by frame_tagger) into a plain dict."""
+    meta = {}
+    if is_pdu(msg) and not pmt.is_null(pmt.car(msg)):
+        meta = pmt.to_python(pmt.car(msg))
+    record = dict(meta)
+    record["payload"] = payload_bytes(msg)
+    return record
+
+
+class frame_tagger(gr.basic_block):
+    """
+    Receives frames on the 'in' port from one lora_rx branch and publishes a PDU
+    on 'out' whose metadata records which branch decoded it.
+    """
+    def __init__(self, sf=7, bw=125000, cr=1, channel=0, freq=None, samp_rate=None):
+        gr.basic_block.__init__(self, name="frame_tagger", in_sig=None, out_sig=None)
+        self.metadata = {"sf": int(sf), "bw": int(bw), "cr": int(cr), "channel": int(channel)}
+        if freq is not None:
+            self.metadata["freq"] = float(freq)
+        self.samp_rate = samp_rate  # of the lora_rx input
+        self.frame_count = 0
+        self.crc_failed_count = 0
+        # Optional callable mapping a lora_rx input sample index (default: the
+        # current one) to the source sample index; see Generic_Decoder._sample_clock.
+        self.clock = None
+        # Optional latency_trace.LatencyTracker stamping frames with source times
+        self.tracker = None
+
+        self.message_port_register_in(pmt.intern("in"))
+        self.message_port_register_out(pmt.intern("out"))
+        self.set_msg_handler(pmt.intern("in"), self.handle_frame)
+
+    def handle_frame(self, msg):
+        payload = payload_bytes(msg)
+        meta = dict(self.metadata)
+        meta["rx_time"] = time.time()
+        if self.clock is not None:
+            header, detect_time = header_position(msg)
+            if header is not None and self.samp_rate:
+                # The frame ends its header and payload symbols after its preamble
+                sf, bw = meta["sf"], meta["bw"]
+                after_preamble = (time_on_air(sf, bw, len(payload), meta["cr"])
+                                  - PREAMBLE_SYMBOLS * symbol_time(sf, bw))
+                meta["header_index"] = self.clock(header)
+                meta["sample_index"] = self.clock(header + int(after_preamble * self.samp_rate))
+                meta["detect_time"] = detect_time
+            else:
+                meta["sample_index"] = self.clock()
+            if self.tracker is not None:
+                self.tracker.stamp(meta, len(payload))
+        crc_ok = crc_status(msg)
+        if crc_ok is not None:
+            meta["crc_ok"] = crc_ok
+            if not crc_ok:
+                self.crc_failed_count += 1
+        self.frame_count += 1
+        self.message_port_pub(pmt.intern("out"),
+                              pmt.cons(pmt.to_pmt(meta), pmt.init_u8vector(len(payload), list(payload))))
+
+
+class frame_collector(gr.basic_block):
+    """Keeps every frame PDU received on 'in' as a record dict in self.records."""
+    def __init__(self):
+        gr.basic_block.__init__(self, name="frame_collector", in_sig=None, out_sig=None)
+        self.records = []
+        self.message_port_register_in(pmt.intern("in"))
+        self.set_msg_handler(pmt.intern("in"), self.handle_frame)
+
+    def handle_frame(self, msg):
+        self.records.append(pdu_to_record(msg))
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#
+# SPDX-License-Identifier: GPL-3.0
+#
+# Replay source for Generic_Decoder: streams raw IQ recordings (cf32, cs16,
+# cs8, cu8) and SigMF recordings from a memory map instead of an SDR.
+
+import os
+import json
+import time
+from datetime import datetime
+
+import numpy as np
+from gnuradio import gr
+
+# Format name -> (numpy dtype of one stored value, values per complex sample, full-scale value)
+FORMATS = {
+    "cf32": (np.complex64, 1, None),
+    "cs16": (np.int16, 2, 32768.0),
+    "cs8": (np.int8, 2, 128.0),
+    "cu8": (np.uint8, 2, 127.5),
+}
+
+SIGMF_DATATYPES = {
+    "cf32_le": "cf32",
+    "ci16_le": "cs16",
+    "ci8": "cs8",
+    "cu8": "cu8",
+}
+
+
+class Recording:
+    """A memory-mapped IQ recording plus whatever metadata came with it."""
+    def __init__(self, data_path, fmt, sample_rate=None, center_freq=None, start_time=None):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unsupported IQ format '{fmt}'. Choose one of: {', '.join(FORMATS)}")
+        self.data_path = data_path
+        self.fmt = fmt
+        self.sample_rate = sample_rate
+        self.center_freq = center_freq
+        self.start_time = start_time
+
+        dtype, values_per_sample, _ = FORMATS[fmt]
+        value_count = os.path.getsize(data_path) // np.dtype(dtype).itemsize
+        self.num_samples = value_count // values_per_sample
+        # mode='r' maps the file read-only: pages come straight from the page
+        # cache and nothing is read until the flowgraph asks for it.
+        self.values = np.memmap(data_path, dtype=dtype, mode="r",
+                                shape=(self.num_samples * values_per_sample,)) if self.num_samples else np.empty(0, dtype)
+
+
+def _sigmf_paths(path):
+    base, ext = os.path.splitext(path)
+    if ext in (".sigmf-meta", ".sigmf-data"):
+        return base + ".sigmf-meta", base + ".sigmf-data"
+    if os.path.exists(path + ".sigmf-meta"):
+        return path + ".sigmf-meta", path + ".sigmf-data"
+    return None
+
+
+def read_sigmf_meta(path):
+    """Returns the parsed .sigmf-meta for a SigMF recording, or None for raw files."""
+    paths = _sigmf_paths(path)
+    if not paths:
+        return None
+    with open(paths[0]) as meta_file:
+        return json.load(meta_file)
+
+
+def recording_sample_rate(path):
+    """Sample rate stored alongside a recording, if any."""
+    meta = read_sigmf_meta(path)
+    if meta:
+        return meta.get("global", {}).get("core:sample_rate")
+    return None
+
+
+def open_recording(path, fmt=None):
+    """Opens a raw or SigMF recording. Raw formats come from fmt or the file extension."""
+    paths = _sigmf_paths(path)
+    if paths:
+        meta = read_sigmf_meta(path)
+        global_meta = meta.get("global", {})
+        datatype = global_meta.get("core:datatype", "cf32_le")
+        if datatype not in SIGMF_DATATYPES:
+            raise ValueError(f"Unsupported SigMF datatype '{datatype}' in {paths[0]}")
+        captures = meta.get("captures") or [{}]
+        start_time = captures[0].get("core:datetime")
+        if start_time:
+            start_time = datetime.fromisoformat(start_time.replace("Z", "+00:00")).timestamp()
+        return Recording(paths[1], SIGMF_DATATYPES[datatype],
+                         sample_rate=global_meta.get("core:sample_rate"),
+                         center_freq=captures[0].get("core:frequency"),
+                         start_time=start_time)
+
+    if fmt is None:
+        fmt = os.path.splitext(path)[1].lstrip(".").lower()
+        if fmt not in FORMATS:
+            fmt = "cf32"
+    return Recording(path, fmt)
+
+
+class iq_file_source(gr.sync_block):
+    """
+    Streams complex samples from a memory-mapped recording.
+
+    start and count (in samples) select a slice of the file so a large capture
+    can be split across several flowgraphs.
+    """
+    def __init__(self, path, fmt=None, start=0, count=None):
+        gr.sync_block.__init__(self, name="iq_file_source", in_sig=None, out_sig=[np.complex64])
+        self.recording = open_recording(path, fmt)
+        # Not self.start/self.stop: those names are the block's scheduler hooks.
+        self.first_sample = min(int(start), self.recording.num_samples)
+        self.end_sample = self.recording.num_samples
+        if count is not None:
+            self.end_sample = min(self.first_sample + int(count), self.end_sample)
+        self.position = self.first_sample
+        self.samples_produced = 0
+        # Set to a list to record (position, wall time) after every work call;
+        # benchmarks use it to tell when a given sample left the source.
+        self.emit_times = None
+
+        _, self._values_per_sample, full_scale = FORMATS[self.recording.fmt]
+        self._scale = np.float32(1.0 / full_scale) if full_scale else None
+        self._offset = np.float32(127.5) if self.recording.fmt == "cu8" else None
+
+    def work(self, input_items, output_items):
+        out = output_items[0]
+        n = min(len(out), self.end_sample - self.position)
+        if n <= 0:
+            return -1  # WORK_DONE
+
+        values = self.recording.values
+        if self._values_per_sample == 1:
+            out[:n] = values[self.position:self.position + n]
+        else:
+            raw = values[2 * self.position:2 * (self.position + n)]
+            dest = out[:n]
+            dest.real = raw[0::2]
+            dest.imag = raw[1::2]
+            if self._offset is not None:
+                dest -= self._offset * (1 + 1j)
+            dest *= self._scale
+
+        self.position += n
+        self.samples_produced += n
+        if self.emit_times is not None:
+            self.emit_times.append((self.position, time.time()))
+        return n
@@ -0,0 +1,520 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#
+# SPDX-License-Identifier: GPL-3.0
+#
+# Raw IQ capture alongside live decoding. iq_recorder taps the SDR source in
+# its wire format (cs8/cs16/cf32, see stream_format.py) and never blocks the
+# scheduler: work() only copies samples into preallocated, page-aligned
+# buffers, and a writer thread hands full buffers to the disk with large
+# unbuffered writes. If the disk falls behind, whole buffers are dropped and
+# counted instead of back-pressuring the source into overflows.
+#
+# Modes:
+#   continuous - everything is written, in SigMF recordings rotated every
+#                rotate_seconds of samples
+#   trigger    - samples are kept in an in-memory ring; only a window around
+#                each decoded (or CRC-failed) frame is written, one SigMF
+#                recording per window
+# Frames reach the recorder on its 'frames' message port (frame_tagger PDUs)
+# and are stored as SigMF annotations. With max_bytes set, the oldest
+# recordings in the directory are deleted to stay below it.
+#
+# While paused (the SDR is being reopened and a standby stream of zeros
+# feeds the flowgraph, see source_watchdog.py) nothing is recorded: the
+# continuous recording ends at the gap and a new one starts after it, and
+# trigger windows never reach back into it.
+#
+# Disk throughput check: python3 iq_recorder.py /data/iq --sample-rate 2e6 --seconds 30
+
+import os
+import sys
+import json
+import time
+import queue
+import tempfile
+import threading
+import collections
+from datetime import datetime, timezone
+from argparse import ArgumentParser
+
+import numpy as np
+import pmt
+from gnuradio import gr
+
+from frame_tagger import pdu_to_record
+from lora_timing import time_on_air
+from stream_format import STREAM_FORMATS
+
+# Wire format -> (input signature, SigMF datatype)
+RECORDING_FORMATS = {
+    "cf32": (np.complex64, "cf32_le"),
+    "cs16": ((np.int16, 2), "ci16_le"),
+    "cs8": ((np.int8, 2), "ci8"),
+}
+RECORD_MODES = ("continuous", "trigger")
+# Which frames open a trigger window
+RECORD_TRIGGERS = ("all", "crc-failed")
+
+# Buffers (and so every write) are multiples of the page size and start on a page
+PAGE_SIZE = 4096
+
+
+def aligned_buffer(nbytes, alignment=PAGE_SIZE):
+    raw = np.empty(nbytes + alignment, dtype=np.uint8)
+    offset = -raw.ctypes.data % alignment
+    return raw[offset:offset + nbytes]
+
+
+def _sigmf_datetime(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+class SigMFRecording:
+    """One .sigmf-data/.sigmf-meta pair; the meta file is rewritten on close and on late annotations."""
+    def __init__(self, stem, fmt, samp_rate, center_freq, sample_start, start_time):
+        self.data_path = stem + ".sigmf-data"
+        self.meta_path = stem + ".sigmf-meta"
+        self.stem = stem
+        self.fmt = fmt
+        self.item_size = STREAM_FORMATS[fmt][1]
+        self.samp_rate = samp_rate
+        self.center_freq = center_freq
+        self.sample_start = sample_start  # source sample index of the first sample
+        self.start_time = start_time
+        self.samples = 0
+        self.annotations = []
+        self.fd = os.open(self.data_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        self.write_meta()
+
+    @property
+    def sample_end(self):
+        return self.sample_start + self.samples
+
+    def write(self, data):
+        view = memoryview(data)
+        while view:
+            view = view[os.write(self.fd, view):]
+        self.samples += len(data) // self.item_size
+
+    def annotate(self, record, sample_start, sample_count):
+        crc_ok = record.get("crc_ok")
+        annotation = {
+            "core:sample_start": int(sample_start - self.sample_start),
+            "core:sample_count": int(sample_count),
+            "core:label": f"SF{record.get('sf')} CRC {'unknown' if crc_ok is None else 'ok' if crc_ok else 'failed'}",
+            "lora:channel": record.get("channel"),
+            "lora:payload": record["payload"].hex(),
+        }
+        if record.get("freq") is not None:
+            annotation["core:freq_lower_edge"] = record["freq"] - record.get("bw", 125000) / 2
+            annotation["core:freq_upper_edge"] = record["freq"] + record.get("bw", 125000) / 2
+        self.annotations.append(annotation)
+
+    def write_meta(self):
+        meta = {
+            "global": {
+                "core:datatype": RECORDING_FORMATS[self.fmt][1],
+                "core:sample_rate": self.samp_rate,
+                "core:version": "1.0.0",
+                "core:recorder": "LoRa_Decode iq_recorder",
+                "lora:source_sample_start": self.sample_start,
+            },
+            "captures": [{
+                "core:sample_start": 0,
+                "core:frequency": self.center_freq,
+                "core:datetime": _sigmf_datetime(self.start_time),
+            }],
+            "annotations": sorted(self.annotations, key=lambda item: item["core:sample_start"]),
+        }
+        temporary = self.meta_path + ".tmp"
+        with open(temporary, "w") as meta_file:
+            json.dump(meta, meta_file, indent=2)
+        os.replace(temporary, self.meta_path)
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        self.write_meta()
+
+
+class RecordingDirectory:
+    """Names recordings in directory and keeps their total size under max_bytes, evicting oldest first."""
+    def __init__(self, directory, prefix="iq", max_bytes=None):
+        self.directory = directory
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.evicted = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def stem(self, start_time):
+        stamp = datetime.fromtimestamp(start_time, timezone.utc)
+        stem = os.path.join(self.directory, f"{self.prefix}-{stamp:%Y%m%dT%H%M%S}{stamp.microsecond // 1000:03d}Z")
+        candidate, suffix = stem, 1
+        while os.path.exists(candidate + ".sigmf-data"):
+            candidate, suffix = f"{stem}-{suffix}", suffix + 1
+        return candidate
+
+    def recordings(self):
+        """(stem, bytes) of every recording, oldest first."""
+        found = []
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith(self.prefix + "-") and entry.name.endswith(".sigmf-data"):
+                stem = entry.path[:-len(".sigmf-data")]
+                size = entry.stat().st_size
+                if os.path.exists(stem + ".sigmf-meta"):
+                    size += os.path.getsize(stem + ".sigmf-meta")
+                found.append((entry.stat().st_mtime, stem, size))
+        return [(stem, size) for _, stem, size in sorted(found)]
+
+    def enforce_cap(self, keep=None):
+        """Deletes the oldest recordings (never keep, the one being written) until under max_bytes."""
+        if not self.max_bytes:
+            return
+        recordings = self.recordings()
+        total = sum(size for _, size in recordings)
+        for stem, size in recordings:
+            if total <= self.max_bytes:
+                break
+            if stem == keep:
+                continue
+            for path in (stem + ".sigmf-data", stem + ".sigmf-meta"):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            total -= size
+            self.evicted += 1
+
+
+class iq_recorder(gr.sync_block):
+    """
+    Writes the raw samples on its input to SigMF recordings in directory; see
+    the module comment for the modes. Frame PDUs on the 'frames' port become
+    annotations and, in trigger mode, recording windows (pre_seconds before
+    the frame start to post_seconds after its end).
+    """
+    def __init__(self, directory, fmt="cf32", samp_rate=1e6, center_freq=None, mode="continuous",
+                 rotate_seconds=300.0, max_bytes=None, trigger="all", pre_seconds=1.0, post_seconds=0.5,
+                 ring_seconds=10.0, buffer_bytes=4 * 1024 * 1024, queue_bytes=128 * 1024 * 1024):
+        if fmt not in RECORDING_FORMATS:
+            raise ValueError(f"Unsupported recording format '{fmt}'. Choose one of: {', '.join(RECORDING_FORMATS)}")
+        if mode not in RECORD_MODES:
+            raise ValueError(f"Unknown record mode '{mode}'. Choose one of: {', '.join(RECORD_MODES)}")
+        if trigger not in RECORD_TRIGGERS:
+            raise ValueError(f"Unknown record trigger '{trigger}'. Choose one of: {', '.join(RECORD_TRIGGERS)}")
+        gr.sync_block.__init__(self, name="iq_recorder", in_sig=[RECORDING_FORMATS[fmt][0]], out_sig=None)
+        self.store = RecordingDirectory(directory, max_bytes=max_bytes)
+        self.fmt = fmt
+        self.samp_rate = samp_rate
+        self.center_freq = center_freq
+        self.mode = mode
+        self.rotate_samples = int(rotate_seconds * samp_rate) if rotate_seconds else None
+        self.trigger = trigger
+        self.pre_samples = int(pre_seconds * samp_rate)
+        self.post_samples = int(post_seconds * samp_rate)
+        self.item_size = STREAM_FORMATS[fmt][1]
+
+        # Continuous mode: free buffers -> work() fills one -> writer queue -> free again
+        self.buffer_items = max(1, buffer_bytes // (self.item_size * PAGE_SIZE)) * PAGE_SIZE
+        self._free = queue.Queue()
+        self._writes = queue.Queue()
+        if mode == "continuous":
+            for _ in range(max(2, queue_bytes // (self.buffer_items * self.item_size))):
+                self._free.put(aligned_buffer(self.buffer_items * self.item_size))
+        self._buffer = None
+        self._buffer_start = 0  # source sample index of the buffer's first sample
+        self._buffer_used = 0  # bytes
+
+        # Trigger mode: the last ring_seconds of samples, indexed by source sample index
+        self.ring_items = int(ring_seconds * samp_rate) if mode == "trigger" else 0
+        self._ring = np.zeros(self.ring_items * self.item_size, dtype=np.uint8)
+        self._triggers = collections.deque()  # (start, end, record) from the message thread
+        self._windows = []  # [start, end, records], merged when they overlap
+
+        self._frames = collections.deque()  # records to annotate (continuous mode)
+        self._started_at = None  # wall time of sample index 0
+        self._position = 0
+        self._gap_end = 0  # no trigger window starts before this source sample index
+        self._recording = None
+        self._previous = None
+        self._thread = None
+
+        self.samples_in = 0
+        self.samples_written = 0
+        self.samples_dropped = 0
+        self.bytes_written = 0
+        self.recordings_written = 0
+        self.windows_triggered = 0
+        self.paused = False
+        self.samples_paused = 0
+
+        self.message_port_register_in(pmt.intern("frames"))
+        self.set_msg_handler(pmt.intern("frames"), self.handle_frame)
+
+    # -- scheduler side ---------------------------------------------------
+
+    def handle_frame(self, msg):
+        record = pdu_to_record(msg)
+        # sample_index marks (roughly) where the frame ended in the source stream
+        end = record.get("sample_index")
+        if end is None:
+            end = self._position
+        duration = time_on_air(record.get("sf", 7), record.get("bw", 125000), len(record["payload"]),
+                               record.get("cr", 1))
+        frame = (end - int(duration * self.samp_rate), end, record)
+        if self.mode == "continuous":
+            self._frames.append(frame)
+        elif self.trigger == "all" or record.get("crc_ok") is False:
+            self._triggers.append(frame)
+
+    def set_paused(self, paused):
+        """Stops (or resumes) recording; the samples in between are counted but not kept."""
+        self.paused = paused
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="iq_recorder-writer", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        if self.mode == "continuous" and self._buffer is not None and self._buffer_used:
+            self._writes.put(("chunk", self._buffer_start, self._buffer, self._buffer_used))
+            self._buffer = None
+        if self.mode == "trigger":
+            self._collect_windows(flush=True)
+        self._writes.put(None)
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        return True
+
+    def work(self, input_items, output_items):
+        samples = input_items[0]
+        n = len(samples)
+        if self._started_at is None:
+            self._started_at = time.time() - n / self.samp_rate
+        if self.paused:
+            if self.mode == "continuous" and self._buffer is not None and self._buffer_used:
+                # The recording ends here; the next buffer opens a new one after the gap
+                self._writes.put(("chunk", self._buffer_start, self._buffer, self._buffer_used))
+                self._buffer = None
+            self._position += n
+            self._gap_end = self._position
+            self.samples_in += n
+            self.samples_paused += n
+            if self.mode == "trigger":
+                self._collect_windows()
+            return n
+        data = samples.reshape(-1).view(np.uint8)
+        if self.mode == "continuous":
+            self._buffer_samples(data)
+        else:
+            self._ring_samples(data)
+        self._position += n
+        self.samples_in += n
+        if self.mode == "trigger":
+            self._collect_windows()
+        return n
+
+    def _buffer_samples(self, data):
+        offset = 0
+        while offset < len(data):
+            if self._buffer is None:
+                try:
+                    self._buffer = self._free.get_nowait()
+                except queue.Empty:
+                    # Disk behind: drop what is left of this call rather than block the source
+                    self.samples_dropped += (len(data) - offset) // self.item_size
+                    return
+                self._buffer_start = self._position + offset // self.item_size
+                self._buffer_used = 0
+            n = min(len(data) - offset, len(self._buffer) - self._buffer_used)
+            self._buffer[self._buffer_used:self._buffer_used + n] = data[offset:offset + n]
+            self._buffer_used += n
+            offset += n
+            if self._buffer_used == len(self._buffer):
+                self._writes.put(("chunk", self._buffer_start, self._buffer, self._buffer_used))
+                self._buffer = None
+
+    def _ring_samples(self, data):
+        position = self._position
+        if len(data) > len(self._ring):
+            # Only the newest ring_items samples fit
+            position += (len(data) - len(self._ring)) // self.item_size
+            data = data[-len(self._ring):]
+        at = (position % self.ring_items) * self.item_size
+        first = min(len(data), len(self._ring) - at)
+        self._ring[at:at + first] = data[:first]
+        self._ring[:len(data) - first] = data[first:]
+
+    def _collect_windows(self, flush=False):
+        """Moves new triggers into (merged) windows and hands complete windows to the writer."""
+        while self._triggers:
+            frame = self._triggers.popleft()
+            start, end = frame[0] - self.pre_samples, frame[1] + self.post_samples
+            self.windows_triggered += 1
+            if self._windows and start <= self._windows[-1][1]:
+                window = self._windows[-1]
+                window[0], window[1] = min(window[0], start), max(window[1], end)
+                window[2].append(frame)
+            else:
+                self._windows.append([start, end, [frame]])
+        while self._windows and (flush or self._windows[0][1] <= self._position):
+            start, end, frames = self._windows.pop(0)
+            end = min(end, self._position)
+            start = max(start, self._position - self.ring_items, self._gap_end)
+            if end > start:
+                self._writes.put(("window", start, self._ring_slice(start, end), frames))
+
+    def _ring_slice(self, start, end):
+        first = (start % self.ring_items) * self.item_size
+        nbytes = (end - start) * self.item_size
+        if first + nbytes <= len(self._ring):
+            return self._ring[first:first + nbytes].copy()
+        return np.concatenate((self._ring[first:], self._ring[:first + nbytes - len(self._ring)]))
+
+    # -- writer thread ----------------------------------------------------
+
+    def _sample_time(self, index):
+        return (self._started_at or time.time()) + index / self.samp_rate
+
+    def _open(self, sample_start):
+        self._close()
+        stem = self.store.stem(self._sample_time(sample_start))
+        self._recording = SigMFRecording(stem, self.fmt, self.samp_rate, self.center_freq,
+                                         sample_start, self._sample_time(sample_start))
+        self.store.enforce_cap(keep=stem)
+
+    def _close(self):
+        if self._recording is not None:
+            self._recording.close()
+            self.recordings_written += 1
+            self._previous, self._recording = self._recording, None
+
+    def _write_chunk(self, sample_start, buffer, used):
+        data = buffer[:used]
+        while len(data):
+            recording = self._recording
+            if recording is None or recording.sample_end != sample_start or \
+                    (self.rotate_samples and recording.samples >= self.rotate_samples):
+                # Rotation point, or a gap after dropped buffers: start a new recording
+                self._open(sample_start)
+                recording = self._recording
+            room = len(data) // self.item_size
+            if self.rotate_samples:
+                room = min(room, self.rotate_samples - recording.samples)
+            recording.write(data[:room * self.item_size])
+            data = data[room * self.item_size:]
+            sample_start += room
+            self.samples_written += room
+            self.bytes_written += room * self.item_size
+        self.store.enforce_cap(keep=self._recording.stem)
+
+    def _write_window(self, sample_start, data, frames):
+        self._open(sample_start)
+        self._recording.write(data)
+        for frame in frames:
+            self._annotate(self._recording, *frame)
+        self.samples_written += len(data) // self.item_size
+        self.bytes_written += len(data)
+        self._close()
+
+    @staticmethod
+    def _annotate(recording, start, end, record):
+        start = min(max(start, recording.sample_start), recording.sample_end)
+        recording.annotate(record, start, max(0, min(end, recording.sample_end) - start))
+
+    def _annotate_frames(self):
+        """Attaches queued frames to the recording holding their start (rewriting a closed one's meta)."""
+        while self._frames:
+            start, end, record = self._frames.popleft()
+            for recording in (self._recording, self._previous):
+                if recording is not None and recording.sample_start <= start < recording.sample_end:
+                    self._annotate(recording, start, end, record)
+                    if recording is self._previous and os.path.exists(recording.data_path):
+                        recording.write_meta()
+                    break
+
+    def _run(self):
+        while True:
+            try:
+                item = self._writes.get(timeout=0.5)
+            except queue.Empty:
+                self._annotate_frames()
+                continue
+            if item is None:
+                break
+            try:
+                if item[0] == "chunk":
+                    _, sample_start, buffer, used = item
+                    try:
+                        self._write_chunk(sample_start, buffer, used)
+                    finally:
+                        self._free.put(buffer)
+                else:
+                    self._write_window(*item[1:])
+            except OSError as e:
+                lost = item[3] // self.item_size if item[0] == "chunk" else len(item[2]) // self.item_size
+                self.samples_dropped += lost
+                print(f"[ERROR] iq_recorder could not write {lost} samples: {e}", file=sys.stderr)
+                # Start over with a new recording once the disk accepts writes again
+                try:
+                    self._close()
+                except OSError:
+                    self._recording = None
+            self._annotate_frames()
+        self._annotate_frames()
+        self._close()
+        self.store.enforce_cap()
+
+
+class _recorder_bench(gr.top_block):
+    """Unthrottled noise into an iq_recorder, to check the disk keeps up."""
+    def __init__(self, directory, fmt, samp_rate, seconds, **recorder_options):
+        from gnuradio import blocks
+
+        gr.top_block.__init__(self, "iq_recorder benchmark", catch_exceptions=True)
+        rng = np.random.default_rng(0)
+        if fmt == "cf32":
+            self.source = blocks.vector_source_c((rng.standard_normal(65536) * (1 + 1j)).astype(np.complex64).tolist(), True)
+        elif fmt == "cs16":
+            self.source = blocks.vector_source_s(rng.integers(-3000, 3000, 2 * 65536).tolist(), True, 2)
+        else:
+            self.source = blocks.vector_source_b(rng.integers(0, 256, 2 * 65536).tolist(), True, 2)
+        item_size = STREAM_FORMATS[fmt][1]
+        self.throttle = blocks.throttle(item_size, samp_rate, True)
+        self.head = blocks.head(item_size, int(samp_rate * seconds))
+        self.recorder = iq_recorder(directory, fmt, samp_rate, **recorder_options)
+        self.connect(self.source, self.throttle, self.head, self.recorder)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Check that iq_recorder sustains a sample rate on this disk")
+    parser.add_argument("directory", help="Directory on the disk to check; the recordings go into a temporary "
+                                          "subdirectory that is deleted afterwards")
+    parser.add_argument("--format", choices=sorted(RECORDING_FORMATS), default="cs8", help="Wire format (default: cs8)")
+    parser.add_argument("--sample-rate", type=float, default=2e6, help="Samples per second (default: 2e6)")
+    parser.add_argument("--seconds", type=float, default=30.0, help="Duration (default: 30)")
+    parser.add_argument("--rotate-seconds", type=float, default=10.0, help="Rotation interval (default: 10)")
+    args = parser.parse_args()
+
+    # Only this run's recordings are deleted, never recordings already in the directory
+    with tempfile.TemporaryDirectory(prefix="iq_recorder-bench-", dir=args.directory) as directory:
+        tb = _recorder_bench(directory, args.format, args.sample_rate, args.seconds,
+                             rotate_seconds=args.rotate_seconds)
+        started = time.monotonic()
+        tb.run()
+        elapsed = time.monotonic() - started
+    recorder = tb.recorder
+    print(json.dumps({
+        "format": args.format,
+        "samp_rate": args.sample_rate,
+        "elapsed_s": round(elapsed, 3),
+        "samples_written": recorder.samples_written,
+        "samples_dropped": recorder.samples_dropped,
+        "mb_per_s": round(recorder.bytes_written / elapsed / 1e6, 2) if elapsed else None,
+        "recordings": recorder.recordings_written,
+    }))
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#
+# SPDX-License-Identifier: GPL-3.0
+#
+# Per-frame latency tracing. SampleClock maps source sample indices to the
+# wall time the source delivered them, by polling the source's item counter
+# from a thread (no block in the sample path). lora_rx_chain's header_tap
+# notes where in the stream each frame's header starts and when frame_sync
+# output it; frame_tagger turns that into source sample indices, so the
+# tracker can stamp each frame with:
+#
+#   t_preamble_end         - when the last preamble sample left the source (measured)
+#   t_air_start, t_air_end - when the first/last frame sample left the source
+#                            (t_preamble_end -/+ the frame's symbol counts)
+#   detect_time            - when frame_sync output the header (detection point)
+#   rx_time                - when lora_rx handed the frame out (decode point)
+#   (sink)                 - when packet_sink/frame_store had written it
+#
+# and keeps a histogram per stage: air_to_detect, detect_to_decode,
+# air_to_decode, decode_to_sink and air_to_sink (per sink). Exported with the
+# Prometheus metrics, returned by the control server's "latency" command and
+# dumped to stderr on SIGUSR1. A frame without a header position (header_tap
+# missed it) only gets t_air_end from how far frame_sync had read when it came
+# out; that overshoots the frame's end, so it is flagged t_air_estimated and
+# kept out of the histograms.
+
+import sys
+import json
+import time
+import bisect
+import threading
+import collections
+
+from lora_timing import symbol_time, time_on_air
+
+# Histogram bucket upper bounds in seconds (1-2-5 series)
+LATENCY_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 60.0)
+STAGES = ("air_to_detect", "detect_to_decode", "air_to_decode", "decode_to_sink", "air_to_sink")
+# Preamble plus sync word and SFD, in symbols
+PREAMBLE_SYMBOLS = 8 + 4.25
+
+
+class SampleClock:
+    """(item count, wall time) pairs of a source block, sampled every interval seconds."""
+    def __init__(self, block, samp_rate, interval=0.005, history_s=300.0):
+        self.block = block
+        self.samp_rate = samp_rate
+        self.interval = interval
+        self.counts = collections.deque(maxlen=int(history_s / interval))
+        self.times = collections.deque(maxlen=int(history_s / interval))
+        self.offset = 0  # samples delivered by blocks followed before this one
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def follow(self, block, offset):
+        """Continues the count from block (a reopened source), whose own counter starts again at 0."""
+        with self._lock:
+            self.offset = offset
+            self.block = block
+
+    def start(self):
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="sample-clock", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        previous = -1
+        while not self._stopping.wait(self.interval):
+            try:
+                count = self.offset + self.block.nitems_written(0)
+            except (AttributeError, RuntimeError):
+                continue
+            if count > previous:
+                with self._lock:
+                    self.counts.append(count)
+                    self.times.append(time.time())
+                previous = count
+
+    def time_of(self, index):
+        """Wall time at which sample index left the source, or None before the first sample."""
+        with self._lock:
+            if not self.counts:
+                return None
+            slot = bisect.bisect_left(self.counts, index)
+            if slot == len(self.counts):
+                # Newer than the last poll: extrapolate at the nominal rate
+                return self.times[-1] + (index - self.counts[-1]) / self.samp_rate
+            if slot == 0:
+                return self.times[0] - (self.counts[0] - index) / self.samp_rate
+            # Delivered somewhere between two polls; interpolate
+            c0, c1 = self.counts[slot - 1], self.counts[slot]
+            t0, t1 = self.times[slot - 1], self.times[slot]
+            return t0 + (index - c0) / (c1 - c0) * (t1 - t0)
+
+
+class LatencyHistogram:
+    """Cumulative Prometheus-style buckets plus exact quantiles over the most recent window."""
+    def __init__(self, window=4096):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)  # the last one is +Inf
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = collections.deque(maxlen=window)
+
+    def observe(self, seconds):
+        seconds = max(0.0, seconds)
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.recent.append(seconds)
+
+    def quantile(self, q):
+        if not self.recent:
+            return None
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def summary(self):
+        p50, p99 = self.quantile(0.5), self.quantile(0.99)
+        return {
+            "count": self.count,
+            "p50_ms": None if p50 is None else round(p50 * 1e3, 3),
+            "p99_ms": None if p99 is None else round(p99 * 1e3, 3),
+            "max_ms": round(self.max * 1e3, 3),
+            "mean_ms": round(self.total / self.count * 1e3, 3) if self.count else None,
+        }
+
+
+class LatencyTracker:
+    """Stamps frame records with sample-clock times and keeps one histogram per stage (and sink)."""
+    def __init__(self, clock, window=4096):
+        self.clock = clock
+        self.window = window
+        self.histograms = {}  # (stage, sink) -> LatencyHistogram
+        self._lock = threading.Lock()
+
+    def _observe(self, stage, seconds, sink=""):
+        with self._lock:
+            histogram = self.histograms.get((stage, sink))
+            if histogram is None:
+                histogram = self.histograms[(stage, sink)] = LatencyHistogram(self.window)
+            histogram.observe(seconds)
+
+    def stamp(self, meta, payload_len):
+        """Adds the air times to a frame's metadata and records its stages (at the decode point)."""
+        index = meta.get("sample_index")
+        t_air_end = None if index is None else self.clock.time_of(index)
+        if t_air_end is None:
+            return
+        bw = meta.get("bw", 125000)
+        preamble = PREAMBLE_SYMBOLS * symbol_time(meta.get("sf", 7), bw)
+        meta["t_air_end"] = t_air_end
+        if meta.get("header_index") is None:
+            meta["t_air_start"] = t_air_end - time_on_air(meta.get("sf", 7), bw, payload_len, meta.get("cr", 1))
+            meta["t_air_estimated"] = True
+            return
+        meta["t_preamble_end"] = self.clock.time_of(meta["header_index"])
+        meta["t_air_start"] = meta["t_preamble_end"] - preamble
+        self._observe("air_to_detect", meta["detect_time"] - meta["t_preamble_end"])
+        self._observe("detect_to_decode", meta["rx_time"] - meta["detect_time"])
+        self._observe("air_to_decode", meta["rx_time"] - t_air_end)
+
+    def written(self, records, sink, t_sink=None):
+        """Records the sink stages for records a sink has just written."""
+        t_sink = t_sink or time.time()
+        for record in records:
+            if "rx_time" in record:
+                self._observe("decode_to_sink", t_sink - record["rx_time"], sink)
+            if "t_air_end" in record:
+                self._observe("air_to_sink", t_sink - record["t_air_end"], sink)
+
+    def snapshot(self):
+        with self._lock:
+            return {f"{stage}/{sink}" if sink else stage: histogram.summary()
+                    for (stage, sink), histogram in sorted(self.histograms.items())}
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {}
+
+    def dump(self, file=None):
+        print(f"LATENCY:{json.dumps(self.snapshot())}", file=file or sys.stderr, flush=True)
+
+    def prometheus_lines(self):
+        lines = ["# HELP lora_frame_latency_seconds Frame latency per stage (see latency_trace.py).",
+                 "# TYPE lora_frame_latency_seconds histogram"]
+        with self._lock:
+            for (stage, sink), histogram in sorted(self.histograms.items()):
+                labels = f'stage="{stage}"' + (f',sink="{sink}"' if sink else "")
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), histogram.buckets):
+                    cumulative += count
+                    lines.append(f'lora_frame_latency_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f"lora_frame_latency_seconds_sum{{{labels}}} {histogram.total:.6f}")
+                lines.append(f"lora_frame_latency_seconds_count{{{labels}}} {histogram.count}")
+            lines += ["# HELP lora_frame_latency_quantile_seconds Latency quantiles over the recent window "
+                      "(quantile 1 is the maximum since start).",
+                      "# TYPE lora_frame_latency_quantile_seconds gauge"]
+            for (stage, sink), histogram in sorted(self.histograms.items()):
+                labels = f'stage="{stage}"' + (f',sink="{sink}"' if sink else "")
+                for q in (0.5, 0.99):
+                    value = histogram.quantile(q)
+                    if value is not None:
+                        lines.append(f'lora_frame_latency_quantile_seconds{{{labels},quantile="{q}"}} {value:.6f}')
+                lines.append(f'lora_frame_latency_quantile_seconds{{{labels},quantile="1"}} {histogram.max:.6f}')
+        return lines
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#
+# SPDX-License-Identifier: GPL-3.0
+#
+# Adaptive load shedding for Generic_Decoder. Once a second the shedder
+# measures how far the source fell behind wall-clock time (samples it should
+# have delivered at the sample rate but did not: SDR overflows, or a
+# throttled replay held back by full buffers) and how full the input buffer
+# of each enabled lora_rx branch is (scheduler performance counters). The
+# backlog between source and lora_rx cannot grow past a buffer, so lag only
+# ever shows as lost samples once the buffers are full.
+#
+# A stalled SDR is not overload: lag counts only after two intervals in a
+# row, an interval without a single sample resets it, and nothing is
+# measured while the source watchdog has the SDR down or is verifying a
+# reopened one (the swapped-in source restarts the sample count).
+#
+# When the decoder falls behind it steps down, one step at a time:
+#
+#   print_rx       - lora_rx console printing off (only if a branch has it on)
+#   hard-decoding  - soft_decoding=False on every branch (only if a branch
+#                    decodes soft)
+#   drop-branches  - disconnect the least used branch (fewest frames), one
+#                    per step, keeping at least min_branches
+#
+# and steps back up in reverse order after recover_s seconds without
+# pressure. Never more often than every hold_s seconds, so a rebuilt branch
+# gets to show its effect. Every transition is logged and counted; the limit
+# bounds how far it may go.
+#
+# The next step is chosen from the branches' settings at the time, so
+# changes made through the control socket while running are shed too (a
+# print_rx or hard-decoding step comes again if a branch has turned the
+# feature back on since).
+# Stepping up only undoes what the shedder did: a setting goes back on only
+# on the branches it turned off, and only if nobody has changed it since.
+
+import sys
+import time
+import threading
+import collections
+
+SHED_LIMITS = ("print_rx", "hard-decoding", "drop-branches")
+# make_lora_rx's defaults, for branches whose rx_params leave them out
+_RX_DEFAULTS = {"print_rx": False, "soft_decoding": True}
+
+
+def _call(block, method, *args):
+    try:
+        return getattr(block, method)(*args)
+    except (AttributeError, RuntimeError, TypeError, IndexError):
+        return None
+
+
+class LoadShedder:
+    """Watches tb's branches from a background thread and steps the decoder down/up (see module comment)."""
+    def __init__(self, tb, limit="drop-branches", interval=1.0, max_lag=0.02, recover_lag=0.005, max_fill=0.9,
+                 recover_fill=0.5, hold_s=5.0, recover_s=10.0, min_branches=1):
+        if limit not in SHED_LIMITS:
+            raise ValueError(f"Unknown load shedding limit '{limit}'. Choose one of: {', '.join(SHED_LIMITS)}")
+        self.tb = tb
+        self.limit = limit
+        self.interval = interval
+        self.max_lag = max_lag
+        self.recover_lag = recover_lag
+        self.max_fill = max_fill
+        self.recover_fill = recover_fill
+        self.hold_s = hold_s
+        self.recover_s = recover_s
+        self.min_branches = min_branches
+
+        self.steps = []  # steps applied, in order
+        self.transitions_down = 0
+        self.transitions_up = 0
+        self.dropped = []  # branch indices disabled by the shedder, in order
+        self.switched_off = []  # per applied step, indices of the branches a print_rx/hard-decoding step turned off
+        self.history = collections.deque(maxlen=64)  # (time, "down"/"up", step, reason)
+        self.lag = None  # seconds of stream the source fell short of in the last interval
+        self.fill = None  # fullest branch input buffer (0-1), None without performance counters
+        self.samples_lost = 0
+
+        self._last_count = None  # (source, time, nitems_written) at the previous measurement
+        self._lagging = 0  # consecutive intervals with lag above max_lag
+        self._last_transition = 0.0
+        self._healthy_since = None
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def _branches_with(self, param):
+        return [branch.index for branch in self.tb.lora_rx_branches
+                if branch.rx_params.get(param, _RX_DEFAULTS[param])]
+
+    @property
+    def level(self):
+        """Number of steps applied."""
+        return len(self.steps)
+
+    def _plan(self):
+        """
+        The steps still open below the current level, from the branches'
+        current settings; drop-branches appears once per droppable branch.
+        """
+        steps = []
+        if self._branches_with("print_rx"):
+            steps.append("print_rx")
+        if self.limit == "print_rx":
+            return steps
+        if self._branches_with("soft_decoding"):
+            steps.append("hard-decoding")
+        if self.limit == "drop-branches":
+            enabled = sum(1 for branch in self.tb.lora_rx_branches if branch.enabled)
+            steps += ["drop-branches"] * max(0, enabled - self.min_branches)
+        return steps
+
+    def start(self):
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="load-shedder", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            try:
+                self.update(time.monotonic())
+            except Exception as e:
+                print(f"[WARN] Load shedder could not act: {e}", file=sys.stderr)
+
+    def measure(self, now):
+        """Updates lag, fill and samples_lost from the counters since the previous call."""
+        source = self.tb.paced_source
+        count = _call(source, "nitems_written", 0)
+        if count is None:
+            return
+        # A swapped-in source (see source_watchdog.py) counts from 0 again
+        if self._last_count is not None and self._last_count[0] is source:
+            _, last_now, last_count = self._last_count
+            if count == last_count:
+                # Nothing at all: a stalled source, for the watchdog to handle
+                self.lag = None
+                self._lagging = 0
+            else:
+                missing = max(0, int((now - last_now) * self.tb.samp_rate) - (count - last_count))
+                self.lag = missing / self.tb.samp_rate
+                self.samples_lost += missing
+                self._lagging = self._lagging + 1 if self.lag > self.max_lag else 0
+        self._last_count = (source, now, count)
+        fills = [_call(getattr(branch.rx, "lora_sdr_frame_sync_0", None), "pc_input_buffers_full_avg", 0)
+                 for branch in self.tb.lora_rx_branches if branch.enabled]
+        fills = [fill for fill in fills if fill is not None]
+        self.fill = max(fills) if fills else None
+
+    def update(self, now):
+        """One control step: measure, then step down, up or stay."""
+        watchdog = getattr(self.tb, "source_watchdog", None)
+        if watchdog is not None and watchdog.state != "up":
+            # Standby zeros, or a reopened SDR not yet delivering: says nothing about decoder load
+            self._last_count = None
+            self.lag = None
+            self._lagging = 0
+            self._healthy_since = None
+            return
+        self.measure(now)
+        pressure = None
+        if self._lagging >= 2:
+            pressure = f"source {self.lag * 1e3:.0f} ms behind real time"
+        elif self.fill is not None and self.fill > self.max_fill:
+            pressure = f"lora_rx input buffer {self.fill:.0%} full"
+        relaxed = ((self.lag is None or self.lag < self.recover_lag)
+                   and (self.fill is None or self.fill < self.recover_fill))
+
+        if not relaxed:
+            self._healthy_since = None
+        elif self._healthy_since is None:
+            self._healthy_since = now
+        if now - self._last_transition < self.hold_s:
+            return
+        if pressure:
+            plan = self._plan()
+            if plan:
+                self._step_down(now, plan[0], pressure)
+        elif relaxed and self.level > 0 and now - self._healthy_since >= self.recover_s:
+            self._step_up(now)
+
+    def _least_used_branch(self):
+        """Enabled branch with the fewest decoded frames; the higher SF first on a tie."""
+        candidates = [branch for branch in self.tb.lora_rx_branches if branch.enabled]
+        return min(candidates, key=lambda branch: (branch.tagger.frame_count, -branch.sf))
+
+    def _step_down(self, now, step, reason):
+        if step in ("print_rx", "hard-decoding"):
+            param = "print_rx" if step == "print_rx" else "soft_decoding"
+            indices = self._branches_with(param)
+            if indices:
+                self.tb.reconfigure_branches(indices, **{param: False})
+            self.switched_off.append(indices)
+            detail = (f"lora_rx console printing off on branches {indices}" if step == "print_rx"
+                      else f"hard decoding on branches {indices}")
+        else:
+            branch = self._least_used_branch()
+            self.tb.set_branches_enabled([branch.index], False)
+            self.dropped.append(branch.index)
+            self.switched_off.append([])
+            detail = f"branch {branch.index} (channel {branch.channel}, SF{branch.sf}) disconnected"
+        self.steps.append(step)
+        self.transitions_down += 1
+        self._last_transition = now
+        self._healthy_since = None
+        self.history.append((time.time(), "down", step, reason))
+        print(f"[WARN] Load shedding level {self.level}/{self.level + len(self._plan())} ({reason}): {detail}",
+              file=sys.stderr)
+
+    def _step_up(self, now):
+        step, switched_off = self.steps.pop(), self.switched_off.pop()
+        if step in ("print_rx", "hard-decoding"):
+            param = "print_rx" if step == "print_rx" else "soft_decoding"
+            # Branches set otherwise since (e.g. through the control socket) keep that setting
+            indices = [index for index in switched_off
+                       if not self.tb.lora_rx_branches[index].rx_params.get(param, _RX_DEFAULTS[param])]
+            if indices:
+                self.tb.reconfigure_branches(indices, **{param: True})
+            detail = (f"lora_rx console printing restored on branches {indices}" if step == "print_rx"
+                      else f"soft decoding restored on branches {indices}")
+        else:
+            index = self.dropped.pop()
+            self.tb.set_branches_enabled([index], True)
+            detail = f"branch {index} reconnected"
+        self.transitions_up += 1
+        self._last_transition = now
+        self._healthy_since = now
+        self.history.append((time.time(), "up", step, "caught up"))
+        print(f"[INFO] Load shedding level {self.level}/{self.level + len(self._plan())}: {detail}", file=sys.stderr)
+
+    def status(self):
+        return {
+            "level": self.level,
+            "max_level": self.level + len(self._plan()),
+            "steps": list(self.steps),
+            "lag_s": None if self.lag is None else round(self.lag, 3),
+            "input_fill": None if self.fill is None else round(self.fill, 3),
+            "transitions_down": self.transitions_down,
+            "transitions_up": self.transitions_up,
+            "branches_dropped": list(self.dropped),
+        }
+
+    def prometheus_lines(self):
+        lines = [
+            "# HELP lora_shed_level Load shedding steps currently applied (0 is full quality).",
+            "# TYPE lora_shed_level gauge",
+            f"lora_shed_level {self.level}",
+            "# HELP lora_shed_transitions_total Load shedding steps taken.",
+            "# TYPE lora_shed_transitions_total counter",
+            f'lora_shed_transitions_total{{direction="down"}} {self.transitions_down}',
+            f'lora_shed_transitions_total{{direction="up"}} {self.transitions_up}',
+            "# TYPE lora_shed_branches_dropped gauge",
+            f"lora_shed_branches_dropped {len(self.dropped)}",
+        ]
+        if self.lag is not None:
+            lines += ["# HELP lora_shed_lag_seconds Stream seconds the source fell short of real time last interval.",
+                      "# TYPE lora_shed_lag_seconds gauge",
+                      f"lora_shed_lag_seconds {self.lag:.4f}",
+                      "# TYPE lora_shed_samples_lost_total counter",
+                      f"lora_shed_samples_lost_total {self.samples_lost}"]
+        if self.fill is not None:
+            lines += ["# TYPE lora_shed_input_fill gauge", f"lora_shed_input_fill {self.fill:.3f}"]
+        return lines
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#
+# SPDX-License-Identifier: GPL-3.0
+#
+# Wideband front-end for Generic_Decoder: splits one SDR stream into several
+# LoRa channels with a single FFT-based polyphase filterbank.
+
+import math
+import sys
+from gnuradio import blocks, filter, gr
+from gnuradio.filter import firdes, pfb
+
+
+class lora_channelizer(gr.hier_block2):
+    """
+    One complex input at samp_rate, one complex output per entry of
+    channel_offsets (Hz relative to the tuned center frequency), each at
+    lora_bw * os_factor.
+
+    The filterbank has samp_rate / channel_spacing bins. Every channel is taken
+    from the bin nearest its offset; any residual offset is removed with a
+    rotator at the (low) bin rate before resampling to the lora_rx rate.
+    """
+    def __init__(self, samp_rate, channel_offsets, channel_spacing=200e3, lora_bw=125000,
+                 os_factor=2, atten_db=60):
+        nchans = int(round(samp_rate / channel_spacing))
+        if nchans < 2 or abs(nchans * channel_spacing - samp_rate) > 1:
+            raise ValueError(f"samp_rate ({samp_rate}) must be an integer multiple (>= 2) "
+                             f"of channel_spacing ({channel_spacing})")
+        if not channel_offsets:
+            raise ValueError("at least one channel offset is required")
+        for offset in channel_offsets:
+            if abs(offset) > samp_rate / 2:
+                raise ValueError(f"channel offset {offset} Hz is outside the captured "
+                                 f"+/-{samp_rate / 2} Hz band")
+
+        gr.hier_block2.__init__(
+            self, "lora_channelizer",
+            gr.io_signature(1, 1, gr.sizeof_gr_complex),
+            gr.io_signature(len(channel_offsets), len(channel_offsets), gr.sizeof_gr_complex),
+        )
+
+        self.samp_rate = samp_rate
+        self.channel_offsets = list(channel_offsets)
+        self.channel_spacing = channel_spacing
+        self.nchans = nchans
+        self.bin_rate = samp_rate / nchans
+        self.channel_rate = int(lora_bw * os_factor)
+
+        # Prototype filter: pass the LoRa channel, stop before the image that
+        # would alias into it at the bin rate.
+        taps = firdes.low_pass_2(1.0, samp_rate, channel_spacing / 2,
+                                 channel_spacing - lora_bw, atten_db)
+        self.pfb_channelizer = pfb.channelizer_ccf(nchans, taps, 1.0, atten_db)
+        self.connect((self, 0), (self.pfb_channelizer, 0))
+
+        used_bins = set()
+        self.channel_chains = []
+        for channel, offset in enumerate(self.channel_offsets):
+            nearest = int(round(offset / channel_spacing))
+            fft_bin = nearest % nchans
+            residual = offset - nearest * channel_spacing
+            if abs(residual) + lora_bw / 2 > channel_spacing / 2:
+                print(f"[WARN] Channel {channel} at {offset} Hz is {residual} Hz off its filterbank bin; "
+                      f"part of the LoRa band will be attenuated.", file=sys.stderr)
+            used_bins.add(fft_bin)
+
+            chain = []
+            if residual:
+                chain.append(blocks.rotator_cc(-2 * math.pi * residual / self.bin_rate))
+            interp, decim = self._resampling_ratio(self.bin_rate, self.channel_rate)
+            if interp != decim:
+                chain.append(filter.rational_resampler_ccc(interpolation=interp, decimation=decim,
+                                                           taps=[], fractional_bw=0))
+            self.channel_chains.append(chain)
+
+            upstream = (self.pfb_channelizer, fft_bin)
+            for stage in chain:
+                self.connect(upstream, (stage, 0))
+                upstream = (stage, 0)
+            self.connect(upstream, (self, channel))
+
+        # Every filterbank output must be connected; park the unused bins.
+        self.null_sinks = []
+        for fft_bin in range(nchans):
+            if fft_bin not in used_bins:
+                sink = blocks.null_sink(gr.sizeof_gr_complex)
+                self.connect((self.pfb_channelizer, fft_bin), (sink, 0))
+                self.null_sinks.append(sink)
+
+    @staticmethod
+    def _resampling_ratio(in_rate, out_rate):
+        in_rate, out_rate = int(round(in_rate)), int(round(out_rate))
+        common = math.gcd(in_rate, out_rate)
+        return out_rate // common, in_rate // common
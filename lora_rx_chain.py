@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#
+# SPDX-License-Identifier: GPL-3.0
+#
+# The gr-lora_sdr receive chain with the CRC result exposed. The stock
+# lora_rx hier block builds crc_verif with output_crc_check=False and only
+# publishes the payload string on 'out', so the CRC outcome never leaves it.
+# lora_rx_chain wires the same blocks (same names, so frame_sync etc. stay
+# reachable as attributes) with output_crc_check=True and replaces the
+# string message with a PDU built by crc_tap:
+#
+#   dewhitening --+--> crc_verif --(bool, one per frame with a CRC)--+
+#                 |                                                  v
+#                 +--(payload bytes, 'frame_info' tag per frame)--> crc_tap --> 'out'
+#
+# The PDU metadata holds crc_ok (True/False) for frames that carry a CRC and
+# nothing for frames sent without one.
+#
+# header_tap also listens on frame_sync's output and header_decoder's verdicts
+# and notes where in frame_sync's input each decoded frame's header starts
+# (the end of its preamble) and when frame_sync got there. crc_tap adds both
+# to the PDU as header_sample and detect_time. The header sample is read off
+# frame_sync's counters when its header tag is seen: exact to about one symbol
+# as long as header_tap keeps up with frame_sync, which it does (it only
+# reads tags).
+
+import time
+import threading
+import pmt
+import numpy as np
+from gnuradio import blocks, gr
+import gnuradio.lora_sdr as lora_sdr
+
+
+class header_tap(gr.sync_block):
+    """
+    Sink on frame_sync's output noting, for every frame whose header
+    header_decoder accepts ('header' messages), the frame_sync input sample
+    where the header starts and the wall time frame_sync output it.
+    """
+    def __init__(self, frame_sync, os_factor):
+        gr.sync_block.__init__(self, name="header_tap", in_sig=[np.complex64], out_sig=None)
+        self.frame_sync = frame_sync
+        self.os_factor = os_factor
+        self.detected = []  # (sample, time) per header frame_sync output, awaiting its verdict
+        self.verdicts = []  # header_decoder's verdicts (True: decoded), awaiting their header
+        self.decoded = {}  # number of the decoded frame -> (sample, time)
+        self.decoded_count = 0
+        self._lock = threading.Lock()
+        self.message_port_register_in(pmt.intern("header"))
+        self.set_msg_handler(pmt.intern("header"), self.handle_header)
+
+    def work(self, input_items, output_items):
+        first = self.nitems_read(0)
+        n = len(input_items[0])
+        tags = [tag for tag in self.get_tags_in_range(0, first, first + n)
+                if pmt.symbol_to_string(tag.key) == "frame_info"
+                and pmt.to_python(tag.value).get("is_header", False)]
+        if tags:
+            now = time.time()
+            # Inside a frame frame_sync reads os_factor samples per sample it writes
+            written, read = self.frame_sync.nitems_written(0), self.frame_sync.nitems_read(0)
+            with self._lock:
+                for tag in sorted(tags, key=lambda tag: tag.offset):
+                    self.detected.append((read - (written - tag.offset) * self.os_factor, now))
+                self._pair()
+        return n
+
+    def handle_header(self, msg):
+        info = pmt.to_python(msg)
+        with self._lock:
+            self.verdicts.append(isinstance(info, dict) and not info.get("err", False))
+            self._pair()
+
+    def _pair(self):
+        while self.detected and self.verdicts:
+            detection, decoded = self.detected.pop(0), self.verdicts.pop(0)
+            if decoded:
+                self.decoded[self.decoded_count] = detection
+                self.decoded_count += 1
+
+    def pop(self, number):
+        """(header sample, detection time) of the number-th decoded frame (from 0), or None if not seen."""
+        with self._lock:
+            for stale in [key for key in self.decoded if key < number]:
+                del self.decoded[stale]
+            return self.decoded.pop(number, None)
+
+
+class crc_tap(gr.basic_block):
+    """
+    Sink pairing dewhitened frames (input 0, delimited by header_decoder's
+    'frame_info' tags) with crc_verif's CRC flags (input 1) and publishing
+    each frame as a (metadata . u8vector) PDU on 'out'. With a header_tap,
+    each frame's header sample and detection time go into the metadata too.
+    """
+    def __init__(self, headers=None):
+        gr.basic_block.__init__(self, name="crc_tap", in_sig=[np.uint8, np.uint8], out_sig=None)
+        self.message_port_register_out(pmt.intern("out"))
+        self.headers = headers
+        self.frame = None  # (pay_len, has_crc, bytearray, frame number) of the frame being collected
+        self.frames = 0  # frames started, in the order header_decoder decoded their headers
+
+    def _next_tag(self, start, end):
+        tags = [tag for tag in self.get_tags_in_range(0, start, end)
+                if pmt.symbol_to_string(tag.key) == "frame_info"]
+        return min(tags, key=lambda tag: tag.offset) if tags else None
+
+    def general_work(self, input_items, output_items):
+        data, crcs = input_items
+        first = self.nitems_read(0)
+        end = first + len(data)
+        used = used_crc = 0
+        while True:
+            if self.frame is None:
+                tag = self._next_tag(first + used, end)
+                if tag is None:
+                    used = len(data)  # CRC bytes and anything else between frames
+                    break
+                info = pmt.to_python(tag.value)
+                used = tag.offset - first
+                self.frame = (int(info.get("pay_len", 0)), bool(info.get("crc", False)), bytearray(), self.frames)
+                self.frames += 1
+            pay_len, has_crc, payload, number = self.frame
+            if len(payload) < pay_len:
+                # Stop at the next frame: a frame cut short is dropped, as crc_verif drops it
+                following = self._next_tag(first + used + 1, end)
+                limit = len(data) if following is None else following.offset - first
+                take = min(pay_len - len(payload), limit - used)
+                payload += bytes(data[used:used + take])
+                used += take
+                if len(payload) < pay_len:
+                    if following is None:
+                        break
+                    self.frame = None
+                    continue
+            meta = pmt.make_dict()
+            if has_crc:
+                if used_crc >= len(crcs):
+                    break  # crc_verif has not produced this frame's result yet
+                meta = pmt.dict_add(meta, pmt.intern("crc_ok"), pmt.from_bool(bool(crcs[used_crc])))
+                used_crc += 1
+            header = self.headers.pop(number) if self.headers is not None else None
+            if header is not None:
+                meta = pmt.dict_add(meta, pmt.intern("header_sample"), pmt.from_uint64(int(header[0])))
+                meta = pmt.dict_add(meta, pmt.intern("detect_time"), pmt.from_double(header[1]))
+            self.message_port_pub(pmt.intern("out"), pmt.cons(meta, pmt.init_u8vector(len(payload), list(payload))))
+            self.frame = None
+        self.consume(0, used)
+        self.consume(1, used_crc)
+        return 0
+
+
+class lora_rx_chain(gr.hier_block2):
+    """lora_sdr.lora_sdr_lora_rx with the CRC result in the 'out' PDUs (see module comment)."""
+    def __init__(self, bw=125000, cr=1, has_crc=True, impl_head=False, pay_len=255, samp_rate=250000, sf=7,
+                 sync_word=(0x12,), soft_decoding=True, ldro_mode=2, print_rx=(False, False), center_freq=868100000):
+        gr.hier_block2.__init__(self, "lora_rx_chain",
+                                gr.io_signature(1, 1, gr.sizeof_gr_complex),
+                                gr.io_signature(0, 0, 0))
+        self.message_port_register_hier_out("out")
+
+        self.lora_sdr_frame_sync_0 = lora_sdr.frame_sync(int(center_freq), bw, sf, impl_head, list(sync_word),
+                                                         int(samp_rate / bw), 8)
+        self.lora_sdr_fft_demod_0 = lora_sdr.fft_demod(soft_decoding, True)
+        self.lora_sdr_gray_mapping_0 = lora_sdr.gray_mapping(soft_decoding)
+        self.lora_sdr_deinterleaver_0 = lora_sdr.deinterleaver(soft_decoding)
+        self.lora_sdr_hamming_dec_0 = lora_sdr.hamming_dec(soft_decoding)
+        self.lora_sdr_header_decoder_0 = lora_sdr.header_decoder(impl_head, cr, pay_len, has_crc, ldro_mode,
+                                                                 print_rx[0])
+        self.lora_sdr_dewhitening_0 = lora_sdr.dewhitening()
+        self.lora_sdr_crc_verif_0 = lora_sdr.crc_verif(print_rx[1], True)
+        self.header_tap_0 = header_tap(self.lora_sdr_frame_sync_0, int(samp_rate / bw))
+        self.crc_tap_0 = crc_tap(self.header_tap_0)
+        self.payload_null_0 = blocks.null_sink(gr.sizeof_char)
+
+        self.msg_connect((self.lora_sdr_header_decoder_0, 'frame_info'), (self.lora_sdr_frame_sync_0, 'frame_info'))
+        self.msg_connect((self.lora_sdr_header_decoder_0, 'frame_info'), (self.header_tap_0, 'header'))
+        self.msg_connect((self.crc_tap_0, 'out'), (self, 'out'))
+        self.connect((self, 0), (self.lora_sdr_frame_sync_0, 0))
+        self.connect((self.lora_sdr_frame_sync_0, 0), (self.lora_sdr_fft_demod_0, 0))
+        self.connect((self.lora_sdr_frame_sync_0, 0), (self.header_tap_0, 0))
+        self.connect((self.lora_sdr_fft_demod_0, 0), (self.lora_sdr_gray_mapping_0, 0))
+        self.connect((self.lora_sdr_gray_mapping_0, 0), (self.lora_sdr_deinterleaver_0, 0))
+        self.connect((self.lora_sdr_deinterleaver_0, 0), (self.lora_sdr_hamming_dec_0, 0))
+        self.connect((self.lora_sdr_hamming_dec_0, 0), (self.lora_sdr_header_decoder_0, 0))
+        self.connect((self.lora_sdr_header_decoder_0, 0), (self.lora_sdr_dewhitening_0, 0))
+        self.connect((self.lora_sdr_dewhitening_0, 0), (self.lora_sdr_crc_verif_0, 0))
+        self.connect((self.lora_sdr_dewhitening_0, 0), (self.crc_tap_0, 0))
+        # The payload already reaches crc_tap with its frame_info tag; crc_verif's copy is discarded
+        self.connect((self.lora_sdr_crc_verif_0, 0), (self.payload_null_0, 0))
+        self.connect((self.lora_sdr_crc_verif_0, 1), (self.crc_tap_0, 1))
@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#
+# SPDX-License-Identifier: GPL-3.0
+#
+# LoRa frame timing helpers (Semtech AN1200.13 time-on-air formula).
+
+import math
+
+
+def symbol_time(sf, bw):
+    """Duration of one LoRa symbol in seconds."""
+    return (2 ** sf) / bw
+
+
+def time_on_air(sf, bw=125000, payload_len=255, cr=1, has_crc=True, impl_head=False,
+                ldro=None, preamble_len=8):
+    """
+    Duration in seconds of a frame with payload_len bytes. ldro=None enables
+    low data rate optimisation when a symbol lasts more than 16 ms, as the
+    decoder's ldro_mode=2 (auto) does.
+    """
+    t_sym = symbol_time(sf, bw)
+    if ldro is None:
+        ldro = t_sym > 16e-3
+    de = 1 if ldro else 0
+    numerator = 8 * payload_len - 4 * sf + 28 + (16 if has_crc else 0) - (20 if impl_head else 0)
+    payload_symbols = 8 + max(math.ceil(numerator / (4 * (sf - 2 * de))) * (cr + 4), 0)
+    return (preamble_len + 4.25) * t_sym + payload_symbols * t_sym
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#
+# SPDX-License-Identifier: GPL-3.0
+#
+# Structured output for decoded LoRa frames. The message handler only converts
+# a frame PDU into a record and queues it; a background thread writes records
+# in batches as JSONL or a compact length-prefixed binary format, with
+# optional size/time based file rotation.
+
+import os
+import sys
+import json
+import math
+import time
+import queue
+import struct
+import threading
+from datetime import datetime
+
+import pmt
+from gnuradio import gr
+
+from frame_tagger import pdu_to_record
+
+OUTPUT_FORMATS = ("jsonl", "binary")
+
+# Binary files start with BINARY_MAGIC, then hold records of
+#   u32 length | BINARY_HEADER | payload bytes
+# where length counts the header and the payload.
+BINARY_MAGIC = b"LORAFRM1"
+# rx_time, sample_index (-1 unknown), channel, sf, cr, crc (0 bad, 1 ok, 255 unknown), snr (NaN unknown)
+BINARY_HEADER = struct.Struct("<dqHBBBf")
+LENGTH_PREFIX = struct.Struct("<I")
+
+
+def make_record(msg):
+    """Turns a frame PDU into the record written by packet_sink."""
+    record = pdu_to_record(msg)
+    record.setdefault("rx_time", time.time())
+    record.setdefault("crc_ok", None)
+    record.setdefault("snr", None)
+    return record
+
+
+def jsonable(record):
+    """Copy of a record with the payload hex encoded, ready for json.dumps."""
+    out = dict(record)
+    out["payload"] = record["payload"].hex()
+    out["payload_len"] = len(record["payload"])
+    return out
+
+
+def encode_binary(record):
+    crc_ok = record.get("crc_ok")
+    snr = record.get("snr")
+    sample_index = record.get("sample_index")
+    header = BINARY_HEADER.pack(
+        record["rx_time"],
+        -1 if sample_index is None else sample_index,
+        record.get("channel", 0),
+        record.get("sf", 0),
+        record.get("cr", 0),
+        255 if crc_ok is None else int(bool(crc_ok)),
+        math.nan if snr is None else snr,
+    )
+    body = header + record["payload"]
+    return LENGTH_PREFIX.pack(len(body)) + body
+
+
+def read_binary_records(path):
+    """Yields the records of a binary packet_sink file as dicts."""
+    with open(path, "rb") as handle:
+        if handle.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+            raise ValueError(f"'{path}' is not a packet_sink binary file")
+        while True:
+            prefix = handle.read(LENGTH_PREFIX.size)
+            if len(prefix) < LENGTH_PREFIX.size:
+                return
+            body = handle.read(LENGTH_PREFIX.unpack(prefix)[0])
+            rx_time, sample_index, channel, sf, cr, crc, snr = BINARY_HEADER.unpack_from(body)
+            yield {
+                "rx_time": rx_time,
+                "sample_index": None if sample_index < 0 else sample_index,
+                "channel": channel,
+                "sf": sf,
+                "cr": cr,
+                "crc_ok": None if crc == 255 else bool(crc),
+                "snr": None if math.isnan(snr) else snr,
+                "payload": body[BINARY_HEADER.size:],
+            }
+
+
+class RotatingWriter:
+    """
+    Appends encoded batches to path ('-' for stdout). With rotation enabled
+    the active file is renamed to <stem>-<timestamp><ext> once it grows past
+    max_bytes or gets older than max_seconds.
+    """
+    def __init__(self, path, fmt="jsonl", max_bytes=None, max_seconds=None):
+        if fmt not in OUTPUT_FORMATS:
+            raise ValueError(f"Unsupported output format '{fmt}'. Choose one of: {', '.join(OUTPUT_FORMATS)}")
+        if path == "-" and fmt == "binary":
+            raise ValueError("Binary output needs a file path, not stdout")
+        self.path = path
+        self.fmt = fmt
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.handle = None
+        self.opened_at = None
+        self.bytes_written = 0
+
+    def _open(self):
+        if self.path == "-":
+            self.handle = sys.stdout.buffer
+        else:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.handle = open(self.path, "ab")
+            if self.fmt == "binary" and self.handle.tell() == 0:
+                self.handle.write(BINARY_MAGIC)
+        self.opened_at = time.monotonic()
+        self.bytes_written = 0
+
+    def _needs_rotation(self):
+        if self.path == "-" or self.handle is None:
+            return False
+        if self.max_bytes and self.bytes_written >= self.max_bytes:
+            return True
+        return bool(self.max_seconds and time.monotonic() - self.opened_at >= self.max_seconds)
+
+    def _rotate(self):
+        self.close()
+        stem, ext = os.path.splitext(self.path)
+        stamp = datetime.now().strftime("%Y%m%dT%H%M%S")
+        rotated, suffix = f"{stem}-{stamp}{ext}", 1
+        while os.path.exists(rotated):
+            rotated, suffix = f"{stem}-{stamp}-{suffix}{ext}", suffix + 1
+        os.replace(self.path, rotated)
+
+    def write_batch(self, records):
+        if self._needs_rotation():
+            self._rotate()
+        if self.handle is None:
+            self._open()
+        if self.fmt == "jsonl":
+            data = "".join(json.dumps(jsonable(record)) + "\n" for record in records).encode("utf-8")
+        else:
+            data = b"".join(encode_binary(record) for record in records)
+        self.handle.write(data)
+        self.handle.flush()
+        self.bytes_written += len(data)
+
+    def close(self):
+        if self.handle is not None and self.handle is not sys.stdout.buffer:
+            self.handle.close()
+        self.handle = None
+
+
+class packet_sink(gr.basic_block):
+    """
+    Message sink for frame PDUs. Records are queued without blocking (frames
+    are counted as dropped if the queue is full) and written by a background
+    thread in batches of up to batch_size, at least every flush_interval s.
+    Any object with write_batch(records) and close() can stand in for the
+    file writer (see frame_store). With a latency tracker set, every written
+    batch is reported to it under the sink's name.
+    """
+    def __init__(self, path="-", fmt="jsonl", max_bytes=None, max_seconds=None,
+                 batch_size=256, flush_interval=0.5, queue_size=65536, writer=None):
+        gr.basic_block.__init__(self, name="packet_sink", in_sig=None, out_sig=None)
+        self.writer = writer or RotatingWriter(path, fmt, max_bytes, max_seconds)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.records = queue.Queue(maxsize=queue_size)
+        self.frames_received = 0
+        self.frames_written = 0
+        self.frames_dropped = 0
+        self.batches_failed = 0
+        self.tracker = None
+        self.sink_name = "packet_sink"
+        self._stopping = threading.Event()
+        self._thread = None
+
+        self.message_port_register_in(pmt.intern("in"))
+        self.set_msg_handler(pmt.intern("in"), self.handle_frame)
+
+    def handle_frame(self, msg):
+        self.frames_received += 1
+        try:
+            self.records.put_nowait(make_record(msg))
+        except queue.Full:
+            self.frames_dropped += 1
+
+    def start(self):
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="packet_sink-writer", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.writer.close()
+        return True
+
+    def _next_batch(self):
+        try:
+            batch = [self.records.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.records.get(timeout=max(0.0, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not (self._stopping.is_set() and self.records.empty()):
+            batch = self._next_batch()
+            if not batch:
+                continue
+            # Whatever goes wrong with one batch (disk, database, a record that
+            # does not encode), the writer thread carries on with the next
+            try:
+                self.writer.write_batch(batch)
+            except Exception as e:
+                self.frames_dropped += len(batch)
+                self.batches_failed += 1
+                print(f"[ERROR] {self.sink_name} could not write {len(batch)} frame(s): {type(e).__name__}: {e}",
+                      file=sys.stderr)
+                continue
+            self.frames_written += len(batch)
+            if self.tracker is not None:
+                self.tracker.written(batch, self.sink_name)
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#
+# SPDX-License-Identifier: GPL-3.0
+#
+# asyncio child process handling shared by Orchestrator (Docker containers)
+# and fleet (decoder workers). stdout and stderr of every child are read
+# concurrently on one event loop, so a quiet pipe never stalls the other and
+# a full pipe buffer can't deadlock the child; each line is handed to a
+# callback the moment it arrives. Any number of children can be run and
+# supervised (restarted with backoff) at once without a thread per pipe.
+
+import sys
+import time
+import signal
+import asyncio
+
+# A child that stayed up this long is considered healthy again, so its
+# restart backoff starts over.
+HEALTHY_RUNTIME_S = 60.0
+
+
+def prefixed_printer(name, stream=None):
+    """Line callback echoing to stream (default stderr) with a [name] prefix."""
+    def print_line(line):
+        print(f"[{name}] {line}", file=stream or sys.stderr, flush=True)
+    return print_line
+
+
+def echo(stream):
+    """Line callback echoing lines unchanged to stream."""
+    def print_line(line):
+        print(line, file=stream, flush=True)
+    return print_line
+
+
+async def _pump(stream, on_line):
+    async for line in stream:
+        on_line(line.decode("utf-8", "replace").rstrip("\r\n"))
+
+
+class StreamingProcess:
+    """A child process whose stdout/stderr lines are passed to callbacks as they arrive."""
+    def __init__(self, name, command, on_stdout=None, on_stderr=None, preexec_fn=None, env=None):
+        self.name = name
+        self.command = command
+        self.on_stdout = on_stdout or echo(sys.stdout)
+        self.on_stderr = on_stderr or echo(sys.stderr)
+        self.preexec_fn = preexec_fn
+        self.env = env
+        self.process = None
+        self.returncode = None
+        self.restarts = 0
+
+    async def run(self):
+        """Runs the command once and returns its exit code."""
+        self.process = await asyncio.create_subprocess_exec(
+            *self.command, stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+            preexec_fn=self.preexec_fn, env=self.env)
+        await asyncio.gather(_pump(self.process.stdout, self.on_stdout), _pump(self.process.stderr, self.on_stderr))
+        self.returncode = await self.process.wait()
+        return self.returncode
+
+    async def supervise(self, stopping, restart_delay=1.0, max_restart_delay=30.0):
+        """Runs the command until stopping is set, restarting it with exponential backoff whenever it exits."""
+        delay = restart_delay
+        while not stopping.is_set():
+            started = time.monotonic()
+            returncode = await self.run()
+            if stopping.is_set():
+                return
+            if time.monotonic() - started >= HEALTHY_RUNTIME_S:
+                delay = restart_delay
+            self.restarts += 1
+            print(f"[WARN] {self.name} exited with code {returncode}; restart #{self.restarts} "
+                  f"in {delay:.1f} s", file=sys.stderr)
+            try:
+                await asyncio.wait_for(stopping.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            delay = min(delay * 2, max_restart_delay)
+
+    def terminate(self):
+        if self.process is not None and self.process.returncode is None:
+            self.process.terminate()
+
+
+async def run_all(processes, restart=False, restart_delay=1.0, max_restart_delay=30.0):
+    """
+    Runs every process concurrently until all have exited (restart=False) or
+    until SIGINT/SIGTERM (restart=True, each one supervised). Returns the exit
+    codes in order.
+    """
+    stopping = asyncio.Event()
+
+    def request_stop():
+        print("[INFO] Stopping...", file=sys.stderr)
+        stopping.set()
+        for process in processes:
+            process.terminate()
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, request_stop)
+    try:
+        if restart:
+            await asyncio.gather(*(process.supervise(stopping, restart_delay, max_restart_delay)
+                                   for process in processes))
+        else:
+            await asyncio.gather(*(process.run() for process in processes))
+    finally:
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.remove_signal_handler(sig)
+    return [process.returncode for process in processes]
@@ -3,29 +3,75 @@ import sys
 import os
 import json
 import time
+_IMPORT_STARTED = time.monotonic()
+import importlib
+import functools
 
-# In Docker, we expect SoapySDR and gnuradio.soapy to be correctly installed
-# and discoverable via PYTHONPATH set in the Dockerfile.
-try:
-    import SoapySDR
-    from SoapySDR import *
-    print("[INFO] SoapySDR Python binding found in Docker environment for detection.")
-except ImportError:
-    print("[ERROR] SoapySDR Python binding not found in Docker environment. This is critical.", file=sys.stderr)
+from argparse import ArgumentParser
+
+from device_inventory import DEFAULT_TTL_S, SELECTION_POLICIES, DeviceInventory, select_device
+from startup_timing import StartupTimer, emit_phase
+
+# In Docker, we expect SoapySDR, gnuradio.soapy and gnuradio.lora_sdr to be
+# correctly installed and discoverable via PYTHONPATH set in the Dockerfile.
+# They are imported lazily, only by the paths that need them (a warm
+# detection served from the device inventory needs none), and every import
+# and availability probe is timed into PROFILE.
+PROFILE = StartupTimer()
+PROFILE.record("import sdr_manager", time.monotonic() - _IMPORT_STARTED)
+
+
+def load_module(name):
+    """Imports name on first use, timing the import for the profile report."""
+    if name in sys.modules:
+        return sys.modules[name]
+    with PROFILE.phase(f"import {name}"):
+        return importlib.import_module(name)
+
+
+@functools.lru_cache(maxsize=None)
+def module_status(name):
+    """(ok, detail) for whether name imports, checked in process once and cached."""
+    with PROFILE.phase(f"probe {name}"):
+        try:
+            module = load_module(name)
+        except ImportError as e:
+            return False, str(e)
+        return True, getattr(module, "__file__", None) or name
+
+
+@functools.lru_cache(maxsize=None)
+def soapysdr_status():
+    """(ok, detail) for the SoapySDR library and its driver modules, checked in process once."""
+    ok, detail = module_status("SoapySDR")
+    if not ok:
+        return ok, detail
+    with PROFILE.phase("probe SoapySDR library"):
+        SoapySDR = load_module("SoapySDR")
+        try:
+            version = SoapySDR.getLibVersion()
+            modules = list(SoapySDR.listModules()) if hasattr(SoapySDR, "listModules") else []
+        except Exception as e:
+            return False, f"SoapySDR library unusable: {e}"
+    if not version:
+        return False, "SoapySDR library version unavailable"
+    return True, f"Lib Version: v{version}, {len(modules)} driver module(s)"
+
+
+def require_soapysdr():
+    """Exits like the old module-level import did when the SoapySDR binding is missing."""
+    ok, detail = soapysdr_status()
+    if ok:
+        print(f"[INFO] SoapySDR Python binding found in Docker environment for detection ({detail}).")
+        return
+    print(f"[ERROR] SoapySDR Python binding not found in Docker environment. This is critical. ({detail})", file=sys.stderr)
     print("Please check your Dockerfile for SoapySDR Python binding installation/path setup.", file=sys.stderr)
     sys.exit(1) # Critical error, cannot proceed without SoapySDR
 
-try:
-    import gnuradio.soapy # Ensure gnuradio.soapy is also importable
-    print("[INFO] gnuradio.soapy module found in Docker environment.")
-except ImportError:
-    print("[ERROR] gnuradio.soapy module not found in Docker environment. This is critical.", file=sys.stderr)
-    print("Please check your Dockerfile for gnuradio and gr-soapy installation/path setup.", file=sys.stderr)
-    sys.exit(1) # Critical error, cannot proceed without gnuradio.soapy
-
 class SDRManager:
-    def __init__(self):
+    def __init__(self, inventory=None):
         # No more venv management or system-level installations in Docker
+        self.inventory = inventory or DeviceInventory()
         print("SDRManager initialized for Docker environment.")
 
     def _run_command(self, command, check_output=False, shell=False, env=None):
@@ -56,72 +102,70 @@ class SDRManager:
             return False
 
     def check_soapy_sdr_util(self):
-        """Checks if SoapySDRUtil is available and working within Docker."""
-        print("Checking if SoapySDRUtil is installed and working...")
-        try:
-            output = self._run_command(["SoapySDRUtil", "--info"], check_output=True)
-            if "Lib Version: v" in output and "Available factories" in output:
-                print("SoapySDRUtil is installed and working.")
-                return True
-            else:
-                print("SoapySDRUtil output is incomplete or unexpected. SoapySDR might not be fully configured.", file=sys.stderr)
-                return False
-        except Exception as e:
-            print(f"SoapySDRUtil command failed: {e}. SoapySDR might not be installed or in PATH within Docker.", file=sys.stderr)
-            return False
+        """Checks in process (cached) that the SoapySDR library and its modules load within Docker."""
+        print("Checking if SoapySDR is installed and working...")
+        ok, detail = soapysdr_status()
+        if ok:
+            print(f"SoapySDR is installed and working: {detail}.")
+        else:
+            print(f"SoapySDR check failed: {detail}. SoapySDR might not be installed or in PYTHONPATH within Docker.", file=sys.stderr)
+        return ok
+
+    def check_gr_soapy_import(self):
+        """Checks in process (cached) if gnuradio.soapy can be imported within Docker."""
+        print("Checking if gnuradio.soapy can be imported...")
+        ok, detail = module_status("gnuradio.soapy")
+        if ok:
+            print("gnuradio.soapy is importable.")
+        else:
+            print(f"gnuradio.soapy import failed: {detail}", file=sys.stderr)
+            print("Please check your Dockerfile for gnuradio and gr-soapy installation/path setup.", file=sys.stderr)
+        return ok
 
     def check_gr_lora_sdr_import(self):
-        """Checks if gr-lora_sdr can be imported within Docker."""
+        """Checks in process (cached) if gr-lora_sdr can be imported within Docker."""
         print("Checking if gr-lora_sdr can be imported...")
-        try:
-            check_script = "import gnuradio.lora_sdr; print('gr-lora_sdr import successful')"
-            output = self._run_command(["python3", "-c", check_script], check_output=True)
-            if "gr-lora_sdr import successful" in output:
-                print("gr-lora_sdr is importable.")
-                return True
-            else:
-                print("gr-lora_sdr import failed. See error above.", file=sys.stderr)
-                return False
-        except Exception as e:
-            print(f"Error checking gr-lora_sdr import: {e}", file=sys.stderr)
-            return False
+        ok, detail = module_status("gnuradio.lora_sdr")
+        if ok:
+            print("gr-lora_sdr is importable.")
+        else:
+            print(f"gr-lora_sdr import failed: {detail}", file=sys.stderr)
+        return ok
+
+    def enumerate_devices(self, drivers=None, refresh=False):
+        """
+        Lists the SDRs SoapySDR can see as dicts with index, label, driver_key,
+        serial, device_args (the string Generic_Decoder's --sdr-dev-string takes)
+        and probed capabilities. Served from the device inventory while it is
+        fresh; otherwise only the given drivers (or everything) are enumerated.
+        Raises whatever SoapySDR raises if enumeration itself fails.
+        """
+        devices = self.inventory.discover(drivers, refresh)
+        return [dict(device, index=i, driver_key=device["driver"]) for i, device in enumerate(devices)]
 
-    def detect_and_select_sdr(self):
+    def needs_discovery(self, drivers=None):
+        """Whether the next enumerate_devices call has to run a SoapySDR discovery."""
+        return not self.inventory.is_fresh(drivers)
+
+    def detect_and_select_sdr(self, serial=None, policy="preferred-driver", drivers=None, refresh=False):
         """
-        Detects connected SDRs using SoapySDR within Docker, prompts user for selection.
+        Detects connected SDRs (from the device inventory when fresh) and selects
+        one by serial, or by policy (see device_inventory.SELECTION_POLICIES).
         Returns the selected SDR's device string.
         """
         print("\n--- Detecting Connected SDR Devices via SoapySDR ---")
         
         try:
-            results = SoapySDR.Device.enumerate()
+            device_options = self.enumerate_devices(drivers, refresh)
 
-            if not results:
+            if not device_options:
                 print("No SDR devices found via SoapySDR. Please ensure your SDR is connected and powered on.", file=sys.stderr)
                 print("NO_SDR_DEVICES_FOUND") # <--- Signal to Orchestrator
                 return None
 
             print("Found the following SDR devices:")
-            device_options = []
-            for i, device_info in enumerate(results):
-                driver = device_info['driver'] if 'driver' in device_info else "N/A"
-                label = device_info['label'] if 'label' in device_info else f"Unknown SDR {i}"
-                serial = device_info['serial'] if 'serial' in device_info else ""
-                addr = device_info['addr'] if 'addr' in device_info else ""
-                
-                dev_args = f"driver={driver}"
-                if serial:
-                    dev_args += f",serial={serial}"
-                elif addr:
-                    dev_args += f",addr={addr}"
-                
-                device_options.append({
-                    "index": i,
-                    "label": label,
-                    "driver_key": driver,
-                    "device_args": dev_args
-                })
-                print(f"  [{i}] Label: {label}, Driver: {driver}, Device Args: '{dev_args}'")
+            for device in device_options:
+                print(f"  [{device['index']}] Label: {device['label']}, Driver: {device['driver_key']}, Device Args: '{device['device_args']}'")
 
         except Exception as e:
             # This catch-all is for the outer block where you call SoapySDR.Device.enumerate()
@@ -130,22 +174,11 @@ class SDRManager:
             print("NO_SDR_DEVICES_FOUND") # <--- Signal to Orchestrator
             return None
 
-        for selected_index in range(0, len(device_options)):
-            try:
-                user_input = 3
-                # This input() will only be reached if devices are found
-                selected_index = int(user_input)
-                if(device_options[selected_index]['driver_key'] == "rtlsdr") or (device_options[selected_index]['driver_key'] == "uhd"):
-                    user_input = selected_index 
-                selected_index += 1
-            except ValueError:
-                print("Invalid input. Please enter a number.")
-            except KeyboardInterrupt:
-                print("\nUser interrupted. Exiting.")
-                sys.exit(0)
-
-
-        chosen_device = device_options[user_input]
+        chosen_device = select_device(device_options, serial, policy)
+        if chosen_device is None:
+            print(f"No SDR with serial '{serial}' found.", file=sys.stderr)
+            print("NO_SDR_DEVICES_FOUND") # <--- Signal to Orchestrator
+            return None
         print(f"\nSelected SDR: '{chosen_device['label']}' (Driver: {chosen_device['driver_key']})")
         
         print(f"SoapySDR driver module for '{chosen_device['driver_key']}' is assumed to be installed in Docker container.")
@@ -153,48 +186,70 @@ class SDRManager:
         print(f"SELECTED_SDR_DEVICE:{chosen_device['device_args']}") # Ensure this is always printed on success
         return chosen_device['device_args']
 
-def ensure_avahi_daemon_running():
+DBUS_SOCKET = "/var/run/dbus/system_bus_socket"
+AVAHI_SOCKET = "/var/run/avahi-daemon/socket"
+
+
+def process_running(name):
+    return subprocess.run(["pgrep", name], stdout=subprocess.PIPE, stderr=subprocess.PIPE).returncode == 0
+
+
+def wait_until_ready(check, timeout=5.0, initial_delay=0.02, max_delay=0.5):
+    """
+    Polls check() with exponential backoff until it returns True or timeout
+    seconds have passed. Returns whether it became ready.
+    """
+    deadline = time.monotonic() + timeout
+    delay = initial_delay
+    while True:
+        if check():
+            return True
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, max_delay)
+
+
+def ensure_avahi_daemon_running(timer=None, timeout=5.0):
     """
     Checks if D-Bus and Avahi daemons are running and starts them if they're not.
     This function assumes avahi-daemon and dbus are already installed in the container.
+    Instead of fixed sleeps, each daemon is polled (process and socket) until it
+    is ready or timeout seconds have passed. Phase times go to timer if given.
     """
+    timer = timer or StartupTimer()
     print("Checking if D-Bus daemon is running...")
-    try:
-        subprocess.run(["pgrep", "dbus-daemon"], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        print("D-Bus daemon already running.")
-    except subprocess.CalledProcessError:
-        print("D-Bus daemon not found running. Attempting to start...")
-        # Create the run directory for D-Bus socket if it doesn't exist
-        os.makedirs("/var/run/dbus", exist_ok=True)
-        os.chmod("/var/run/dbus", 0o755) # Ensure correct permissions
-
-        # Start D-Bus daemon in the background
-        dbus_start_cmd = "/usr/bin/dbus-daemon --system --nopidfile --print-address &"
-        dbus_result = os.system(dbus_start_cmd)
-        if dbus_result != 0:
-            print(f"ERROR: Failed to start dbus-daemon (os.system exit code: {dbus_result}).", file=sys.stderr)
-            return False
-        print("D-Bus daemon command sent. Giving it a moment to initialize...")
-        time.sleep(1) # Give D-Bus a moment to create its socket
-        
-        # Optional: Verify D-Bus is actually running
-        try:
-            subprocess.run(["pgrep", "dbus-daemon"], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            print("D-Bus daemon successfully started.")
-        except subprocess.CalledProcessError:
-            print("WARNING: D-Bus daemon did not appear to start after delay.", file=sys.stderr)
-            # Proceed, but this might indicate a deeper issue or a very slow start
-            
+    with timer.phase("dbus"):
+        if process_running("dbus-daemon"):
+            print("D-Bus daemon already running.")
+        else:
+            print("D-Bus daemon not found running. Attempting to start...")
+            # Create the run directory for D-Bus socket if it doesn't exist
+            os.makedirs("/var/run/dbus", exist_ok=True)
+            os.chmod("/var/run/dbus", 0o755) # Ensure correct permissions
+
+            # Start D-Bus daemon in the background
+            dbus_start_cmd = "/usr/bin/dbus-daemon --system --nopidfile --print-address &"
+            dbus_result = os.system(dbus_start_cmd)
+            if dbus_result != 0:
+                print(f"ERROR: Failed to start dbus-daemon (os.system exit code: {dbus_result}).", file=sys.stderr)
+                return False
+            # Avahi needs the system bus socket, not just the process
+            if wait_until_ready(lambda: process_running("dbus-daemon") and os.path.exists(DBUS_SOCKET), timeout):
+                print("D-Bus daemon successfully started.")
+            else:
+                print(f"WARNING: D-Bus daemon was not ready after {timeout:.0f} s.", file=sys.stderr)
+                # Proceed, but this might indicate a deeper issue or a very slow start
 
     print("Checking if Avahi daemon is running...")
-    try:
+    with timer.phase("avahi"):
         # Check if avahi-daemon process is already running
-        subprocess.run(["pgrep", "avahi-daemon"], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        print("Avahi daemon is already running.")
-        return True
-    except subprocess.CalledProcessError:
+        if process_running("avahi-daemon"):
+            print("Avahi daemon is already running.")
+            return True
         print("Avahi daemon not found running. Attempting to start...")
-        
+
         # Start Avahi daemon in the background
         start_cmd = "/usr/sbin/avahi-daemon --no-drop-root &"
         result = os.system(start_cmd)
@@ -203,31 +258,63 @@ def ensure_avahi_daemon_running():
             print(f"ERROR: Failed to start avahi-daemon (os.system exit code: {result}).", file=sys.stderr)
             print("Ensure /usr/sbin/avahi-daemon exists and has execute permissions.", file=sys.stderr)
             return False
-        else:
-            print("Avahi daemon command sent. Giving it a moment to initialize...")
-            time.sleep(3) # Give Avahi a bit more time to get up and running
-            
-            # Optional: Verify it's actually running after sleep
-            try:
-                subprocess.run(["pgrep", "avahi-daemon"], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                print("Avahi daemon successfully started and verified.")
-                return True
-            except subprocess.CalledProcessError:
-                print("WARNING: Avahi daemon did not appear to start after delay.", file=sys.stderr)
-                return False
+        if wait_until_ready(lambda: process_running("avahi-daemon") and os.path.exists(AVAHI_SOCKET), timeout):
+            print("Avahi daemon successfully started and verified.")
+            return True
+        print(f"WARNING: Avahi daemon was not ready after {timeout:.0f} s.", file=sys.stderr)
+        return False
 
 # --- Command Line Argument Handling for Docker Entrypoint ---
+def profile_report(sdr_manager, drivers=None):
+    """Runs every probe and a detection lookup, then prints the import/probe time breakdown."""
+    sdr_manager.check_soapy_sdr_util()
+    sdr_manager.check_gr_soapy_import()
+    sdr_manager.check_gr_lora_sdr_import()
+    with PROFILE.phase("enumerate_devices (inventory fresh)" if not sdr_manager.needs_discovery(drivers)
+                       else "enumerate_devices (discovery)"):
+        try:
+            sdr_manager.enumerate_devices(drivers)
+        except Exception as e:
+            print(f"ERROR_SDR_DETECTION: {e}", file=sys.stderr)
+    # A second round shows what the in-process caches save
+    with PROFILE.phase("all probes again (cached)"):
+        sdr_manager.check_soapy_sdr_util()
+        sdr_manager.check_gr_soapy_import()
+        sdr_manager.check_gr_lora_sdr_import()
+    PROFILE.report("sdr_manager startup profile", file=sys.stdout)
+
 if __name__ == "__main__":
-    if not ensure_avahi_daemon_running():
-        print("Avahi daemon could not be started or verified. SDR discovery may fail.", file=sys.stderr)
-        # You might want to exit here if Avahi is absolutely critical
-        # sys.exit(1)
-    if len(sys.argv) > 1 and sys.argv[1] == "detect_sdr_only":
-        sdr_manager = SDRManager()
-        sdr_manager.detect_and_select_sdr()
-        # The detect_and_select_sdr method already prints the necessary output (SELECTED_SDR_DEVICE or NO_SDR_DEVICES_FOUND)
+    parser = ArgumentParser(description="SDR detection for the Orchestrator",
+                            epilog="Example: python3 sdr_manager.py detect_sdr_only --driver rtlsdr")
+    parser.add_argument("command", choices=["detect_sdr_only", "profile"],
+                        help="detect_sdr_only selects one SDR; profile reports import and probe times")
+    parser.add_argument("--serial", type=str, default=None, help="Select the SDR with this serial number")
+    parser.add_argument("--policy", choices=SELECTION_POLICIES, default="preferred-driver",
+                        help="How to pick an SDR when no serial is given (default: preferred-driver)")
+    parser.add_argument("--driver", action="append", default=None,
+                        help="Only enumerate this SoapySDR driver (e.g. rtlsdr); repeatable")
+    parser.add_argument("--refresh", action="store_true", help="Ignore the stored device inventory")
+    parser.add_argument("--inventory-ttl", type=float, default=DEFAULT_TTL_S,
+                        help=f"Seconds a stored device inventory stays valid (default: {DEFAULT_TTL_S:.0f})")
+    args = parser.parse_args()
+
+    sdr_manager = SDRManager(DeviceInventory(ttl=args.inventory_ttl))
+    if args.command == "profile":
+        profile_report(sdr_manager, args.driver)
         sys.exit(0)
-    else:
-        print("SDRManager script can be run with 'detect_sdr_only' argument for SDR detection.")
-        print("Example: python3 sdr_manager.py detect_sdr_only")
-        sys.exit(1) # Indicate an error if not called correctly
+
+    # Phase times are reported to the Orchestrator as STARTUP_PHASE lines
+    timer = StartupTimer(emit=True)
+    # SoapySDR and mDNS (Avahi) are only needed when devices are actually discovered
+    if args.refresh or sdr_manager.needs_discovery(args.driver):
+        require_soapysdr()
+        if not ensure_avahi_daemon_running(timer):
+            print("Avahi daemon could not be started or verified. SDR discovery may fail.", file=sys.stderr)
+            # You might want to exit here if Avahi is absolutely critical
+            # sys.exit(1)
+    with timer.phase("detection"):
+        sdr_manager.detect_and_select_sdr(args.serial, args.policy, args.driver, args.refresh)
+        # The detect_and_select_sdr method already prints the necessary output (SELECTED_SDR_DEVICE or NO_SDR_DEVICES_FOUND)
+    for name, seconds in PROFILE.phases:
+        emit_phase(name, seconds)
+    sys.exit(0)
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#
+# SPDX-License-Identifier: GPL-3.0
+#
+# SDR fault recovery inside a running Generic_Decoder. The watchdog polls the
+# Soapy source's sample counter; when it stops moving for stall_s seconds
+# (a USB glitch, a replugged dongle: gr-soapy logs read errors and timeouts
+# and delivers nothing) it
+#
+#   1. swaps a standby stream of zeros at the sample rate in for the source,
+#      releasing the device while lora_rx, the taggers and the sinks run on,
+#   2. looks the device up again by serial through SDRManager (a replugged
+#      dongle can come back under a new USB address) and reopens it with the
+#      decoder's current frequency, gain and wire format,
+#   3. swaps it back in and waits for samples, retrying with exponential
+#      backoff (backoff_initial doubling up to backoff_max) until it works.
+#
+# The recovery time (last sample before the stall to first sample after)
+# is logged and exported with the telemetry.
+#
+# Check: python3 source_watchdog.py --stall-after 3 --stall-for 4
+#        (runs the decoder on a fake source that stalls and resumes)
+# Tests: python3 -m pytest tests/test_source_watchdog.py
+
+import sys
+import json
+import time
+import threading
+import collections
+from argparse import ArgumentParser
+
+import numpy as np
+from gnuradio import gr
+
+from device_inventory import select_device
+
+
+def _kwargs(device_args):
+    """'driver=rtlsdr,serial=00000001' -> {'driver': 'rtlsdr', 'serial': '00000001'}"""
+    pairs = (item.split("=", 1) for item in device_args.split(",") if "=" in item)
+    return {key.strip(): value.strip() for key, value in pairs}
+
+
+def resolve_device_args(device_args, manager):
+    """Current device string of the SDR device_args named, found again by serial; unchanged without one."""
+    kwargs = _kwargs(device_args)
+    serial = kwargs.get("serial")
+    if not serial:
+        return device_args
+    drivers = [kwargs["driver"]] if kwargs.get("driver") else None
+    device = select_device(manager.enumerate_devices(drivers, refresh=True), serial)
+    if device is None:
+        raise OSError(f"SDR with serial '{serial}' is not connected")
+    return device["device_args"]
+
+
+def _nitems_written(block):
+    try:
+        return block.nitems_written(0)
+    except (AttributeError, RuntimeError):
+        return None
+
+
+class SourceWatchdog:
+    """Watches tb's SDR source from a background thread and reopens it when it stalls (see module comment)."""
+    def __init__(self, tb, stall_s=3.0, interval=0.1, backoff_initial=0.5, backoff_max=30.0, resolve=None):
+        self.tb = tb
+        self.stall_s = stall_s
+        self.interval = interval
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        # Callable turning the decoder's device string into the one to open
+        self.resolve = resolve or self._resolve_by_serial
+        self.manager = None
+
+        self.state = "up"  # up, down (standby, waiting to reopen) or verifying (reopened, no samples yet)
+        self.faults = 0
+        self.recoveries = 0
+        self.reopen_attempts = 0
+        self.reopen_failures = 0
+        self.last_recovery_s = None
+        self.recovery_times = collections.deque(maxlen=64)
+
+        self._last_count = None
+        self._last_progress = None
+        self._outage_started = None
+        self._next_attempt = None
+        self._backoff = backoff_initial
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def _resolve_by_serial(self, device_args):
+        if self.manager is None:
+            # Imported here: only a recovery needs SoapySDR enumeration
+            from sdr_manager import SDRManager
+            self.manager = SDRManager()
+        return resolve_device_args(device_args, self.manager)
+
+    def start(self):
+        self._last_count = None
+        self._last_progress = time.monotonic()
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="source-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            try:
+                self.check(time.monotonic())
+            except Exception as e:
+                print(f"[WARN] Source watchdog: {e}", file=sys.stderr)
+
+    def check(self, now):
+        """One watchdog step: note progress, or detect a stall, reopen, or confirm a reopened source."""
+        if self.state == "down":
+            if now >= self._next_attempt:
+                self._reopen(now)
+            return
+        count = _nitems_written(self.tb.soapy_custom_source_0)
+        if count is not None and count != self._last_count and (self.state == "up" or count > 0):
+            self._last_count, self._last_progress = count, now
+            if self.state == "verifying":
+                self._recovered(now)
+            return
+        if now - self._last_progress < self.stall_s:
+            return
+        # Released first: most drivers cannot open a device that is still held
+        self.tb.swap_sdr_source(None)
+        self.state = "down"
+        if self._outage_started is None:
+            self.faults += 1
+            self._outage_started = self._last_progress
+            self._backoff = self.backoff_initial
+            self._next_attempt = now
+            print(f"[WARN] SDR '{self.tb.sdr_dev_string}' delivered no samples for {now - self._last_progress:.1f} s; "
+                  f"reopening it", file=sys.stderr)
+        else:
+            self.reopen_failures += 1
+            print(f"[WARN] Reopened SDR delivered no samples; retrying in {self._backoff:.1f} s", file=sys.stderr)
+            self._retry_later(now)
+
+    def _retry_later(self, now):
+        self._next_attempt = now + self._backoff
+        self._backoff = min(self._backoff * 2, self.backoff_max)
+
+    def _reopen(self, now):
+        self.reopen_attempts += 1
+        try:
+            device_args = self.resolve(self.tb.sdr_dev_string)
+            source = self.tb.reopen_sdr_source(device_args)
+        except Exception as e:
+            self.reopen_failures += 1
+            print(f"[WARN] Could not reopen SDR '{self.tb.sdr_dev_string}': {e}; retrying in {self._backoff:.1f} s",
+                  file=sys.stderr)
+            self._retry_later(now)
+            return
+        self.tb.swap_sdr_source(source)
+        self.state = "verifying"
+        self._last_count, self._last_progress = None, now
+
+    def _recovered(self, now):
+        self.state = "up"
+        self.recoveries += 1
+        self.last_recovery_s = now - self._outage_started
+        self.recovery_times.append(self.last_recovery_s)
+        self._outage_started = None
+        print(f"[INFO] SDR '{self.tb.sdr_dev_string}' recovered after {self.last_recovery_s:.2f} s "
+              f"({self.reopen_attempts} reopen attempts so far)", file=sys.stderr)
+
+    def status(self):
+        return {
+            "state": self.state,
+            "faults": self.faults,
+            "recoveries": self.recoveries,
+            "reopen_attempts": self.reopen_attempts,
+            "reopen_failures": self.reopen_failures,
+            "last_recovery_s": None if self.last_recovery_s is None else round(self.last_recovery_s, 3),
+        }
+
+    def prometheus_lines(self):
+        lines = [
+            "# HELP lora_sdr_up Whether the SDR source is delivering samples (0 while it is being reopened).",
+            "# TYPE lora_sdr_up gauge",
+            f"lora_sdr_up {int(self.state == 'up')}",
+            "# HELP lora_sdr_faults_total SDR stalls detected by the source watchdog.",
+            "# TYPE lora_sdr_faults_total counter",
+            f"lora_sdr_faults_total {self.faults}",
+            "# TYPE lora_sdr_recoveries_total counter",
+            f"lora_sdr_recoveries_total {self.recoveries}",
+            "# TYPE lora_sdr_reopen_attempts_total counter",
+            f"lora_sdr_reopen_attempts_total {self.reopen_attempts}",
+            "# TYPE lora_sdr_reopen_failures_total counter",
+            f"lora_sdr_reopen_failures_total {self.reopen_failures}",
+        ]
+        if self.last_recovery_s is not None:
+            lines += ["# HELP lora_sdr_recovery_seconds Last sample before the stall to first sample after, "
+                      "for the last recovery.",
+                      "# TYPE lora_sdr_recovery_seconds gauge",
+                      f"lora_sdr_recovery_seconds {self.last_recovery_s:.3f}"]
+        return lines
+
+
+class stalling_source(gr.sync_block):
+    """
+    Fake SDR source for testing the watchdog: noise at samp_rate in real
+    time, stalling stall_after s after its first samples for stall_for s
+    (None: for good, like an unplugged dongle).
+    """
+    def __init__(self, samp_rate, stall_after=None, stall_for=None):
+        gr.sync_block.__init__(self, name="stalling_source", in_sig=None, out_sig=[np.complex64])
+        self.samp_rate = samp_rate
+        self.stall_after = stall_after
+        self.stall_for = stall_for
+        rng = np.random.default_rng()
+        self.noise = ((rng.standard_normal(65536) + 1j * rng.standard_normal(65536)) * 0.01).astype(np.complex64)
+        self.first = None  # the stall window counts from the first work call
+        self.started = None  # real-time pacing reference, moved on by stalls
+        self.produced = 0
+
+    def _stalled(self, elapsed):
+        if self.stall_after is None or elapsed < self.stall_after:
+            return False
+        return self.stall_for is None or elapsed < self.stall_after + self.stall_for
+
+    def work(self, input_items, output_items):
+        now = time.monotonic()
+        if self.first is None:
+            self.first = self.started = now
+        if self._stalled(now - self.first):
+            # The stalled stretch is lost, as with a real device: no catching up afterwards
+            time.sleep(0.01)
+            self.started += time.monotonic() - now
+            return 0
+        out = output_items[0]
+        n = min(len(out), len(self.noise), int((now - self.started) * self.samp_rate) - self.produced)
+        if n <= 0:
+            time.sleep(0.002)
+            return 0
+        out[:n] = self.noise[:n]
+        self.produced += n
+        return n
+
+    # The parts of the soapy.source interface Generic_Decoder uses
+    def set_frequency(self, channel, freq):
+        pass
+
+    def set_gain(self, channel, gain):
+        pass
+
+
+def main():
+    parser = ArgumentParser(description="Run the decoder on a fake SDR that stalls, and report the watchdog's recovery")
+    parser.add_argument("--sample-rate", type=float, default=250e3, help="Sample rate in Hz (default: 250e3)")
+    parser.add_argument("--stall-after", type=float, default=3.0, help="Seconds until the source stalls (default: 3)")
+    parser.add_argument("--stall-for", type=float, default=None,
+                        help="Seconds the source stalls, then resumes; omit to have it stay dead so that "
+                             "only a reopen brings samples back (default: stays dead)")
+    parser.add_argument("--fail-reopens", type=int, default=1,
+                        help="Reopen attempts that fail (device not back yet) before one succeeds (default: 1)")
+    parser.add_argument("--seconds", type=float, default=15.0, help="Total run time (default: 15)")
+    parser.add_argument("--stall-s", type=float, default=1.0, help="Watchdog stall threshold (default: 1)")
+    args = parser.parse_args()
+
+    from Generic_Decoder import Generic_Decoder
+
+    class stalling_decoder(Generic_Decoder):
+        reopens = 0
+
+        def _open_sdr_source(self):
+            self.stream_format = "cf32"
+            if self.soapy_custom_source_0 is None and self.standby_source_0 is None:
+                return stalling_source(self.samp_rate, args.stall_after, args.stall_for)
+            stalling_decoder.reopens += 1
+            if stalling_decoder.reopens <= args.fail_reopens:
+                raise OSError("fake SDR not connected yet")
+            return stalling_source(self.samp_rate)
+
+    tb = stalling_decoder(sdr_dev_string="driver=fake", samp_rate=args.sample_rate, output=None)
+    tb.source_watchdog = SourceWatchdog(tb, stall_s=args.stall_s, resolve=lambda device_args: device_args)
+    tb.start()
+    time.sleep(args.seconds)
+    samples = _nitems_written(tb.soapy_custom_source_0)
+    tb.stop()
+    tb.wait()
+    print(json.dumps(dict(tb.source_watchdog.status(), samples_from_current_source=samples)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#
+# SPDX-License-Identifier: GPL-3.0
+#
+# Startup time breakdown. Phases are timed with StartupTimer.phase(); a
+# process running inside the container reports its own phases as
+# STARTUP_PHASE:<name>:<seconds> lines on stdout, which the Orchestrator
+# folds into its breakdown (see parse_phase).
+
+import sys
+import json
+import time
+from contextlib import contextmanager
+
+PHASE_MARKER = "STARTUP_PHASE:"
+TIMING_MARKER = "STARTUP_TIMING:"
+
+
+def emit_phase(name, seconds):
+    """Reports a phase measured in a child process to the parent (stdout marker line)."""
+    print(f"{PHASE_MARKER}{name}:{seconds:.4f}", flush=True)
+
+
+def parse_phase(line):
+    """(name, seconds) for a STARTUP_PHASE line, else None."""
+    if not line.startswith(PHASE_MARKER):
+        return None
+    name, _, seconds = line[len(PHASE_MARKER):].rpartition(":")
+    try:
+        return name, float(seconds)
+    except ValueError:
+        return None
+
+
+class StartupTimer:
+    """Collects named phase durations; with emit=True each phase is also printed as a marker line."""
+    def __init__(self, emit=False):
+        self.started = time.monotonic()
+        self.phases = []
+        self.emit = emit
+
+    @contextmanager
+    def phase(self, name):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record(name, time.monotonic() - started)
+
+    def record(self, name, seconds):
+        self.phases.append((name, seconds))
+        if self.emit:
+            emit_phase(name, seconds)
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def as_dict(self):
+        return {"phases": [{"name": name, "seconds": round(seconds, 4)} for name, seconds in self.phases],
+                "total_s": round(self.elapsed(), 4)}
+
+    def report(self, title="Startup time", file=None):
+        """Prints the breakdown, followed by a STARTUP_TIMING:<json> line for scripts."""
+        file = file or sys.stderr
+        total = self.elapsed()
+        print(f"\n--- {title}: {total:.2f} s ---", file=file)
+        for name, seconds in self.phases:
+            share = seconds / total * 100 if total else 0.0
+            print(f"  {name:<32} {seconds:8.3f} s  {share:5.1f}%", file=file)
+        print(f"{TIMING_MARKER}{json.dumps(self.as_dict())}", file=file, flush=True)
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#
+# SPDX-License-Identifier: GPL-3.0
+#
+# SDR wire formats. The Soapy source can deliver the device's native compact
+# samples (cs8 from an RTL-SDR, cs16 from most 12-bit devices) instead of
+# cf32; converting once, right after the source and before the stream fans
+# out to the channelizer and the lora_rx branches, keeps the source buffer
+# (and any recording tapped from it) at 2 or 4 bytes per sample instead of
+# 8. The conversion is GNU Radio's VOLK-backed interleaved_*_to_complex.
+
+from gnuradio import blocks, gr
+
+# Format name (as in iq_file_source.FORMATS) -> (gr-soapy stream type, bytes per complex sample, full scale)
+STREAM_FORMATS = {
+    "cf32": ("fc32", gr.sizeof_gr_complex, None),
+    "cs16": ("sc16", 4, 32768.0),
+    "cs8": ("sc8", 2, 128.0),
+}
+# 'auto' picks the device's native format from the device inventory
+STREAM_FORMAT_CHOICES = ("auto",) + tuple(STREAM_FORMATS)
+
+
+def native_stream_format(device_args, inventory=None):
+    """
+    (format, full scale) the device streams natively, as probed into the
+    device inventory; ("cf32", None) if it is unknown or not a compact format.
+    """
+    from device_inventory import DeviceInventory
+
+    inventory = inventory or DeviceInventory()
+    capabilities = (inventory.entries.get(device_args) or {}).get("capabilities") or {}
+    fmt = capabilities.get("native_format")
+    if fmt in STREAM_FORMATS and fmt != "cf32":
+        return fmt, capabilities.get("full_scale") or STREAM_FORMATS[fmt][2]
+    return "cf32", None
+
+
+def make_converter(fmt, full_scale=None):
+    """Block turning fmt samples into gr_complex scaled to +-1, or None for cf32."""
+    if fmt not in STREAM_FORMATS:
+        raise ValueError(f"Unsupported stream format '{fmt}'. Choose one of: {', '.join(STREAM_FORMATS)}")
+    scale = full_scale or STREAM_FORMATS[fmt][2]
+    # vector_input: one input item is one interleaved I/Q pair
+    if fmt == "cs16":
+        return blocks.interleaved_short_to_complex(True, False, scale)
+    if fmt == "cs8":
+        return blocks.interleaved_char_to_complex(True, scale)
+    return None
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#
+# SPDX-License-Identifier: GPL-3.0
+#
+# Live telemetry for a running Generic_Decoder, served in Prometheus text
+# format from a small local HTTP endpoint (GET /metrics).
+#
+# A background thread samples the GNU Radio performance counters of every
+# block, the SDR sample count against wall-clock time (to spot overflows),
+# and the frame/sink counters once per interval and renders the page. HTTP
+# requests only ever read the last rendered page, so scraping never touches
+# the flowgraph.
+
+import sys
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from gnuradio import gr
+
+# Perf counters are read by the scheduler when the flowgraph starts; the
+# decoder sets this before starting when telemetry is enabled.
+PERF_COUNTERS_ENV = "GR_CONF_PERFCOUNTERS_ON"
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels.items()) + "}"
+
+
+def _call(block, method, *args):
+    """Reads one counter, or None if the block (e.g. a Python block) lacks it."""
+    try:
+        return getattr(block, method)(*args)
+    except (AttributeError, RuntimeError, TypeError, IndexError):
+        return None
+
+
+def discover_blocks(tb, depth=2):
+    """(name, block) for every block reachable from the top block's attributes, hier blocks expanded."""
+    found = []
+    seen = set()
+
+    def visit(prefix, owner, level):
+        for attr, value in sorted(vars(owner).items()):
+            # Duck-typed: Python blocks wrap a gateway rather than subclass gr.basic_block
+            if not callable(getattr(value, "to_basic_block", None)) or id(value) in seen:
+                continue
+            seen.add(id(value))
+            name = f"{prefix}{attr}"
+            if isinstance(value, gr.hier_block2):
+                if level < depth:
+                    visit(name + "/", value, level + 1)
+            else:
+                found.append((name, value))
+
+    visit("", tb, 0)
+    return found
+
+
+class FlowgraphTelemetry:
+    def __init__(self, tb, port=9464, host="127.0.0.1", interval=1.0):
+        self.tb = tb
+        self.port = port
+        self.host = host
+        self.interval = interval
+        self.tps = gr.high_res_timer_tps()
+        self.page = "# no samples yet\n"
+        self.extra_collectors = []  # callables returning extra metric lines
+        self._stopping = threading.Event()
+        self._sampler = None
+        self._server = None
+        self._server_thread = None
+
+        self._blocks = []
+        self._sdr_source = None
+        self._sdr_started = None
+        self._sdr_first_count = 0
+        self._sdr_lost = 0  # samples lost by the current source block
+        self._sdr_lock = threading.Lock()
+        self.samples_base = 0  # samples delivered by the SDR source blocks swapped out
+        self.samples = None  # delivered by all SDR source blocks so far; None before the first
+        self.samples_lost = 0
+        self.overflow_events = 0
+        self._previous_frames = {}
+        self._previous_time = None
+
+    def start(self):
+        self._stopping.clear()
+        self._sampler = threading.Thread(target=self._run, name="telemetry-sampler", daemon=True)
+        self._sampler.start()
+
+        telemetry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = telemetry.page.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            self._server = ThreadingHTTPServer((self.host, self.port), MetricsHandler)
+        except OSError as e:
+            print(f"[WARN] Telemetry endpoint could not listen on {self.host}:{self.port}: {e}", file=sys.stderr)
+            return
+        self._server_thread = threading.Thread(target=self._server.serve_forever, name="telemetry-http", daemon=True)
+        self._server_thread.start()
+        print(f"[INFO] Telemetry at http://{self.host}:{self.port}/metrics", file=sys.stderr)
+
+    def stop(self):
+        self._stopping.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._sampler is not None:
+            self._sampler.join()
+            self._sampler = None
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            try:
+                self.page = self.render()
+            except Exception as e:
+                print(f"[WARN] Telemetry sample failed: {e}", file=sys.stderr)
+
+    def render(self):
+        # Re-discovered every time: branches can be rebuilt while running
+        self._blocks = discover_blocks(self.tb)
+        lines = []
+        lines += self._block_metrics()
+        lines += self._sdr_metrics()
+        lines += self._frame_metrics()
+        lines += self._gate_metrics()
+        lines += self._recorder_metrics()
+        lines += self._latency_metrics()
+        lines += self._shed_metrics()
+        lines += self._watchdog_metrics()
+        for collector in self.extra_collectors:
+            lines += collector()
+        return "\n".join(lines) + "\n"
+
+    def _block_metrics(self):
+        work = ["# HELP lora_block_work_seconds_total Time spent in the block's work function.",
+                "# TYPE lora_block_work_seconds_total counter"]
+        produced = ["# HELP lora_block_items_produced_total Items written to the block's first output.",
+                    "# TYPE lora_block_items_produced_total counter"]
+        nproduced = ["# HELP lora_block_nproduced_avg Average items produced per work call.",
+                     "# TYPE lora_block_nproduced_avg gauge"]
+        fullness = ["# HELP lora_block_buffer_fullness Average buffer fullness (0-1) per port.",
+                    "# TYPE lora_block_buffer_fullness gauge"]
+        for name, block in self._blocks:
+            work_ticks = _call(block, "pc_work_time_total")
+            if work_ticks is not None:
+                work.append(f"lora_block_work_seconds_total{_labels(block=name)} {work_ticks / self.tps:.6f}")
+            items = _call(block, "nitems_written", 0)
+            if items is not None:
+                produced.append(f"lora_block_items_produced_total{_labels(block=name)} {items}")
+            average = _call(block, "pc_nproduced_avg")
+            if average is not None:
+                nproduced.append(f"lora_block_nproduced_avg{_labels(block=name)} {average:.2f}")
+            for direction, method in (("input", "pc_input_buffers_full_avg"), ("output", "pc_output_buffers_full_avg")):
+                for port, value in enumerate(_call(block, method) or []):
+                    fullness.append(f"lora_block_buffer_fullness{_labels(block=name, direction=direction, port=port)} "
+                                    f"{value:.4f}")
+        return work + produced + nproduced + fullness
+
+    def source_swapped(self, source, count):
+        """
+        Called by Generic_Decoder.swap_sdr_source (flowgraph locked) before
+        SDR source block source, which delivered count samples, is dropped.
+        Its samples and losses stay in the totals; the next block counts from 0.
+        """
+        with self._sdr_lock:
+            if source is self._sdr_source:
+                self._count_lost(count, time.monotonic())
+            self.samples_base += count
+            self.samples = self.samples_base
+            self._sdr_source, self._sdr_started, self._sdr_lost = None, None, 0
+
+    def _count_lost(self, count, now):
+        # A healthy source delivers samp_rate samples per second; anything
+        # missing beyond a buffer's worth of slack was dropped by the SDR.
+        slack = self.tb.samp_rate * 0.1
+        expected = (now - self._sdr_started) * self.tb.samp_rate
+        lost = max(0, int(expected - (count - self._sdr_first_count) - slack))
+        if lost > self._sdr_lost:
+            if lost - self._sdr_lost > slack:
+                self.overflow_events += 1
+            self.samples_lost += lost - self._sdr_lost
+            self._sdr_lost = lost
+
+    def _sdr_metrics(self):
+        with self._sdr_lock:
+            source = getattr(self.tb, "soapy_custom_source_0", None)
+            count = None if source is None else _call(source, "nitems_written", 0)
+            if count is not None:
+                now = time.monotonic()
+                if source is not self._sdr_source:
+                    # Reopened by the source watchdog: the new block counts from 0
+                    self._sdr_source, self._sdr_started, self._sdr_lost = source, None, 0
+                if self._sdr_started is None:
+                    self._sdr_started, self._sdr_first_count = now, count
+                self._count_lost(count, now)
+                self.samples = self.samples_base + count
+            if self.samples is None:
+                return []
+        # While the SDR is being reopened the totals stay at their last values
+        return [
+            "# HELP lora_sdr_samples_total Samples delivered by the SDR source (all reopened blocks together).",
+            "# TYPE lora_sdr_samples_total counter",
+            f"lora_sdr_samples_total {self.samples}",
+            "# HELP lora_sdr_samples_lost_total Samples missing against the nominal sample rate (overflows).",
+            "# TYPE lora_sdr_samples_lost_total counter",
+            f"lora_sdr_samples_lost_total {self.samples_lost}",
+            "# HELP lora_sdr_overflow_events_total Sampling intervals in which the SDR fell behind real time.",
+            "# TYPE lora_sdr_overflow_events_total counter",
+            f"lora_sdr_overflow_events_total {self.overflow_events}",
+        ]
+
+    def _gate_metrics(self):
+        gates = getattr(self.tb, "activity_gates", {})
+        if not gates:
+            return []
+        samples_in = ["# HELP lora_gate_samples_in_total Samples examined by the channel's activity gate.",
+                      "# TYPE lora_gate_samples_in_total counter"]
+        passed = ["# HELP lora_gate_samples_passed_total Samples the activity gate passed on to lora_rx.",
+                  "# TYPE lora_gate_samples_passed_total counter"]
+        openings = ["# HELP lora_gate_openings_total Times the activity gate opened.",
+                    "# TYPE lora_gate_openings_total counter"]
+        for channel, (_, gate) in sorted(gates.items()):
+            labels = _labels(channel=channel)
+            samples_in.append(f"lora_gate_samples_in_total{labels} {gate.samples_in}")
+            passed.append(f"lora_gate_samples_passed_total{labels} {gate.samples_passed}")
+            openings.append(f"lora_gate_openings_total{labels} {gate.openings}")
+        return samples_in + passed + openings
+
+    def _recorder_metrics(self):
+        recorder = getattr(self.tb, "iq_recorder_0", None)
+        if recorder is None:
+            return []
+        return [
+            "# HELP lora_recorder_samples_written_total Raw IQ samples written to disk.",
+            "# TYPE lora_recorder_samples_written_total counter",
+            f"lora_recorder_samples_written_total {recorder.samples_written}",
+            "# HELP lora_recorder_samples_dropped_total Raw IQ samples dropped because the disk fell behind.",
+            "# TYPE lora_recorder_samples_dropped_total counter",
+            f"lora_recorder_samples_dropped_total {recorder.samples_dropped}",
+            "# TYPE lora_recorder_bytes_written_total counter",
+            f"lora_recorder_bytes_written_total {recorder.bytes_written}",
+            "# TYPE lora_recorder_recordings_evicted_total counter",
+            f"lora_recorder_recordings_evicted_total {recorder.store.evicted}",
+            "# HELP lora_recorder_samples_paused_total Standby samples not recorded while the SDR was reopened.",
+            "# TYPE lora_recorder_samples_paused_total counter",
+            f"lora_recorder_samples_paused_total {recorder.samples_paused}",
+        ]
+
+    def _latency_metrics(self):
+        tracker = getattr(self.tb, "latency_tracker", None)
+        if tracker is None:
+            return []
+        return tracker.prometheus_lines()
+
+    def _shed_metrics(self):
+        shedder = getattr(self.tb, "load_shedder", None)
+        if shedder is None:
+            return []
+        return shedder.prometheus_lines()
+
+    def _watchdog_metrics(self):
+        watchdog = getattr(self.tb, "source_watchdog", None)
+        if watchdog is None:
+            return []
+        return watchdog.prometheus_lines()
+
+    def _frame_metrics(self):
+        now = time.monotonic()
+        elapsed = now - self._previous_time if self._previous_time else None
+        self._previous_time = now
+        decoded = ["# HELP lora_frames_decoded_total Frames decoded per RX branch.",
+                   "# TYPE lora_frames_decoded_total counter"]
+        failed = ["# HELP lora_frames_crc_failed_total Frames reported with a bad CRC per RX branch.",
+                  "# TYPE lora_frames_crc_failed_total counter"]
+        rate = ["# HELP lora_frames_per_second Frames decoded per second over the last interval.",
+                "# TYPE lora_frames_per_second gauge"]
+        for branch in self.tb.lora_rx_branches:
+            labels = _labels(branch=branch.index, sf=branch.sf, channel=branch.channel)
+            count = branch.tagger.frame_count
+            decoded.append(f"lora_frames_decoded_total{labels} {count}")
+            failed.append(f"lora_frames_crc_failed_total{labels} {branch.tagger.crc_failed_count}")
+            previous = self._previous_frames.get(branch.index)
+            if elapsed and previous is not None:
+                rate.append(f"lora_frames_per_second{labels} {(count - previous) / elapsed:.3f}")
+            self._previous_frames[branch.index] = count
+
+        lines = decoded + failed + rate
+        sink = getattr(self.tb, "packet_sink_0", None)
+        if sink is not None:
+            lines += [
+                "# TYPE lora_sink_frames_written_total counter",
+                f"lora_sink_frames_written_total {sink.frames_written}",
+                "# TYPE lora_sink_frames_dropped_total counter",
+                f"lora_sink_frames_dropped_total {sink.frames_dropped}",
+                "# HELP lora_sink_batches_failed_total Batches the sink could not write (frames counted as dropped).",
+                "# TYPE lora_sink_batches_failed_total counter",
+                f"lora_sink_batches_failed_total {sink.batches_failed}",
+                "# TYPE lora_sink_queue_depth gauge",
+                f"lora_sink_queue_depth {sink.records.qsize()}",
+            ]
+        store = getattr(self.tb, "frame_store_0", None)
+        if store is not None:
+            lines += [
+                "# TYPE lora_store_frames_stored_total counter",
+                f"lora_store_frames_stored_total {store.writer.frames_stored}",
+                "# TYPE lora_store_duplicates_total counter",
+                f"lora_store_duplicates_total {store.writer.duplicates}",
+                "# TYPE lora_store_frames_dropped_total counter",
+                f"lora_store_frames_dropped_total {store.frames_dropped}",
+                "# TYPE lora_store_batches_failed_total counter",
+                f"lora_store_batches_failed_total {store.batches_failed}",
+                "# TYPE lora_store_queue_depth gauge",
+                f"lora_store_queue_depth {store.records.qsize()}",
+            ]
+        publisher = getattr(self.tb, "frame_publisher_0", None)
+        if publisher is not None:
+            stats = publisher.stats()
+            lines.append("# TYPE lora_publish_sent_total counter")
+            lines += [f"lora_publish_sent_total{_labels(destination=uri)} {counts['sent']}"
+                      for uri, counts in stats.items()]
+            lines.append("# HELP lora_publish_dropped_total Frames lost to a full destination queue.")
+            lines.append("# TYPE lora_publish_dropped_total counter")
+            lines += [f"lora_publish_dropped_total{_labels(destination=uri)} {counts['dropped']}"
+                      for uri, counts in stats.items()]
+            lines.append("# HELP lora_publish_send_errors_total Frames the destination's transport failed to send.")
+            lines.append("# TYPE lora_publish_send_errors_total counter")
+            lines += [f"lora_publish_send_errors_total{_labels(destination=uri)} {counts['send_errors']}"
+                      for uri, counts in stats.items()]
+        return lines
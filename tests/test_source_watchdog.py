@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+
+#
+# SPDX-License-Identifier: GPL-3.0
+#
+# SourceWatchdog's stall -> reopen -> verify state machine. The first tests
+# drive check() with explicit times against a fake decoder; the last one
+# runs the decoder on source_watchdog.stalling_source (needs gr-lora_sdr
+# and gr-soapy, so it only runs in the image).
+#
+# Run: python3 -m pytest tests
+
+import time
+
+import pytest
+
+pytest.importorskip("gnuradio.gr")
+
+from source_watchdog import SourceWatchdog
+
+
+class FakeSource:
+    """Stands in for the Soapy source: just the item counter the watchdog polls."""
+    def __init__(self, count=0):
+        self.count = count
+
+    def nitems_written(self, port):
+        return self.count
+
+
+class FakeDecoder:
+    """The parts of Generic_Decoder the watchdog uses; reopen_sdr_source answers from reopen_results in turn."""
+    def __init__(self, reopen_results=()):
+        self.sdr_dev_string = "driver=fake"
+        self.soapy_custom_source_0 = FakeSource()
+        self.swaps = []
+        self.reopen_results = list(reopen_results)
+        self.reopened = 0
+
+    def swap_sdr_source(self, source):
+        self.swaps.append(source)
+        self.soapy_custom_source_0 = source
+
+    def reopen_sdr_source(self, device_args):
+        self.reopened += 1
+        result = self.reopen_results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+def make_watchdog(tb, **options):
+    options = dict(dict(stall_s=3.0, backoff_initial=0.5, backoff_max=2.0), **options)
+    return SourceWatchdog(tb, resolve=lambda device_args: device_args, **options)
+
+
+def run_healthy(watchdog, tb, start, end, step=0.1):
+    """Checks from start to end while the source delivers samples; returns the next time."""
+    now = start
+    while now < end:
+        tb.soapy_custom_source_0.count += 1000
+        watchdog.check(now)
+        now = round(now + step, 6)
+    return now
+
+
+def test_healthy_source_is_never_reopened():
+    tb = FakeDecoder()
+    watchdog = make_watchdog(tb)
+    run_healthy(watchdog, tb, 0.0, 60.0)
+    assert watchdog.state == "up"
+    assert tb.swaps == []
+    assert tb.reopened == 0
+    assert watchdog.status()["faults"] == 0
+
+
+def test_short_gap_is_not_a_stall():
+    tb = FakeDecoder()
+    watchdog = make_watchdog(tb)
+    run_healthy(watchdog, tb, 0.0, 5.0)
+    last_progress = 4.9
+    watchdog.check(last_progress + 2.9)  # no new samples, but under stall_s
+    assert watchdog.state == "up"
+    run_healthy(watchdog, tb, last_progress + 2.95, 15.0)
+    assert tb.swaps == [] and tb.reopened == 0
+
+
+def test_stall_reopen_and_recover():
+    reopened = FakeSource()
+    tb = FakeDecoder([OSError("not back yet"), OSError("not back yet"), reopened])
+    watchdog = make_watchdog(tb)
+    run_healthy(watchdog, tb, 0.0, 5.0)
+    last_progress = 4.9
+
+    # Stalled: up until stall_s has passed, then the standby stream goes in
+    watchdog.check(last_progress + 2.9)
+    assert watchdog.state == "up"
+    watchdog.check(last_progress + 3.0)
+    assert watchdog.state == "down"
+    assert tb.swaps == [None]
+    assert watchdog.faults == 1
+
+    # Reopen attempts back off: at once, then after 0.5 s, then after 1 s
+    now = last_progress + 3.0
+    watchdog.check(now)
+    assert (tb.reopened, watchdog.reopen_failures, watchdog.state) == (1, 1, "down")
+    watchdog.check(now + 0.4)
+    assert tb.reopened == 1
+    watchdog.check(now + 0.5)
+    assert (tb.reopened, watchdog.reopen_failures) == (2, 2)
+    watchdog.check(now + 1.4)
+    assert tb.reopened == 2
+    watchdog.check(now + 1.5)
+    assert tb.reopened == 3
+    assert watchdog.state == "verifying"
+    assert tb.swaps == [None, reopened]
+
+    # Reopened but not delivering yet: still verifying
+    watchdog.check(now + 1.6)
+    assert watchdog.state == "verifying"
+    reopened.count = 500
+    watchdog.check(now + 1.7)
+    assert watchdog.state == "up"
+    assert watchdog.recoveries == 1
+    assert watchdog.last_recovery_s == pytest.approx(now + 1.7 - last_progress)
+    assert watchdog.faults == 1
+
+    # Healthy again: no further reopens
+    run_healthy(watchdog, tb, now + 1.8, now + 30.0)
+    assert tb.reopened == 3 and len(tb.swaps) == 2
+
+
+def test_reopened_source_without_samples_is_retried_with_capped_backoff():
+    silent, working = FakeSource(), FakeSource()
+    tb = FakeDecoder([silent, OSError("gone"), OSError("gone"), OSError("gone"), working])
+    watchdog = make_watchdog(tb, stall_s=1.0)
+    now = run_healthy(watchdog, tb, 0.0, 2.0)
+
+    watchdog.check(now + 1.0)  # stall
+    watchdog.check(now + 1.0)  # first reopen: a source that never delivers
+    assert watchdog.state == "verifying"
+    watchdog.check(now + 1.9)
+    assert watchdog.state == "verifying"
+    watchdog.check(now + 2.0)  # stall_s without samples from it
+    assert watchdog.state == "down"
+    assert tb.swaps == [None, silent, None]
+    assert watchdog.faults == 1  # the same outage
+    assert watchdog.reopen_failures == 1
+
+    # Backoff doubles from 0.5 s and stays at backoff_max (2 s)
+    attempts = []
+    t = now + 2.0
+    while tb.reopened < 5:
+        t = round(t + 0.1, 6)
+        before = tb.reopened
+        watchdog.check(t)
+        if tb.reopened > before:
+            attempts.append(t)
+    gaps = [round(b - a, 6) for a, b in zip(attempts, attempts[1:])]
+    assert gaps == [1.0, 2.0, 2.0]
+    assert watchdog.state == "verifying"
+    working.count = 10
+    watchdog.check(t + 0.1)
+    assert watchdog.state == "up"
+    assert watchdog.recoveries == 1
+
+
+def test_decoder_recovers_from_stalling_source():
+    pytest.importorskip("gnuradio.lora_sdr")
+    pytest.importorskip("gnuradio.soapy")
+    from Generic_Decoder import Generic_Decoder
+    from source_watchdog import stalling_source
+
+    class stalling_decoder(Generic_Decoder):
+        reopens = 0
+
+        def _open_sdr_source(self):
+            self.stream_format = "cf32"
+            if self.soapy_custom_source_0 is None and self.standby_source_0 is None:
+                return stalling_source(self.samp_rate, stall_after=1.0, stall_for=None)
+            stalling_decoder.reopens += 1
+            if stalling_decoder.reopens == 1:
+                raise OSError("fake SDR not connected yet")
+            return stalling_source(self.samp_rate)
+
+    class recording_watchdog(SourceWatchdog):
+        def check(self, now):
+            SourceWatchdog.check(self, now)
+            if not self.states or self.states[-1] != self.state:
+                self.states.append(self.state)
+
+    tb = stalling_decoder(sdr_dev_string="driver=fake", samp_rate=250e3, output=None)
+    watchdog = recording_watchdog(tb, stall_s=0.5, backoff_initial=0.2, resolve=lambda device_args: device_args)
+    watchdog.states = []
+    tb.source_watchdog = watchdog
+    tb.start()
+    try:
+        time.sleep(0.8)
+        assert watchdog.state == "up" and stalling_decoder.reopens == 0
+        deadline = time.monotonic() + 10.0
+        while watchdog.recoveries == 0 and time.monotonic() < deadline:
+            time.sleep(0.05)
+    finally:
+        tb.stop()
+        tb.wait()
+    assert watchdog.recoveries == 1
+    assert watchdog.faults == 1
+    assert stalling_decoder.reopens == 2
+    assert watchdog.states == ["up", "down", "verifying", "up"]
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+#
+# SPDX-License-Identifier: GPL-3.0
+#
+# Scheduler and buffer tuning for Generic_Decoder. A profile sets:
+#   max_noutput_items - cap on items per work() call (small: lower latency,
+#                       large: fewer calls, more throughput)
+#   buffer_symbols    - output buffer (min and max) of the blocks between the
+#                       source and lora_rx, in symbols of the largest SF at
+#                       each block's rate; lora_rx needs a few symbols of
+#                       input per call, so it is never set below 4
+#   affinity          - "spread": source chain on the first usable core, the
+#                       lora_rx branches round-robin over the others
+# None leaves GNU Radio's default. Named profiles are below; autotune sweeps
+# the settings against a replayed recording and stores the best for this
+# host, which --tuning-profile auto then loads.
+#
+# Usage: python3 tuning.py autotune --input-file capture.sigmf-meta --spreading-factors 7,9
+#        python3 tuning.py show
+
+import os
+import sys
+import json
+import time
+import bisect
+import socket
+import resource
+import itertools
+import subprocess
+from argparse import ArgumentParser
+
+PROFILES = {
+    "default": {},
+    "low-latency": {"max_noutput_items": 1024, "buffer_symbols": 4, "affinity": "spread"},
+    "high-throughput": {"max_noutput_items": 65536, "buffer_symbols": 64, "affinity": "spread"},
+    "low-memory": {"max_noutput_items": 4096, "buffer_symbols": 4, "affinity": None},
+}
+SETTING_KEYS = ("max_noutput_items", "buffer_symbols", "affinity")
+MIN_BUFFER_SYMBOLS = 4
+AUTOTUNE_OBJECTIVES = ("throughput", "latency", "memory")
+
+DEFAULT_PATH = os.environ.get("LORA_TUNING_PROFILE",
+                              os.path.join(os.path.expanduser("~"), ".config", "lora_decode", "tuning.json"))
+
+
+def load_profile(name):
+    """Settings for a named profile, 'auto' (the autotune result) or a profile JSON file."""
+    if name in (None, ""):
+        return {}
+    if name in PROFILES:
+        return dict(PROFILES[name])
+    path = DEFAULT_PATH if name == "auto" else name
+    try:
+        with open(path) as profile_file:
+            stored = json.load(profile_file)
+    except (OSError, ValueError) as e:
+        if name == "auto":
+            print(f"[WARN] No usable autotune result at '{path}' ({e}); using GNU Radio defaults.", file=sys.stderr)
+            return {}
+        raise ValueError(f"Unknown tuning profile '{name}'. Choose one of: {', '.join(PROFILES)}, auto, "
+                         f"or a profile file") from e
+    return {key: stored.get("settings", {}).get(key) for key in SETTING_KEYS}
+
+
+def _call(block, method, *args):
+    # Python blocks and some hier blocks lack some of these setters
+    try:
+        getattr(block, method)(*args)
+        return True
+    except (AttributeError, RuntimeError, TypeError):
+        return False
+
+
+def front_end_blocks(tb):
+    """(block, sample rate) of every block between the source and the lora_rx branches."""
+    found = []
+    for attr in ("iq_file_source_0", "blocks_throttle_0", "soapy_custom_source_0", "stream_converter_0"):
+        block = getattr(tb, attr, None)
+        if block is not None:
+            found.append((block, tb.samp_rate))
+    channelizer = getattr(tb, "lora_channelizer_0", None)
+    if channelizer is not None:
+        found.append((channelizer.pfb_channelizer, channelizer.bin_rate))
+        found += [(stage, channelizer.channel_rate) for chain in channelizer.channel_chains for stage in chain]
+    for _, gate in getattr(tb, "activity_gates", {}).values():
+        found.append((gate, gate.detector.samp_rate))
+    return found
+
+
+def branch_blocks(branch):
+    """Blocks inside a branch's lora_rx hier block."""
+    return [child for child in vars(branch.rx).values() if callable(getattr(child, "to_basic_block", None))]
+
+
+def usable_cores():
+    return sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else []
+
+
+def tune_branch(tb, branch, settings):
+    """Applies the affinity part of settings to one lora_rx branch (also used after a rebuild)."""
+    if settings.get("affinity") != "spread":
+        return
+    cores = usable_cores()
+    if len(cores) < 2:
+        return
+    rx_cores = cores[1:]
+    core = rx_cores[branch.index % len(rx_cores)]
+    for block in branch_blocks(branch):
+        _call(block, "set_processor_affinity", [core])
+
+
+def tune_front_end(tb, block, rate, settings):
+    """Applies the buffer and affinity settings to one front-end block (also used for a reopened SDR source)."""
+    buffer_symbols = settings.get("buffer_symbols")
+    if buffer_symbols:
+        buffer_symbols = max(buffer_symbols, MIN_BUFFER_SYMBOLS)
+        items = int(buffer_symbols * (2 ** max(tb.lora_sfs)) * rate / tb.lora_bw)
+        _call(block, "set_min_output_buffer", items)
+        _call(block, "set_max_output_buffer", items)
+    if settings.get("affinity") == "spread":
+        cores = usable_cores()
+        if len(cores) >= 2:
+            _call(block, "set_processor_affinity", [cores[0]])
+
+
+def apply_profile(tb, settings):
+    """Applies buffer sizes and CPU affinity to a Generic_Decoder that has not been started yet."""
+    if settings.get("affinity") == "spread" and len(usable_cores()) < 2:
+        print("[WARN] Only one usable core; the 'spread' affinity is not applied.", file=sys.stderr)
+    for block, rate in front_end_blocks(tb):
+        tune_front_end(tb, block, rate, settings)
+    for branch in tb.lora_rx_branches:
+        tune_branch(tb, branch, settings)
+
+
+def describe(settings):
+    return ", ".join(f"{key}={settings.get(key)}" for key in SETTING_KEYS)
+
+
+# -- autotune -------------------------------------------------------------
+
+def candidates(quick=False):
+    """Named profiles, plus (unless quick) the full settings grid."""
+    seen, found = set(), []
+    grid = [] if quick else [dict(zip(SETTING_KEYS, values)) for values in itertools.product(
+        (None, 1024, 8192, 65536), (None, 4, 16, 64), (None, "spread"))]
+    for settings in [*PROFILES.values(), *grid]:
+        settings = {key: settings.get(key) for key in SETTING_KEYS}
+        key = tuple(settings.values())
+        if key not in seen:
+            seen.add(key)
+            found.append(settings)
+    return found
+
+
+def run_candidate(settings, input_file, samp_rate, spreading_factors, max_samples, throttle):
+    """Replays the workload with settings in this process and returns its measurements."""
+    from Generic_Decoder import Generic_Decoder
+    from frame_tagger import frame_collector
+
+    tb = Generic_Decoder(samp_rate=samp_rate, input_file=input_file, input_count=max_samples, throttle=throttle,
+                         spreading_factors=spreading_factors, output=None, tuning_profile=settings)
+    collector = frame_collector()
+    for branch in tb.lora_rx_branches:
+        tb.msg_connect((branch.tagger, 'out'), (collector, 'in'))
+    source = tb.iq_file_source_0
+    source.emit_times = []
+
+    cpu_start = time.process_time()
+    wall_start = time.monotonic()
+    tb.start()
+    tb.wait()
+    wall = time.monotonic() - wall_start
+    cpu = time.process_time() - cpu_start
+
+    # Latency: from the moment the frame's last sample left the source until
+    # the frame came out (see frame_tagger and _sample_clock).
+    emitted = [position for position, _ in source.emit_times]
+    latencies = []
+    for record in collector.records:
+        slot = bisect.bisect_left(emitted, record.get("sample_index", 0))
+        if slot < len(emitted):
+            latencies.append(record["rx_time"] - source.emit_times[slot][1])
+    latencies.sort()
+    return {
+        "frames": len(collector.records),
+        "wall_s": round(wall, 4),
+        "cpu_s": round(cpu, 4),
+        "samples_per_s": round(source.samples_produced / wall, 1) if wall else None,
+        "latency_ms_p99": round(latencies[int(0.99 * (len(latencies) - 1))] * 1e3, 3) if latencies else None,
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def run_isolated(settings, args):
+    """run_candidate in a fresh interpreter, so memory and affinity do not carry over between candidates."""
+    command = [sys.executable, __file__, "run-one", "--settings", json.dumps(settings),
+               "--input-file", args.input_file, "--spreading-factors", ",".join(map(str, args.spreading_factors))]
+    if args.sample_rate:
+        command += ["--sample-rate", str(args.sample_rate)]
+    if args.max_samples:
+        command += ["--max-samples", str(args.max_samples)]
+    if args.objective == "latency":
+        command.append("--throttle")
+    result = subprocess.run(command, stdout=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        return None
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def score(result, objective):
+    """Higher is better."""
+    if objective == "throughput":
+        return result["samples_per_s"] or 0.0
+    if objective == "latency":
+        return -(result["latency_ms_p99"] if result["latency_ms_p99"] is not None else float("inf"))
+    return -result["peak_rss_mb"]
+
+
+def autotune(args):
+    results = []
+    for settings in candidates(args.quick):
+        print(f"[INFO] Trying {describe(settings)}", file=sys.stderr)
+        result = run_isolated(settings, args)
+        if result is None:
+            print("[WARN] Candidate failed; skipped.", file=sys.stderr)
+            continue
+        print(f"[INFO]   {result}", file=sys.stderr)
+        results.append((settings, result))
+    if not results:
+        print("[ERROR] No candidate completed.", file=sys.stderr)
+        return 1
+    # A candidate must not decode fewer frames than the best one did
+    most_frames = max(result["frames"] for _, result in results)
+    eligible = [(settings, result) for settings, result in results if result["frames"] >= most_frames]
+    best_settings, best_result = max(eligible, key=lambda item: score(item[1], args.objective))
+    profile = {
+        "host": socket.gethostname(),
+        "cpu_count": os.cpu_count(),
+        "objective": args.objective,
+        "workload": {"input_file": args.input_file, "spreading_factors": args.spreading_factors},
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "settings": best_settings,
+        "measured": best_result,
+    }
+    directory = os.path.dirname(args.output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(args.output, "w") as profile_file:
+        json.dump(profile, profile_file, indent=2)
+    print(f"[INFO] Best for {args.objective}: {describe(best_settings)} -> {best_result}", file=sys.stderr)
+    print(f"[INFO] Written to {args.output}; use it with --tuning-profile auto", file=sys.stderr)
+    return 0
+
+
+def main():
+    from Generic_Decoder import sf_list
+
+    parser = ArgumentParser(description="Generic_Decoder tuning profiles and host autotuning")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("show", help="Print the named profiles and the stored autotune result")
+    for name in ("autotune", "run-one"):
+        command = commands.add_parser(name, help="Sweep settings against a recording" if name == "autotune" else None)
+        command.add_argument("--input-file", type=str, required=True, help="IQ recording to replay (raw or SigMF)")
+        command.add_argument("--sample-rate", type=float, default=None,
+                             help="Sample rate of a raw recording (SigMF recordings carry their own)")
+        command.add_argument("--spreading-factors", type=sf_list, default=[7], help="SFs to decode (default: 7)")
+        command.add_argument("--max-samples", type=int, default=None,
+                             help="Replay at most this many samples per candidate (default: all)")
+    autotune_parser = commands.choices["autotune"]
+    autotune_parser.add_argument("--objective", choices=AUTOTUNE_OBJECTIVES, default="throughput",
+                                 help="What to optimize; latency replays at real time (default: throughput)")
+    autotune_parser.add_argument("--quick", action="store_true", help="Only try the named profiles")
+    autotune_parser.add_argument("--output", type=str, default=DEFAULT_PATH,
+                                 help=f"Where to write the best profile (default: {DEFAULT_PATH})")
+    run_one = commands.choices["run-one"]
+    run_one.add_argument("--settings", type=json.loads, required=True)
+    run_one.add_argument("--throttle", action="store_true")
+    args = parser.parse_args()
+
+    if args.command == "show":
+        print(json.dumps(PROFILES, indent=2))
+        if os.path.exists(DEFAULT_PATH):
+            with open(DEFAULT_PATH) as profile_file:
+                print(f"auto ({DEFAULT_PATH}):\n{profile_file.read()}")
+        return 0
+    if args.sample_rate is None:
+        from iq_file_source import recording_sample_rate
+        args.sample_rate = recording_sample_rate(args.input_file)
+        if args.sample_rate is None:
+            parser.error("--sample-rate is required for raw recordings")
+    if args.command == "run-one":
+        print(json.dumps(run_candidate(args.settings, args.input_file, args.sample_rate, args.spreading_factors,
+                                       args.max_samples, args.throttle)))
+        return 0
+    return autotune(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())